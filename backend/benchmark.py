@@ -0,0 +1,454 @@
+"""Load and latency benchmark that drives ``server.app`` in-process.
+
+No network hop and no HTTP client: requests are handed straight to the ASGI
+app, so the numbers measure the server and its storage engine only. Point it
+at a local MongoDB (the database is dropped first unless ``--keep`` is given),
+or pick another engine with ``--storage``, and run from the backend directory::
+
+    python benchmark.py --history 100k --users 4 --concurrency 32 --duration 30 \\
+        --mix login=1,list=20,create=5,summary=10,stats=10,dashboard=10 --output bench.json
+    python benchmark.py --storage memory --history 100k
+    python benchmark.py --storage sqlite --sqlite-path /tmp/bench.db
+    python benchmark.py --serialization 10k   # response encoding only, no database
+    python benchmark.py --storage memory --history 1m --users 1 --mix trends=1,categories=1,anomalies=1
+
+The report is JSON: seeding throughput plus requests/sec, error count and
+p50/p95/p99 latency for every route in the mix, so runs from different
+releases can be diffed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import ENGINES
+
+DEFAULT_MIX = "login=1,list=20,create=5,summary=10,stats=10,dashboard=10"
+SEED_BATCH_SIZE = 10000
+PASSWORD = "bench-password"
+
+EXPENSE_CATEGORIES = ["Food", "Transportation", "Entertainment", "Shopping", "Bills", "Healthcare", "Education", "Other"]
+INCOME_CATEGORIES = ["Salary", "Freelance", "Business", "Investment", "Other"]
+# Descriptions draw from these, so search and autocomplete hit a realistic share of rows
+MERCHANTS = [
+    "Amazon", "Aldi", "Apple", "Costco", "Delta", "Dominos", "Etsy", "Exxon", "Hulu", "IKEA",
+    "Kroger", "Lyft", "Netflix", "Shell", "Spotify", "Starbucks", "Target", "Trader Joes", "Uber", "Walgreens",
+]
+
+
+def parse_count(value: str) -> int:
+    """Parse sizes such as ``1000``, ``100k`` or ``1m``."""
+    value = value.strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value[:-1] if multiplier > 1 else value) * multiplier)
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown operations: {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def asgi_request(
+    app,
+    method: str,
+    path: str,
+    query: str = "",
+    headers: Optional[Dict[str, str]] = None,
+    json_body: Any = None,
+) -> Tuple[int, bytes]:
+    """Send one HTTP request straight to an ASGI app and collect the response."""
+    body = json.dumps(json_body).encode() if json_body is not None else b""
+    raw_headers = [(b"host", b"benchmark")]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+    if body:
+        raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client never disconnects; wait until the app stops listening
+        await asyncio.Event().wait()
+
+    status = 0
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def random_transaction(rng: random.Random, start: datetime, days: int) -> Dict[str, Any]:
+    is_income = rng.random() < 0.15
+    categories = INCOME_CATEGORIES if is_income else EXPENSE_CATEGORIES
+    amount = round(rng.uniform(500, 5000) if is_income else rng.lognormvariate(3, 1), 2)
+    return {
+        "type": "income" if is_income else "expense",
+        "date": (start + timedelta(days=rng.randrange(days))).strftime("%Y-%m-%d"),
+        "description": f"{rng.choice(MERCHANTS)} {rng.randrange(100000)}",
+        "category": rng.choice(categories),
+        "amount": amount,
+    }
+
+
+class BenchUser:
+    def __init__(self, email: str, user_id: str, token: str):
+        self.email = email
+        self.user_id = user_id
+        self.token = token
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"authorization": f"Bearer {self.token}"}
+
+
+async def seed(server, users: int, history: int, seed_value: int) -> Tuple[List[BenchUser], Dict[str, Any]]:
+    """Register users through the API and bulk-insert their transaction history."""
+    import rollups
+
+    rng = random.Random(seed_value)
+    bench_users = []
+    for i in range(users):
+        email = f"bench{i}-{uuid.uuid4().hex[:8]}@example.com"
+        status, body = await asgi_request(
+            server.app, "POST", "/api/auth/register", json_body={"email": email, "password": PASSWORD}
+        )
+        if status != 200:
+            raise RuntimeError(f"register failed with {status}: {body[:200]!r}")
+        data = json.loads(body)
+        bench_users.append(BenchUser(email, data["user"]["id"], data["access_token"]))
+
+    started = time.perf_counter()
+    start_date = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    days = 10 * 365
+    for user in bench_users:
+        remaining = history
+        while remaining:
+            size = min(remaining, SEED_BATCH_SIZE)
+            created_at = datetime.now(timezone.utc)
+            batch = []
+            for _ in range(size):
+                trans = random_transaction(rng, start_date, days)
+                trans.update(
+                    id=str(uuid.uuid4()),
+                    user_id=user.user_id,
+                    created_at=created_at,
+                )
+                batch.append(trans)
+            await server.storage.insert_transactions(batch)
+            remaining -= size
+        # Direct inserts bypass the write routes, so rebuild the user's rollup
+        await rollups.rebuild(server.storage, user.user_id)
+    elapsed = time.perf_counter() - started
+
+    rows = users * history
+    return bench_users, {
+        "users": users,
+        "rows_per_user": history,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else None,
+    }
+
+
+async def op_login(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(
+        server.app, "POST", "/api/auth/login", json_body={"email": user.email, "password": PASSWORD}
+    )
+
+
+async def op_list(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/transactions", "limit=50", headers=user.headers)
+
+
+async def op_list_all(server, user: BenchUser, rng: random.Random):
+    # The legacy unpaginated list, up to 10,000 rows per response
+    return await asgi_request(server.app, "GET", "/api/transactions", headers=user.headers)
+
+
+async def op_search(server, user: BenchUser, rng: random.Random):
+    query = f"q={rng.choice(MERCHANTS).split()[0]}&limit=20"
+    return await asgi_request(server.app, "GET", "/api/transactions/search", query, headers=user.headers)
+
+
+async def op_suggest(server, user: BenchUser, rng: random.Random):
+    query = f"prefix={rng.choice(MERCHANTS)[:2]}"
+    return await asgi_request(server.app, "GET", "/api/transactions/suggest", query, headers=user.headers)
+
+
+async def op_create(server, user: BenchUser, rng: random.Random):
+    trans = random_transaction(rng, datetime(2024, 1, 1, tzinfo=timezone.utc), 365)
+    return await asgi_request(server.app, "POST", "/api/transactions", headers=user.headers, json_body=trans)
+
+
+async def op_summary(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/transactions/summary", headers=user.headers)
+
+
+async def op_stats(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/transactions/stats", headers=user.headers)
+
+
+async def op_dashboard(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/dashboard", "limit=50", headers=user.headers)
+
+
+async def op_timeseries(server, user: BenchUser, rng: random.Random):
+    query = rng.choice(["bucket=month", "bucket=week&from=2023-01-01&to=2024-12-31", "bucket=day&from=2024-01-01&to=2024-12-31"])
+    return await asgi_request(server.app, "GET", "/api/transactions/timeseries", query, headers=user.headers)
+
+
+async def op_trends(server, user: BenchUser, rng: random.Random):
+    query = f"period={rng.choice(['month', 'week'])}&window=3"
+    return await asgi_request(server.app, "GET", "/api/analytics/trends", query, headers=user.headers)
+
+
+async def op_categories(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/analytics/categories", headers=user.headers)
+
+
+async def op_anomalies(server, user: BenchUser, rng: random.Random):
+    return await asgi_request(server.app, "GET", "/api/analytics/anomalies", headers=user.headers)
+
+
+OPERATIONS = {
+    "login": op_login,
+    "list": op_list,
+    "list_all": op_list_all,
+    "search": op_search,
+    "suggest": op_suggest,
+    "create": op_create,
+    "summary": op_summary,
+    "stats": op_stats,
+    "dashboard": op_dashboard,
+    "timeseries": op_timeseries,
+    "trends": op_trends,
+    "categories": op_categories,
+    "anomalies": op_anomalies,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+async def run_workload(
+    server,
+    users: List[BenchUser],
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    seed_value: int,
+) -> Dict[str, Any]:
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        rng = random.Random(seed_value + index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            user = users[rng.randrange(len(users))]
+            started = time.perf_counter()
+            try:
+                status, _ = await OPERATIONS[name](server, user, rng)
+            except Exception:
+                status = 0
+            latencies[name].append(time.perf_counter() - started)
+            if status >= 400 or status == 0:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "seconds": round(elapsed, 3),
+        "routes": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+    }
+
+
+async def serialization_benchmark(server, rows: int, repeat: int, seed_value: int) -> Dict[str, Any]:
+    """Time encoding a ``rows``-long transaction list through FastAPI's
+    validate-and-encode path against the fast orjson path the list routes use."""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    import responses
+
+    rng = random.Random(seed_value)
+    start_date = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    created_at = datetime.now(timezone.utc)
+    transactions = [
+        {
+            "id": str(uuid.uuid4()), "user_id": "bench", **random_transaction(rng, start_date, 3650),
+            "currency": None, "created_at": created_at, "revision": 1,
+        }
+        for _ in range(rows)
+    ]
+    route = next(
+        route for route in server.app.routes
+        if getattr(route, "path", None) == "/api/transactions" and "GET" in route.methods
+    )
+
+    async def pydantic_path():
+        content = await serialize_response(field=route.response_field, response_content=transactions)
+        return JSONResponse(content).body
+
+    async def fast_path():
+        return responses.FastJSONResponse(transactions).body
+
+    report: Dict[str, Any] = {"rows": rows, "repeat": repeat}
+    for name, encode in (("pydantic", pydantic_path), ("fast", fast_path)):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = await encode()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        report[name] = {
+            "bytes": len(body),
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "min_ms": round(timings[0] * 1000, 3),
+        }
+    report["speedup"] = round(report["pydantic"]["p50_ms"] / report["fast"]["p50_ms"], 1) if report["fast"]["p50_ms"] else None
+    return report
+
+
+async def run(args: argparse.Namespace, server) -> Dict[str, Any]:
+    await server.app.router.startup()
+    try:
+        users, seed_report = await seed(server, args.users, args.history, args.seed)
+        workload = await run_workload(server, users, args.mix, args.concurrency, args.duration, args.seed)
+    finally:
+        await server.app.router.shutdown()
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "storage": args.storage,
+            "users": args.users,
+            "history": args.history,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "bcrypt_rounds": int(os.environ.get("BCRYPT_ROUNDS", 12)),
+        },
+        "seed": seed_report,
+        **workload,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the SpendWise API in-process")
+    parser.add_argument("--storage", choices=ENGINES, default="mongo", help="storage engine to benchmark")
+    parser.add_argument("--sqlite-path", help="database file for --storage sqlite (default: a fresh temp file)")
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="spendwise_bench")
+    parser.add_argument("--keep", action="store_true", help="do not drop the benchmark MongoDB database first")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--history", type=parse_count, default=parse_count("1k"), help="rows per user, e.g. 1k, 100k, 1m")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load after seeding")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS for this run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--serialization", type=parse_count, metavar="ROWS",
+        help="only compare response encoding paths for a list of ROWS transactions"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="encodings per path with --serialization")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    # The server reads its configuration at import time
+    os.environ["STORAGE_ENGINE"] = args.storage
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = args.sqlite_path or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    import server
+
+    async def _main():
+        if args.serialization:
+            return await serialization_benchmark(server, args.serialization, args.repeat, args.seed)
+        if args.storage == "mongo" and not args.keep:
+            await server.storage.client.drop_database(args.db_name)
+        return await run(args, server)
+
+    report = asyncio.run(_main())
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
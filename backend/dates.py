@@ -0,0 +1,77 @@
+"""Conversions between the API's ``YYYY-MM-DD`` date strings and stored BSON dates.
+
+Transaction ``date`` values are stored as midnight-UTC BSON dates and
+``created_at`` as full BSON datetimes, so MongoDB can sort, range-query
+and bucket them natively. The API keeps exposing ``date`` as a string;
+``DATE_STRING_EXPR`` renders it inside find projections and pipelines so
+read paths never convert row by row in Python.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, List, Optional
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Time series bucket sizes; weeks start on Monday
+BUCKETS = ("day", "week", "month")
+
+# Renders the stored date as YYYY-MM-DD; documents not yet migrated keep their string
+DATE_STRING_EXPR = {
+    "$cond": [
+        {"$eq": [{"$type": "$date"}, "date"]},
+        {"$dateToString": {"format": DATE_FORMAT, "date": "$date"}},
+        "$date",
+    ]
+}
+
+
+def parse_date(value: str) -> date:
+    """Parse an ISO date (or datetime) string, raising ``ValueError`` if it is not one."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value).date()
+
+
+def normalize_date(value: str) -> str:
+    return parse_date(value).isoformat()
+
+
+def to_bson_date(value: str) -> datetime:
+    """Midnight UTC on the given date, as stored in the ``date`` field."""
+    day = parse_date(value)
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def to_bson_datetime(value: Any) -> Optional[datetime]:
+    """Coerce a stored ``created_at`` (ISO string or datetime) to an aware datetime."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def bucket_start(value: date, bucket: str) -> date:
+    """First day of the bucket holding ``value``: itself, its week's Monday or its month's 1st."""
+    if bucket == "week":
+        return value - timedelta(days=value.weekday())
+    if bucket == "month":
+        return value.replace(day=1)
+    return value
+
+
+def bucket_starts(first: str, last: str, bucket: str, limit: Optional[int] = None) -> List[str]:
+    """Start of every bucket from the one holding ``first`` through the one holding ``last``.
+
+    With ``limit``, stops after ``limit + 1`` starts so callers can reject long ranges cheaply.
+    """
+    current = bucket_start(parse_date(first), bucket)
+    end = parse_date(last)
+    starts: List[str] = []
+    while current <= end and (limit is None or len(starts) <= limit):
+        starts.append(current.isoformat())
+        if bucket == "month":
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current += timedelta(days=7 if bucket == "week" else 1)
+    return starts
@@ -0,0 +1,159 @@
+"""Exchange rates for converting amounts into a user's base currency.
+
+Rates are read once, at startup, from a local CSV file (``FX_RATES_PATH``)
+with one published rate per row::
+
+    date,currency,rate
+    2024-01-02,EUR,0.9123
+
+``rate`` is units of ``currency`` per one unit of the quote currency
+(``FX_QUOTE_CURRENCY``), which itself always converts at 1. A date without
+a published rate (weekends, holidays) uses the latest rate before it;
+dates before a currency's first rate use that first rate.
+
+``RateTable`` keeps each currency's rates as sorted NumPy arrays indexed
+by day number, so looking up rates for many dates is one ``searchsorted``
+per currency. ``Converter`` fronts it for request handlers with an LRU of
+cross rates by ``(currency, target, date)``; every lookup takes a whole
+batch of pairs, so a page or an aggregate is converted in one call and no
+request ever reads the file.
+
+Stored transactions without a currency predate currencies and are in the
+deployment's default currency; they are keyed by ``""`` here.
+"""
+import csv
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from cache import TTLCache
+from money import quantize
+
+# Key of transactions stored without a currency
+UNSET = ""
+
+
+class MissingRatesError(Exception):
+    """Raised when a conversion needs a currency the rate table does not have."""
+
+    def __init__(self, currency: str):
+        super().__init__(f"No exchange rates loaded for {currency}")
+        self.currency = currency
+
+
+class RateTable:
+    """Published rates per currency against one quote currency, by day."""
+
+    def __init__(self, quote: str, series: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.quote = quote
+        # currency -> (day numbers ascending, rates)
+        self._series = series
+
+    @classmethod
+    def load(cls, path: str, quote: str) -> "RateTable":
+        rows: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                currency = record["currency"].strip().upper()
+                if currency != quote:
+                    rows[currency].append((record["date"].strip(), float(record["rate"])))
+        series = {}
+        for currency, points in rows.items():
+            days = np.asarray([date for date, _ in points], dtype="datetime64[D]").astype(np.int64)
+            order = np.argsort(days, kind="stable")
+            series[currency] = (days[order], np.asarray([rate for _, rate in points], dtype=np.float64)[order])
+        return cls(quote, series)
+
+    @property
+    def currencies(self) -> List[str]:
+        return sorted({self.quote, *self._series})
+
+    def supports(self, currency: str) -> bool:
+        return currency == self.quote or currency in self._series
+
+    def per_quote(self, currency: str, days: np.ndarray) -> np.ndarray:
+        """Units of ``currency`` per unit of the quote currency on each day number."""
+        if currency == self.quote:
+            return np.ones(len(days))
+        if currency not in self._series:
+            raise MissingRatesError(currency)
+        published, rates = self._series[currency]
+        index = np.searchsorted(published, days, side="right") - 1
+        return rates[np.maximum(index, 0)]
+
+    def cross(self, source: str, target: str, days: np.ndarray) -> np.ndarray:
+        """Units of ``target`` per unit of ``source`` on each day number."""
+        if source == target:
+            return np.ones(len(days))
+        return self.per_quote(target, days) / self.per_quote(source, days)
+
+    def convert(self, amounts: np.ndarray, currencies: np.ndarray, dates: np.ndarray, target: str) -> np.ndarray:
+        """Parallel arrays of amounts, currency codes and ``datetime64[D]`` dates, in ``target``.
+
+        One vectorised lookup per distinct currency; safe to call from worker threads.
+        """
+        result = np.asarray(amounts, dtype=np.float64).copy()
+        days = dates.astype(np.int64)
+        for currency in np.unique(currencies):
+            if currency == target:
+                continue
+            mask = currencies == currency
+            result[mask] *= self.cross(currency, target, days[mask])
+        return result
+
+
+class Converter:
+    """Cross rates for request handlers, batched and cached; not thread-safe."""
+
+    def __init__(self, table: RateTable, cache: TTLCache[float], default_currency: str):
+        self.table = table
+        self.cache = cache
+        self.default_currency = default_currency
+
+    def resolve(self, currency: str) -> str:
+        """The actual currency of a stored currency key (``UNSET`` is the default currency)."""
+        return currency or self.default_currency
+
+    def replace_table(self, table: RateTable) -> None:
+        self.table = table
+        self.cache.clear()
+
+    def rates(self, pairs: Iterable[Tuple[str, str]], target: str) -> Dict[Tuple[str, str], float]:
+        """Units of ``target`` per unit of each ``(currency key, YYYY-MM-DD)`` pair."""
+        result: Dict[Tuple[str, str], float] = {}
+        missing: Dict[str, List[str]] = defaultdict(list)
+        for currency, date in set(pairs):
+            source = self.resolve(currency)
+            if source == target:
+                result[currency, date] = 1.0
+                continue
+            rate = self.cache.get((source, target, date))
+            if rate is None:
+                missing[currency].append(date)
+            else:
+                result[currency, date] = rate
+        for currency, dates in missing.items():
+            source = self.resolve(currency)
+            days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+            for date, rate in zip(dates, self.table.cross(source, target, days).tolist()):
+                self.cache.put((source, target, date), rate)
+                result[currency, date] = rate
+        return result
+
+    def convert_rows(self, rows: List[Dict[str, Any]], target: str) -> List[Dict[str, Any]]:
+        """Set ``base_amount`` on transaction rows, in place, with one rate lookup for the batch."""
+        rates = self.rates(((row['currency'] or UNSET, row['date']) for row in rows), target)
+        for row in rows:
+            rate = rates[row['currency'] or UNSET, row['date']]
+            row['base_amount'] = row['amount'] if rate == 1.0 else quantize(row['amount'] * rate)
+        return rows
+
+    def convert_daily(self, groups: List[Dict[str, Any]], target: str) -> List[Dict[str, Any]]:
+        """Turn ``{date, currency, ...total_micros}`` groups' totals into ``target`` micros, in place."""
+        rates = self.rates(((group['currency'], group['date']) for group in groups), target)
+        for group in groups:
+            rate = rates[group['currency'], group['date']]
+            if rate != 1.0:
+                group['total_micros'] = round(group['total_micros'] * rate)
+        return groups
@@ -0,0 +1,147 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow, so running it inside an async handler stalls
+every other request on the event loop. ``PasswordHasher`` pushes the work
+to a thread or process pool and refuses new work with ``PoolSaturated``
+once too many calls are queued, so callers can shed load instead of
+piling up behind the pool.
+
+Configuration (environment):
+    BCRYPT_ROUNDS            work factor for new hashes (default 12)
+    BCRYPT_POOL_KIND         "thread" or "process" (default "thread")
+    BCRYPT_POOL_WORKERS      worker count (default: number of CPUs)
+    BCRYPT_POOL_MAX_PENDING  queued + running calls before rejecting (default 8 per worker)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+def bcrypt_rounds() -> int:
+    return int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    # Built on first use, after the server has loaded .env; process-pool
+    # workers inherit the environment and build an identical context.
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=bcrypt_rounds())
+
+
+class PoolSaturated(Exception):
+    """Raised when the hashing pool already has ``max_pending`` calls in flight."""
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float, float]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter() - started
+
+
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return get_pwd_context().verify(password, hashed)
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Read the work factor out of a ``$2b$<rounds>$...`` bcrypt hash."""
+    parts = hashed.split("$")
+    if len(parts) > 2 and parts[2].isdigit():
+        return int(parts[2])
+    return None
+
+
+class PasswordHasher:
+    def __init__(self, kind: str = "thread", max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 8
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.work_seconds_total = 0.0
+        self.verified_by_rounds: Dict[int, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        workers = os.environ.get('BCRYPT_POOL_WORKERS')
+        pending = os.environ.get('BCRYPT_POOL_MAX_PENDING')
+        return cls(
+            kind=os.environ.get('BCRYPT_POOL_KIND', 'thread'),
+            max_workers=int(workers) if workers else None,
+            max_pending=int(pending) if pending else None,
+        )
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _submit(self, fn: Callable, *args) -> Any:
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated(f"{self._pending} password hashing calls already pending")
+
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, work = await loop.run_in_executor(self.executor, _timed, fn, *args)
+        finally:
+            self._pending -= 1
+
+        # perf_counter is system-wide, so worker start times are comparable across processes
+        wait = max(started - submitted, 0.0)
+        self.completed += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.work_seconds_total += work
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        result = await self._submit(_verify, password, hashed)
+        rounds = hash_rounds(hashed)
+        if rounds is not None:
+            self.verified_by_rounds[rounds] = self.verified_by_rounds.get(rounds, 0) + 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rounds": bcrypt_rounds(),
+            "verified_by_rounds": {str(k): v for k, v in sorted(self.verified_by_rounds.items())},
+            "wait_seconds_avg": self.wait_seconds_total / self.completed if self.completed else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds": self.wait_seconds_total,
+            "work_seconds_avg": self.work_seconds_total / self.completed if self.completed else 0.0,
+            "work_seconds": self.work_seconds_total,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
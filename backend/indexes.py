@@ -0,0 +1,397 @@
+"""Index declarations and management for the users, transactions and recurring rules collections.
+
+The MongoDB storage engine calls ``ensure_indexes`` on startup. The same operations are
+available from the command line, run from the backend directory::
+
+    python indexes.py ensure    # create declared indexes (idempotent)
+    python indexes.py report    # compare existing indexes with the declarations
+    python indexes.py explain   # check every route query is served by an index
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from storage.base import CHANGE_LOG_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, Any], ...]
+    name: str
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+    # Stemming and stop words for text indexes
+    default_language: Optional[str] = None
+
+    def model(self) -> IndexModel:
+        options: Dict[str, Any] = {"name": self.name, "unique": self.unique}
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        if self.default_language is not None:
+            options["default_language"] = self.default_language
+        return IndexModel(list(self.keys), **options)
+
+    def stored_keys(self) -> List[Tuple[str, Any]]:
+        """Keys as ``index_information`` reports them; text fields are folded into ``_fts``/``_ftsx``."""
+        keys = [key for key in self.keys if key[1] != TEXT]
+        if len(keys) == len(self.keys):
+            return keys
+        # Non-text keys before the text fields stay prefixes, the rest become suffixes
+        text_at = next(i for i, key in enumerate(self.keys) if key[1] == TEXT)
+        prefix = [key for key in self.keys[:text_at] if key[1] != TEXT]
+        suffix = [key for key in self.keys[text_at:] if key[1] != TEXT]
+        return prefix + [("_fts", TEXT), ("_ftsx", 1)] + suffix
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", (("id", ASCENDING),), "users_id_unique", unique=True),
+    IndexSpec("users", (("email", ASCENDING),), "users_email_unique", unique=True),
+    IndexSpec("transactions", (("id", ASCENDING),), "transactions_id_unique", unique=True),
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)),
+        "transactions_user_date_id",
+    ),
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("type", ASCENDING), ("category", ASCENDING)),
+        "transactions_user_type_category",
+    ),
+    # Category filters without a type; several categories merge per-category date-ordered scans
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("category", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)),
+        "transactions_user_category_date_id",
+    ),
+    # Per-day totals of the currencies that need converting to a user's base currency
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("currency", ASCENDING), ("date", ASCENDING)),
+        "transactions_user_currency_date",
+    ),
+    # Leading with user_id makes every text search an equality-scoped index scan
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("description", TEXT)),
+        "transactions_user_description_text",
+        default_language="english",
+    ),
+    IndexSpec(
+        "transactions",
+        (("user_id", ASCENDING), ("description_key", ASCENDING), ("date", ASCENDING)),
+        "transactions_user_description_key",
+    ),
+    IndexSpec("rollups", (("user_id", ASCENDING),), "rollups_user_id_unique", unique=True),
+    IndexSpec("recurring_rules", (("id", ASCENDING),), "recurring_rules_id_unique", unique=True),
+    IndexSpec(
+        "recurring_rules",
+        (("user_id", ASCENDING), ("created_at", ASCENDING)),
+        "recurring_rules_user_created",
+    ),
+    # The scheduler's due scan across all users, earliest first
+    IndexSpec(
+        "recurring_rules",
+        (("next_date", ASCENDING), ("id", ASCENDING)),
+        "recurring_rules_next_date",
+    ),
+    IndexSpec(
+        "transaction_changes",
+        (("user_id", ASCENDING), ("seq", ASCENDING), ("transaction_id", ASCENDING)),
+        "transaction_changes_user_seq",
+        unique=True,
+    ),
+    IndexSpec(
+        "transaction_changes",
+        (("at", ASCENDING),),
+        "transaction_changes_ttl",
+        expire_after_seconds=CHANGE_LOG_RETENTION_SECONDS,
+    ),
+]
+
+
+@dataclass
+class QueryCheck:
+    """A query issued by a route, used to verify it is served by an index."""
+    route: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+
+SAMPLE_USER_ID = "00000000-0000-0000-0000-000000000000"
+SAMPLE_DATE = datetime(2024, 1, 15, tzinfo=timezone.utc)
+
+QUERY_CHECKS: List[QueryCheck] = [
+    QueryCheck("POST /auth/register, POST /auth/login", "users", {"email": "user@example.com"}),
+    QueryCheck("get_current_user", "users", {"id": SAMPLE_USER_ID}),
+    QueryCheck(
+        "GET /transactions",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID},
+        sort=[("date", DESCENDING), ("id", DESCENDING)],
+    ),
+    QueryCheck(
+        "GET /transactions?limit=&cursor=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "$or": [
+            {"date": {"$lt": SAMPLE_DATE}},
+            {"date": SAMPLE_DATE, "id": {"$lt": SAMPLE_USER_ID}},
+        ]},
+        sort=[("date", DESCENDING), ("id", DESCENDING)],
+    ),
+    QueryCheck(
+        "GET /transactions?type=&category=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "type": "expense", "category": "Food"},
+    ),
+    QueryCheck(
+        "GET /transactions?category=&category=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "category": {"$in": ["Food", "Travel"]}},
+        sort=[("date", DESCENDING), ("id", DESCENDING)],
+    ),
+    QueryCheck(
+        "GET /transactions?from=&to=&min_amount=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "date": {"$gte": SAMPLE_DATE, "$lte": SAMPLE_DATE}, "amount": {"$gte": 100}},
+        sort=[("date", DESCENDING), ("id", DESCENDING)],
+    ),
+    QueryCheck(
+        "PUT /transactions/{id}, DELETE /transactions/{id}",
+        "transactions",
+        {"id": SAMPLE_USER_ID, "user_id": SAMPLE_USER_ID},
+    ),
+    QueryCheck(
+        "GET /transactions/search",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "$text": {"$search": "uber ride"}},
+    ),
+    QueryCheck(
+        "GET /transactions/suggest",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "description_key": {"$regex": "^ub"}},
+        sort=[("description_key", ASCENDING), ("date", ASCENDING)],
+    ),
+    QueryCheck("GET /transactions/summary, GET /transactions/stats", "rollups", {"user_id": SAMPLE_USER_ID}),
+    QueryCheck(
+        "GET /transactions/timeseries?from=&to=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "date": {"$gte": SAMPLE_DATE, "$lte": SAMPLE_DATE}},
+        pipeline=[
+            {"$match": {"user_id": SAMPLE_USER_ID, "date": {"$gte": SAMPLE_DATE, "$lte": SAMPLE_DATE}}},
+            {"$group": {
+                "_id": {"start": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}, "type": "$type"},
+                "total_micros": {"$sum": "$amount_micros"},
+            }},
+        ],
+    ),
+    QueryCheck(
+        "GET /transactions/summary, /stats, /timeseries (foreign currencies)",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "currency": {"$in": ["EUR", "GBP"]}},
+        pipeline=[
+            {"$match": {"user_id": SAMPLE_USER_ID, "currency": {"$in": ["EUR", "GBP"]}}},
+            {"$group": {
+                "_id": {"date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}, "currency": "$currency"},
+                "total_micros": {"$sum": "$amount_micros"},
+            }},
+        ],
+    ),
+    QueryCheck("GET /analytics/* (ledger load)", "transactions", {"user_id": SAMPLE_USER_ID}),
+    QueryCheck(
+        "GET /transactions/changes",
+        "transaction_changes",
+        {"user_id": SAMPLE_USER_ID, "$or": [
+            {"seq": {"$gt": 1}},
+            {"seq": 1, "transaction_id": {"$gt": SAMPLE_USER_ID}},
+        ]},
+        sort=[("seq", ASCENDING), ("transaction_id", ASCENDING)],
+    ),
+    QueryCheck(
+        "rollup rebuild",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID},
+        pipeline=[
+            {"$match": {"user_id": SAMPLE_USER_ID}},
+            {"$group": {
+                "_id": {"type": "$type", "category": "$category"},
+                "total_micros": {"$sum": "$amount_micros"},
+            }},
+        ],
+    ),
+    QueryCheck(
+        "GET /transactions/summary?from=&to=, GET /transactions/stats?from=&to=",
+        "transactions",
+        {"user_id": SAMPLE_USER_ID, "date": {"$gte": SAMPLE_DATE, "$lte": SAMPLE_DATE}},
+        pipeline=[
+            {"$match": {"user_id": SAMPLE_USER_ID, "date": {"$gte": SAMPLE_DATE, "$lte": SAMPLE_DATE}}},
+            {"$group": {
+                "_id": {"type": "$type", "category": "$category"},
+                "total_micros": {"$sum": "$amount_micros"},
+            }},
+        ],
+    ),
+    QueryCheck(
+        "GET /recurring",
+        "recurring_rules",
+        {"user_id": SAMPLE_USER_ID},
+        sort=[("created_at", ASCENDING), ("id", ASCENDING)],
+    ),
+    QueryCheck(
+        "recurring scheduler (due rules)",
+        "recurring_rules",
+        {"next_date": {"$lte": "2024-01-15"}},
+        sort=[("next_date", ASCENDING), ("id", ASCENDING)],
+    ),
+]
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> List[Tuple[IndexSpec, str]]:
+    """Create every declared index. Safe to call repeatedly.
+
+    Each index is created on its own, so one that cannot be built does not
+    hold back the rest; returns ``(spec, error)`` for each that failed.
+    """
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEXES:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    failures = []
+    for collection, specs in by_collection.items():
+        ensured = []
+        for spec in specs:
+            try:
+                ensured.extend(await db[collection].create_indexes([spec.model()]))
+            except OperationFailure as e:
+                # Conflicting options or duplicate keys under a unique index; keep serving.
+                logger.error("Could not create index %s on %s: %s", spec.name, collection, e)
+                failures.append((spec, str(e)))
+        if ensured:
+            logger.info("Ensured indexes on %s: %s", collection, ", ".join(ensured))
+    return failures
+
+
+async def index_report(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """Compare the declared indexes with the ones that exist in the database."""
+    report = []
+    collections = sorted({spec.collection for spec in INDEXES})
+    for collection in collections:
+        existing = await db[collection].index_information()
+        declared = {spec.name: spec for spec in INDEXES if spec.collection == collection}
+
+        for name, spec in declared.items():
+            info = existing.get(name)
+            if info is None:
+                state = "missing"
+            elif (
+                [tuple(k) for k in info["key"]] != spec.stored_keys()
+                or bool(info.get("unique")) != spec.unique
+                or info.get("expireAfterSeconds") != spec.expire_after_seconds
+            ):
+                state = "mismatch"
+            else:
+                state = "ok"
+            report.append({"collection": collection, "name": name, "keys": list(spec.keys), "state": state})
+
+        for name, info in existing.items():
+            if name != "_id_" and name not in declared:
+                report.append({"collection": collection, "name": name, "keys": info["key"], "state": "undeclared"})
+    return report
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def _winning_plans(explain: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Collect winning plans from find and aggregate explain output."""
+    plans = []
+    if "queryPlanner" in explain:
+        plans.append(explain["queryPlanner"]["winningPlan"])
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            plans.append(stage["$cursor"]["queryPlanner"]["winningPlan"])
+    for shard in explain.get("shards", {}).values():
+        plans.extend(_winning_plans(shard))
+    return plans
+
+
+async def explain_checks(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """Explain each route query and record whether its winning plan scans an index."""
+    results = []
+    for check in QUERY_CHECKS:
+        if check.pipeline is not None:
+            explain = await db.command("aggregate", check.collection, pipeline=check.pipeline, explain=True)
+        else:
+            cursor = db[check.collection].find(check.filter)
+            if check.sort:
+                cursor = cursor.sort(check.sort)
+            explain = await cursor.explain()
+
+        stages = [stage for plan in _winning_plans(explain) for stage in _plan_stages(plan)]
+        uses_index = any(stage in ("IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "TEXT_MATCH") for stage in stages)
+        results.append({
+            "route": check.route,
+            "collection": check.collection,
+            "stages": stages,
+            "uses_index": uses_index and "COLLSCAN" not in stages,
+        })
+    return results
+
+
+async def _run(command: str) -> int:
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "ensure":
+            for spec, error in await ensure_indexes(db):
+                print(f"FAILED     {spec.collection}.{spec.name}: {error}")
+            command = "report"
+
+        if command == "report":
+            report = await index_report(db)
+            for row in report:
+                print(f"{row['state']:<10} {row['collection']}.{row['name']} {row['keys']}")
+            return 0 if all(row['state'] in ("ok", "undeclared") for row in report) else 1
+
+        results = await explain_checks(db)
+        for row in results:
+            verdict = "INDEX" if row['uses_index'] else "SCAN "
+            print(f"{verdict} {row['route']} -> {' > '.join(row['stages'])}")
+        return 0 if all(row['uses_index'] for row in results) else 1
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage SpendWise MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "report", "explain"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(_run(args.command))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Counters, gauges and histograms are plain Python objects keyed by label
+values, so recording one costs a dict lookup and, for histograms, a
+bisect. Updates take a per-metric lock because MongoDB command events
+arrive on the driver's worker threads. ``Registry.render`` produces the
+text format served at ``/metrics``; ``collector`` registers callbacks for
+values that already live elsewhere (pool and cache stats) and are read
+only when scraped.
+
+``MetricsMiddleware`` records per-route latency, status codes and
+in-flight requests. Routes are labelled by their template
+(``/api/transactions/{transaction_id}``), never the raw path, so label
+cardinality stays bounded.
+"""
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Request and query latencies, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _label_dict(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labels, values))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            yield self.name, self._label_dict(values), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def time(self, *label_values: str) -> "_Timer":
+        return _Timer(self, label_values)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(values, list(series[0]), series[1], series[2]) for values, series in self._series.items()]
+        for values, counts, total, count in items:
+            labels = self._label_dict(values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    """Context manager that observes the elapsed time of its block."""
+
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram: Histogram, label_values: Tuple[str, ...]):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+# A collector returns (name, type, help, samples) families, read at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, labels, buckets))
+
+    def collector(self, collect: Collector) -> Collector:
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def family(name: str, type: str, help: str, samples: Iterable[Sample]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        for metric in self._metrics.values():
+            family(metric.name, metric.type, metric.help, metric.samples())
+        for collect in self._collectors:
+            for name, type, help, samples in collect():
+                family(
+                    self.prefix + name, type, help,
+                    ((self.prefix + sample_name, labels, value) for sample_name, labels, value in samples)
+                )
+        return "\n".join(lines) + "\n"
+
+
+class HTTPMetrics:
+    def __init__(self, registry: Registry):
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by route template, method and status", ("method", "route", "status")
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+        )
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served", ("method",))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so it adds no per-request task or body buffering."""
+
+    def __init__(self, app, metrics: HTTPMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.in_flight.dec(method)
+            # The router stores the matched route in the scope it shares with us
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.requests.inc(method, route, str(status))
+            self.metrics.latency.observe(elapsed, method, route)
+
+
+def stats_collector(
+    name: str,
+    help: str,
+    stats: Callable[[], Dict[str, Any]],
+    counters: Sequence[str] = (),
+    gauges: Sequence[str] = (),
+) -> Collector:
+    """Expose selected numeric fields of a ``stats()`` dict as ``<name>_<field>`` metrics."""
+    def collect():
+        values = stats()
+        for field in counters:
+            yield f"{name}_{field}_total", "counter", f"{help}: {field}", [(f"{name}_{field}_total", {}, values[field])]
+        for field in gauges:
+            yield f"{name}_{field}", "gauge", f"{help}: {field}", [(f"{name}_{field}", {}, values[field])]
+    return collect
@@ -0,0 +1,170 @@
+"""One-shot data migrations, run from the backend directory::
+
+    python migrations.py dates [--batch-size 1000]
+    python migrations.py description-keys [--batch-size 1000]
+    python migrations.py amount-micros [--batch-size 1000]
+
+``dates`` converts transaction ``date``/``created_at`` and user
+``created_at`` values stored as strings into native BSON dates. It only
+selects documents that still hold strings, so it can be interrupted and
+re-run at any point and picks up where it stopped.
+
+``description-keys`` adds the lowercased ``description_key`` that
+description autocomplete searches to transactions written before it
+existed. It is resumable in the same way.
+
+``amount-micros`` stores the exact integer ``amount_micros`` (see
+money.py) on transactions written before it existed. Aggregations derive
+it for such documents on the fly, so the migration only takes that work
+off the hot path; it is resumable in the same way.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo import ASCENDING, UpdateOne
+
+from dates import to_bson_date, to_bson_datetime
+from money import to_micros
+from storage.base import search_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Progress:
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.converted = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    def report(self) -> None:
+        done = self.converted + self.skipped
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        percent = done / self.total * 100 if self.total else 100.0
+        logger.info(
+            "%s: %d/%d (%.1f%%) converted=%d skipped=%d %.0f docs/s",
+            self.name, done, self.total, percent, self.converted, self.skipped, rate,
+        )
+
+
+async def migrate_collection(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    convert: Callable[[Dict[str, Any]], Dict[str, Any]],
+    batch_size: int,
+) -> Progress:
+    """Rewrite every document matching ``query`` with the fields returned by ``convert``.
+
+    ``convert`` raises ``ValueError`` for documents it cannot convert; those are
+    logged and skipped. Batches walk ``_id`` upwards so skipped documents are not
+    revisited within a run.
+    """
+    progress = Progress(collection.name, await collection.count_documents(query))
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = await collection.find(batch_query).sort("_id", ASCENDING).limit(batch_size).to_list(None)
+        if not batch:
+            break
+
+        updates: List[UpdateOne] = []
+        for doc in batch:
+            try:
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": convert(doc)}))
+            except ValueError as e:
+                progress.skipped += 1
+                logger.warning("%s %s: cannot convert (%s)", collection.name, doc.get("id", doc["_id"]), e)
+        if updates:
+            result = await collection.bulk_write(updates, ordered=False)
+            progress.converted += result.modified_count
+
+        last_id = batch[-1]["_id"]
+        progress.report()
+    return progress
+
+
+def _convert_transaction(doc: Dict[str, Any]) -> Dict[str, Any]:
+    fields = {}
+    if isinstance(doc.get("date"), str):
+        fields["date"] = to_bson_date(doc["date"])
+    if isinstance(doc.get("created_at"), str):
+        fields["created_at"] = to_bson_datetime(doc["created_at"])
+    return fields
+
+
+def _convert_user(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {"created_at": to_bson_datetime(doc["created_at"])}
+
+
+async def migrate_dates(db, batch_size: int) -> None:
+    string = {"$type": "string"}
+    await migrate_collection(
+        db.transactions,
+        {"$or": [{"date": string}, {"created_at": string}]},
+        _convert_transaction,
+        batch_size,
+    )
+    await migrate_collection(db.users, {"created_at": string}, _convert_user, batch_size)
+
+
+async def migrate_description_keys(db, batch_size: int) -> None:
+    await migrate_collection(
+        db.transactions,
+        {"description_key": {"$exists": False}},
+        lambda doc: {"description_key": search_key(doc["description"])},
+        batch_size,
+    )
+
+
+def _convert_amount(doc: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(doc.get("amount"), (int, float)):
+        raise ValueError(f"amount {doc.get('amount')!r} is not a number")
+    return {"amount_micros": to_micros(doc["amount"])}
+
+
+async def migrate_amount_micros(db, batch_size: int) -> None:
+    await migrate_collection(db.transactions, {"amount_micros": {"$exists": False}}, _convert_amount, batch_size)
+
+
+MIGRATIONS = {
+    "amount-micros": migrate_amount_micros,
+    "dates": migrate_dates,
+    "description-keys": migrate_description_keys,
+}
+
+
+async def _run(name: str, batch_size: int) -> None:
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        await MIGRATIONS[name](client[os.environ['DB_NAME']], batch_size)
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a SpendWise data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_run(args.migration, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Exact money arithmetic on integer micro-units.
+
+The API speaks decimal amounts such as ``12.34``, which binary floats
+cannot hold exactly, so sums of many floats drift by fractions of a cent.
+Every engine therefore also stores each amount as an integer count of
+millionths (``amount_micros``) and computes totals by summing those
+integers; floats only appear again when a total is rendered.
+
+The scale is fixed rather than per currency: it covers the minor units of
+every ISO 4217 currency (at most four decimals), and an amount-only update
+never has to read the row's currency to re-scale it.
+"""
+from typing import Any, Dict
+
+MICROS = 1_000_000
+
+# Largest amount the API accepts; well inside the signed 64-bit range that
+# ``amount_micros`` is stored in (about 9.2e12), leaving headroom for sums
+MAX_AMOUNT = 10 ** 12
+
+# ``amount_micros`` is a SQLite INTEGER / BSON int64
+_MICROS_RANGE = 2 ** 63
+
+
+def to_micros(amount: float) -> int:
+    """The amount as a whole number of millionths, rounded to the nearest.
+
+    Raises ``ValueError`` if that does not fit in a signed 64-bit integer.
+    """
+    scaled = amount * MICROS
+    if not -_MICROS_RANGE <= scaled < _MICROS_RANGE:
+        raise ValueError(f"Amount {amount} is outside the storable range")
+    return int(round(scaled))
+
+
+def from_micros(micros: int) -> float:
+    """The float nearest the exact decimal ``micros / 10**6``."""
+    return micros / MICROS
+
+
+def quantize(amount: float) -> float:
+    """Round an amount to the nearest millionth, so ``to_micros`` of it is exact."""
+    return from_micros(round(amount * MICROS))
+
+
+def with_micros(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of ``fields`` plus ``amount_micros`` when they set an amount, for storage."""
+    stored = dict(fields)
+    if stored.get("amount") is not None:
+        stored["amount_micros"] = to_micros(stored["amount"])
+    return stored
@@ -0,0 +1,235 @@
+"""Recurring transaction rules and the background scheduler that materialises them.
+
+A rule repeats a transaction template every ``every`` days, weeks or
+months from ``start_date``, optionally until ``end_date``. Occurrence
+``n`` falls ``n * every`` units after the start; monthly rules keep their
+start day, clamped to shorter months, so a rule from January 31st falls
+on February 29th and then March 31st. Each rule stores how many
+``occurrences`` it has materialised and the ``next_date`` still to come
+(None once it is past ``end_date``).
+
+``Scheduler`` wakes every ``interval`` seconds and materialises every
+occurrence due by today (UTC) across all users: it reads due rules
+earliest first, ``batch_size`` at a time, writes their transactions with
+one ``insert_transactions`` call per batch, applies rollup deltas and
+logs the changes per user, then advances the rules. A rule far behind
+catches up at most ``MAX_CATCH_UP`` occurrences per batch.
+
+An occurrence's transaction id is derived from its rule and date, so it
+doubles as an idempotency key: if the process stops between writing the
+transactions and advancing the rules, the next run's insert of the same
+occurrences fails on the id and they are not duplicated. Whether the
+stopped run got as far as applying rollup deltas is unknown, so the next
+run rebuilds those users' rollups from their transactions instead, and
+logs every occurrence as changed again (a repeated change is harmless to
+sync clients).
+Advances only apply while a rule's ``next_date`` is still the one that
+was read, so several server processes can each run a scheduler.
+
+Configuration (environment):
+    RECURRING_INTERVAL_SECONDS  seconds between runs (default 60)
+    RECURRING_BATCH_SIZE        due rules read and written per batch (default 1000)
+"""
+import asyncio
+import calendar
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import rollups
+from dates import parse_date
+from storage import RuleAdvance, Storage
+
+logger = logging.getLogger(__name__)
+
+UNITS = ("day", "week", "month")
+
+# Occurrences one rule may materialise per batch; more wait for the next batch
+MAX_CATCH_UP = 366
+
+# Transaction fields copied from the rule to each occurrence
+TEMPLATE_FIELDS = ("user_id", "type", "description", "category", "amount", "currency")
+
+_OCCURRENCE_NAMESPACE = uuid.UUID("ce8c4793-3b07-4945-b14a-d451b56e4420")
+
+
+def _add_months(start: date, months: int) -> date:
+    month = start.month - 1 + months
+    year = start.year + month // 12
+    month = month % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_date(rule: Dict[str, Any], index: int) -> date:
+    """Date of the rule's ``index``-th occurrence, counting from 0 at ``start_date``."""
+    start = parse_date(rule['start_date'])
+    steps = index * rule['every']
+    if rule['unit'] == "month":
+        return _add_months(start, steps)
+    return start + timedelta(days=steps * 7 if rule['unit'] == "week" else steps)
+
+
+def next_date(rule: Dict[str, Any]) -> Optional[str]:
+    """The first occurrence not yet materialised, or None if it is past ``end_date``."""
+    when = occurrence_date(rule, rule['occurrences'])
+    if rule.get('end_date') and when > parse_date(rule['end_date']):
+        return None
+    return when.isoformat()
+
+
+def occurrence_id(rule_id: str, when: date) -> str:
+    return str(uuid.uuid5(_OCCURRENCE_NAMESPACE, f"{rule_id}/{when.isoformat()}"))
+
+
+def due_occurrences(rule: Dict[str, Any], today: date, limit: int) -> Tuple[List[date], Optional[str], int]:
+    """Up to ``limit`` occurrence dates due by ``today``, with the rule's new ``next_date`` and count."""
+    end = parse_date(rule['end_date']) if rule.get('end_date') else None
+    index = rule['occurrences']
+    dates: List[date] = []
+    while len(dates) < limit:
+        when = occurrence_date(rule, index)
+        if end is not None and when > end:
+            return dates, None, index
+        if when > today:
+            break
+        dates.append(when)
+        index += 1
+    return dates, next_date({**rule, "occurrences": index}), index
+
+
+class Scheduler:
+    def __init__(self, storage: Storage, interval: float = 60.0, batch_size: int = 1000):
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.rules_processed = 0
+        self.occurrences_created = 0
+        self.occurrences_skipped = 0
+        self.run_seconds_total = 0.0
+        self.last_run_seconds = 0.0
+        self.last_run_at = 0.0
+        self.lag_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, storage: Storage) -> "Scheduler":
+        return cls(
+            storage,
+            interval=float(os.environ.get('RECURRING_INTERVAL_SECONDS', 60)),
+            batch_size=int(os.environ.get('RECURRING_BATCH_SIZE', 1000)),
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.exception("Recurring rules run failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, today: Optional[date] = None) -> int:
+        """Materialise every occurrence due by ``today``; returns how many transactions were created."""
+        now = datetime.now(timezone.utc)
+        today = today or now.date()
+        started = time.perf_counter()
+        created = 0
+        rules = await self.storage.due_rules(today.isoformat(), self.batch_size)
+        # How long the oldest pending occurrence has been due, as of this run
+        oldest = datetime.combine(parse_date(rules[0]['next_date']), datetime.min.time(), timezone.utc) if rules else now
+        self.lag_seconds = max((now - oldest).total_seconds(), 0.0)
+        while rules:
+            inserted, advanced = await self._materialise(rules, today)
+            created += inserted
+            if not advanced:
+                # Every rule moved under us; the next run picks them up again
+                break
+            rules = await self.storage.due_rules(today.isoformat(), self.batch_size)
+
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        self.run_seconds_total += self.last_run_seconds
+        self.last_run_at = time.time()
+        if created:
+            logger.info("Materialised %d recurring transactions in %.2fs", created, self.last_run_seconds)
+        return created
+
+    async def _materialise(self, rules: List[Dict[str, Any]], today: date) -> Tuple[int, int]:
+        """Write one batch of rules' due occurrences; returns ``(inserted, rules advanced)``."""
+        created_at = datetime.now(timezone.utc)
+        batch: List[Dict[str, Any]] = []
+        advances: List[RuleAdvance] = []
+        for rule in rules:
+            dates, following, occurrences = due_occurrences(rule, today, MAX_CATCH_UP)
+            template = {field: rule[field] for field in TEMPLATE_FIELDS}
+            batch.extend(
+                {"id": occurrence_id(rule['id'], when), **template, "date": when.isoformat(), "created_at": created_at}
+                for when in dates
+            )
+            advances.append((rule['id'], rule['next_date'], following, occurrences))
+
+        failed = set()
+        for offset in range(0, len(batch), self.batch_size):
+            for index, _ in await self.storage.insert_transactions(batch[offset:offset + self.batch_size]):
+                failed.add(offset + index)
+        by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Users with occurrences an earlier, interrupted run already wrote
+        interrupted = set()
+        for index, trans in enumerate(batch):
+            by_user[trans['user_id']].append(trans)
+            if index in failed:
+                interrupted.add(trans['user_id'])
+        await asyncio.gather(*(
+            self._record(user_id, occurrences, user_id in interrupted) for user_id, occurrences in by_user.items()
+        ))
+        advanced = await self.storage.advance_rules(advances)
+
+        inserted = len(batch) - len(failed)
+        self.rules_processed += len(rules)
+        self.occurrences_created += inserted
+        self.occurrences_skipped += len(failed)
+        return inserted, advanced
+
+    async def _record(self, user_id: str, occurrences: List[Dict[str, Any]], interrupted: bool) -> None:
+        if interrupted:
+            # Whether the interrupted run applied its deltas is unknown, so recount
+            await rollups.rebuild(self.storage, user_id)
+        else:
+            await rollups.apply(self.storage, user_id, rollups.deltas(occurrences))
+        await self.storage.record_changes(user_id, upserted=[trans['id'] for trans in occurrences])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "failures": self.failures,
+            "rules": self.rules_processed,
+            "created": self.occurrences_created,
+            "skipped": self.occurrences_skipped,
+            "run_seconds": self.run_seconds_total,
+            "last_run_seconds": self.last_run_seconds,
+            "last_run_at": self.last_run_at,
+            "lag_seconds": self.lag_seconds,
+        }
@@ -0,0 +1,50 @@
+"""Fast JSON output for the large read routes.
+
+FastAPI validates a returned value against the route's ``response_model``
+and encodes it with the stdlib ``json`` module; for thousands of
+transaction rows that revalidation dominates the request. Rows coming
+out of the storage engines are already in exactly the ``Transaction``
+shape (the Mongo projection and the SQLite/in-memory columns mirror the
+model), so these routes skip that step and hand the rows straight to
+orjson. Routes keep declaring ``response_model`` so the OpenAPI schema
+is unchanged; FastAPI does not re-validate a ``Response`` it is given.
+
+orjson writes aware UTC datetimes with a ``Z`` suffix, as Pydantic does;
+naive datetimes (only from documents written before tz-aware reads) are
+treated as UTC.
+"""
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _default(value: Any) -> Any:
+    # Small models (user, summary, stats) embedded next to the trusted rows
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=JSON_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_json(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Encode ``content`` directly, keeping headers set on the route's injected ``response``.
+
+    FastAPI drops the injected response's headers (ETag, Cache-Control) when a
+    route returns its own ``Response``, so they are carried over here.
+    """
+    headers = dict(response.headers) if response is not None else None
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,236 @@
+"""Per-user running totals that make summary and stats a single rollup read.
+
+Each user has one rollup, stored by the active storage engine::
+
+    {"user_id": ..., "ready": True, "version": 3,
+     "categories": {"expense": {"Food": {"EUR": {"total_micros": 12500000, "count": 2},
+                                         "": {...}}, ...},
+                    "income": {...}}}
+
+Buckets are per type, category and currency; ``""`` holds transactions
+stored without a currency (see fx.py). Totals are integer millionths (see
+money.py), so applying deltas never accumulates float error and a rebuild
+agrees with the running totals to the last digit. ``convert`` turns a
+rollup into one whose buckets are all in a user's base currency, which is
+what summary and stats report.
+
+Write routes keep it current with per-bucket ``(total_micros, count)``
+deltas. A rollup is only trusted once ``ready`` is set, which happens when
+it is created for a new user or (re)built from the raw transactions;
+writes against a user with no ready rollup still add their deltas to a
+partial rollup, which the next read replaces with a full rebuild. So does
+a rollup stored under an older ``version`` of this shape, and one a write
+route ``invalidate``-d because it could not tell its exact deltas.
+
+Rebuild or check rollups from the backend directory::
+
+    python rollups.py verify [--user USER_ID]
+    python rollups.py rebuild [--user USER_ID]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from fx import Converter
+from money import from_micros, to_micros
+from storage import ROLLUP_VERSION, TYPES, RollupDeltas, Storage, TransactionFilter, empty_rollup, storage_from_env
+
+logger = logging.getLogger(__name__)
+
+
+def deltas(transactions: Iterable[Dict[str, Any]], sign: int = 1) -> RollupDeltas:
+    """Per-bucket deltas that add (or, with ``sign=-1``, remove) transactions."""
+    result: RollupDeltas = {}
+    for trans in transactions:
+        key = (trans['type'], trans['category'], trans.get('currency') or "")
+        total, count = result.get(key, (0, 0))
+        result[key] = (total + sign * to_micros(trans['amount']), count + sign)
+    return result
+
+
+def merge(*changes: RollupDeltas) -> RollupDeltas:
+    """Sum several sets of deltas, dropping buckets that net out to nothing."""
+    result: RollupDeltas = {}
+    for change in changes:
+        for key, (total, count) in change.items():
+            old_total, old_count = result.get(key, (0, 0))
+            result[key] = (old_total + total, old_count + count)
+    return {key: value for key, value in result.items() if value != (0, 0)}
+
+
+def update_deltas(old: Dict[str, Any], new: Dict[str, Any]) -> RollupDeltas:
+    """Deltas for replacing ``old`` with ``new``, with unchanged buckets netted out."""
+    return merge(deltas([old], sign=-1), deltas([new]))
+
+
+async def apply(storage: Storage, user_id: str, changes: RollupDeltas) -> None:
+    if changes:
+        await storage.apply_rollup_deltas(user_id, changes)
+
+
+async def invalidate(storage: Storage, user_id: str) -> None:
+    """Have the next read rebuild a user's rollup."""
+    await storage.replace_rollup(user_id, {**empty_rollup(user_id), "ready": False})
+
+
+async def create(storage: Storage, user_id: str) -> None:
+    """Start a new user with an empty, ready rollup."""
+    await storage.replace_rollup(user_id, empty_rollup(user_id))
+
+
+async def compute(storage: Storage, user_id: str) -> Dict[str, Any]:
+    """Aggregate a user's rollup from their raw transactions."""
+    return await storage.aggregate_rollup(TransactionFilter(user_id=user_id))
+
+
+async def rebuild(storage: Storage, user_id: str) -> Dict[str, Any]:
+    rollup = await compute(storage, user_id)
+    await storage.replace_rollup(user_id, rollup)
+    return rollup
+
+
+async def get(storage: Storage, user_id: str) -> Dict[str, Any]:
+    """Read a user's rollup, rebuilding it first if it is not ready or outdated."""
+    rollup = await storage.get_rollup(user_id)
+    if rollup is None or not rollup.get("ready") or rollup.get("version") != ROLLUP_VERSION:
+        logger.info("Building rollup for user %s", user_id)
+        rollup = await rebuild(storage, user_id)
+    return rollup
+
+
+def buckets(rollup: Dict[str, Any]) -> Iterator[Tuple[str, str, str, Dict[str, Any]]]:
+    """``(type, category, currency, bucket)`` for every non-empty bucket."""
+    for type, categories in rollup.get("categories", {}).items():
+        for category, currencies in categories.items():
+            for currency, bucket in currencies.items():
+                if bucket.get("count", 0) > 0:
+                    yield type, category, currency, bucket
+
+
+def currencies(rollup: Dict[str, Any]) -> Set[str]:
+    return {currency for _, _, currency, _ in buckets(rollup)}
+
+
+async def convert(
+    storage: Storage, converter: Converter, rollup: Dict[str, Any], filter: TransactionFilter, target: str
+) -> Dict[str, Any]:
+    """``rollup`` with every bucket in the ``target`` currency, for the transactions ``filter`` matches.
+
+    Buckets already in ``target`` are kept as they are. Other currencies
+    are re-aggregated per day, for just those currencies, and converted at
+    each day's rate in one batched lookup.
+    """
+    foreign = tuple(sorted(c for c in currencies(rollup) if converter.resolve(c) != target))
+    result = {**rollup, "categories": {t: {} for t in TYPES}}
+
+    def add(type: str, category: str, total_micros: int, count: int) -> None:
+        bucket = result['categories'].setdefault(type, {}).setdefault(category, {}).setdefault(
+            target, {"total_micros": 0, "count": 0}
+        )
+        bucket['total_micros'] += total_micros
+        bucket['count'] += count
+
+    for type, category, currency, bucket in buckets(rollup):
+        if currency not in foreign:
+            add(type, category, bucket['total_micros'], bucket['count'])
+    if foreign:
+        daily = await storage.aggregate_daily(replace(filter, currencies=foreign))
+        for group in converter.convert_daily(daily, target):
+            add(group['type'], group['category'], group['total_micros'], group['count'])
+    return result
+
+
+def category_rows(rollup: Dict[str, Any], type: str) -> List[Dict[str, Any]]:
+    """``{category, total, total_micros, count}`` rows for one transaction type, largest total first.
+
+    Totals add up every currency's bucket, so they only mean something for
+    a rollup already ``convert``-ed to one currency; counts always do.
+    """
+    rows = []
+    for category, currencies in rollup.get("categories", {}).get(type, {}).items():
+        total_micros = sum(bucket.get("total_micros", 0) for bucket in currencies.values())
+        count = sum(bucket.get("count", 0) for bucket in currencies.values())
+        if count > 0:
+            rows.append({
+                "category": category, "total": from_micros(total_micros), "total_micros": total_micros, "count": count,
+            })
+    rows.sort(key=lambda row: row['total_micros'], reverse=True)
+    return rows
+
+
+def totals(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-type totals, their difference (``net``) and the overall transaction count."""
+    micros: Dict[str, int] = {}
+    result: Dict[str, Any] = {"count": 0}
+    for type in TYPES:
+        rows = category_rows(rollup, type)
+        micros[type] = sum(row['total_micros'] for row in rows)
+        result[type] = from_micros(micros[type])
+        result["count"] += sum(row['count'] for row in rows)
+    result["net"] = from_micros(micros["income"] - micros["expense"])
+    return result
+
+
+def drift(stored: Optional[Dict[str, Any]], computed: Dict[str, Any]) -> List[str]:
+    """Describe every bucket where the stored rollup disagrees with the computed one."""
+    if stored is None:
+        return ["rollup missing"]
+    problems = []
+    if not stored.get("ready"):
+        problems.append("rollup not ready")
+    if stored.get("version") != ROLLUP_VERSION:
+        problems.append(f"rollup version {stored.get('version')}, expected {ROLLUP_VERSION}")
+    have = {(type, category, currency): bucket for type, category, currency, bucket in buckets(stored)}
+    want = {(type, category, currency): bucket for type, category, currency, bucket in buckets(computed)}
+    empty = {"total_micros": 0, "count": 0}
+    for key in sorted(set(have) | set(want)):
+        h = have.get(key, empty)
+        w = want.get(key, empty)
+        if h['count'] != w['count'] or h['total_micros'] != w['total_micros']:
+            type, category, currency = key
+            problems.append(
+                f"{type}/{category}/{currency or '-'}: stored total={from_micros(h['total_micros'])} count={h['count']}, "
+                f"actual total={from_micros(w['total_micros'])} count={w['count']}"
+            )
+    return problems
+
+
+async def _run(command: str, user_id: Optional[str]) -> int:
+    load_dotenv(Path(__file__).parent / '.env')
+    storage = storage_from_env()
+    await storage.connect()
+    drifted = 0
+    try:
+        for uid in [user_id] if user_id else await storage.list_user_ids():
+            stored = await storage.get_rollup(uid)
+            computed = await compute(storage, uid)
+            problems = drift(stored, computed)
+            if problems:
+                drifted += 1
+                for problem in problems:
+                    print(f"DRIFT {uid} {problem}")
+            if command == "rebuild":
+                await storage.replace_rollup(uid, computed)
+        print(f"{drifted} user(s) with drift" + (", rebuilt" if command == "rebuild" else ""))
+    finally:
+        await storage.close()
+    return 1 if drifted and command == "verify" else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Verify or rebuild per-user transaction rollups")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user", dest="user_id", help="only this user id")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(_run(args.command, args.user_id))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
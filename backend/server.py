@@ -1,28 +1,111 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, Header, Query, Request, Response, UploadFile, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import math
+import io
+import csv
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError, field_validator
+from typing import AsyncIterator, List, Optional, Literal, Tuple, Union
 import uuid
+import json
+import base64
+import binascii
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from dataclasses import replace
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 
+from cache import TTLCache
+from dates import bucket_start, bucket_starts, normalize_date, parse_date
+from hashing import PasswordHasher, PoolSaturated
+from metrics import CONTENT_TYPE, HTTPMetrics, MetricsMiddleware, Registry, stats_collector
+from money import MAX_AMOUNT, from_micros, quantize
+from responses import fast_json
+from storage import (
+    INITIAL_REVISION,
+    TYPES,
+    VERSION_OP,
+    DuplicateKeyError,
+    PageKey,
+    RevisionConflictError,
+    TransactionFilter,
+    search_key,
+    search_terms,
+    storage_from_env,
+)
+import analytics
+import fx
+import recurring
+import rollups
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Metrics, served in Prometheus text format at /metrics
+metrics_registry = Registry(prefix="spendwise_")
+http_metrics = HTTPMetrics(metrics_registry)
+auth_latency = metrics_registry.histogram(
+    "auth_operation_duration_seconds",
+    "Password hashing (including pool wait) and JWT encode/decode time",
+    ("operation",)
+)
+
+# Storage engine, picked by STORAGE_ENGINE (see storage/__init__.py)
+storage = storage_from_env(metrics=metrics_registry)
+
+# Pagination
+UNPAGINATED_LIMIT = 10000
+MAX_PAGE_SIZE = 500
+DASHBOARD_PAGE_SIZE = 50
+CHANGES_PAGE_SIZE = 1000
+MAX_CHANGES_PAGE_SIZE = 5000
+
+# Transactions carry an optional ISO 4217 currency code
+CURRENCY_PATTERN = r"^[A-Z]{3}$"
+# Base currency of new users, and the currency of transactions stored without one
+DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY', 'USD')
+# Exchange rates file (see fx.py), read once at startup, and the currency its rates are quoted against
+FX_RATES_PATH = os.environ.get('FX_RATES_PATH', str(ROOT_DIR / 'fx_rates.csv'))
+FX_QUOTE_CURRENCY = os.environ.get('FX_QUOTE_CURRENCY', DEFAULT_CURRENCY)
+
+# Export
+EXPORT_FIELDS = ["id", "date", "type", "category", "description", "amount", "currency", "created_at"]
+EXPORT_BATCH_SIZE = 1000
+
+# Import
+IMPORT_BATCH_SIZE = 1000
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Recurring rules
+MAX_RECURRING_EVERY = 366
+# Most rows a single bulk request may touch, explicit ids and filter matches combined
+MAX_BULK_ITEMS = 1000
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+# Ranked results are paged by offset, which gets slower the deeper it goes
+MAX_SEARCH_RESULTS = 1000
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 20
+MAX_IMPORT_ERRORS = 100
+
+# Analytics
+# Longest zero-filled time series, e.g. about 2.7 years of days
+MAX_TIMESERIES_BUCKETS = 1000
+TREND_WINDOW = 3
+MAX_TREND_WINDOW = 52
+ANOMALY_LIMIT = 20
+MAX_ANOMALY_LIMIT = 100
+
+# Password hashing (bcrypt runs on a bounded worker pool, see hashing.py)
+password_hasher = PasswordHasher.from_env()
 
 # JWT settings
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -32,7 +115,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 # Security
 security = HTTPBearer()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await storage.connect()
+    await load_exchange_rates()
+    recurring_scheduler.start()
+    yield
+    await recurring_scheduler.stop()
+    await storage.close()
+    password_hasher.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -41,10 +134,22 @@ class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: EmailStr
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Summary, stats and listings are reported in this currency
+    base_currency: str = DEFAULT_CURRENCY
+
+    @field_validator("base_currency", mode="before")
+    @classmethod
+    def validate_base_currency(cls, value: Optional[str]) -> str:
+        # Users registered before currencies existed have none stored
+        return value or DEFAULT_CURRENCY
 
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
+    base_currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+
+class UserSettings(BaseModel):
+    base_currency: str = Field(..., pattern=CURRENCY_PATTERN)
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -64,23 +169,185 @@ class Transaction(BaseModel):
     description: str
     category: str
     amount: float
+    # ISO 4217 code; None means the user's own currency
+    currency: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Bumped on every change; send it back as If-Match to reject conflicting edits
+    revision: int = INITIAL_REVISION
 
 class TransactionCreate(BaseModel):
     type: Literal["income", "expense"]
     date: str
     description: str
     category: str
-    amount: float
+    # Kept to six decimal places; totals over it are exact
+    amount: float = Field(..., ge=-MAX_AMOUNT, le=MAX_AMOUNT)
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+
+    @field_validator("date")
+    @classmethod
+    def validate_date(cls, value: str) -> str:
+        return normalize_date(value)
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, value: float) -> float:
+        return quantize(value)
+
+    @field_validator("currency", mode="before")
+    @classmethod
+    def validate_currency(cls, value: Optional[str]) -> Optional[str]:
+        # Exported CSVs leave the column empty for transactions without one
+        return value or None
 
 class TransactionUpdate(BaseModel):
     type: Optional[Literal["income", "expense"]] = None
     date: Optional[str] = None
     description: Optional[str] = None
     category: Optional[str] = None
-    amount: Optional[float] = None
+    amount: Optional[float] = Field(None, ge=-MAX_AMOUNT, le=MAX_AMOUNT)
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+
+    @field_validator("date")
+    @classmethod
+    def validate_date(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_date(value) if value is not None else None
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, value: Optional[float]) -> Optional[float]:
+        return quantize(value) if value is not None else None
+
+class TransactionPatch(TransactionUpdate):
+    id: str
+
+class BulkFilter(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    type: Optional[Literal["income", "expense"]] = None
+    category: Optional[str] = None
+    # Case-insensitive substring of the description
+    description: Optional[str] = None
+    date_from: Optional[str] = Field(None, alias="from")
+    date_to: Optional[str] = Field(None, alias="to")
+
+    @field_validator("date_from", "date_to")
+    @classmethod
+    def validate_date(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_date(value) if value is not None else None
+
+class BulkRequest(BaseModel):
+    updates: List[TransactionPatch] = []
+    deletes: List[str] = []
+    # Filter mode: apply ``set`` to, or delete, every transaction matching ``filter``
+    filter: Optional[BulkFilter] = None
+    set: Optional[TransactionUpdate] = None
+    delete_matching: bool = False
+
+class BulkItemResult(BaseModel):
+    id: str
+    op: Literal["update", "delete"]
+    # "conflict": another request changed the row first; re-read it and retry
+    status: Literal["updated", "unchanged", "deleted", "not_found", "conflict"]
+
+class BulkResult(BaseModel):
+    matched: int
+    updated: int
+    deleted: int
+    not_found: int
+    conflicts: int
+    results: List[BulkItemResult]
+
+class RecurringRuleCreate(BaseModel):
+    type: Literal["income", "expense"]
+    description: str
+    category: str
+    amount: float = Field(..., ge=-MAX_AMOUNT, le=MAX_AMOUNT)
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+    # Repeats every ``every`` units from ``start_date``, through ``end_date`` if given
+    every: int = Field(1, ge=1, le=MAX_RECURRING_EVERY)
+    unit: Literal["day", "week", "month"]
+    start_date: str
+    end_date: Optional[str] = None
+
+    @field_validator("start_date", "end_date")
+    @classmethod
+    def validate_date(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_date(value) if value is not None else None
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, value: float) -> float:
+        return quantize(value)
+
+class RecurringRuleUpdate(BaseModel):
+    description: Optional[str] = None
+    category: Optional[str] = None
+    amount: Optional[float] = Field(None, ge=-MAX_AMOUNT, le=MAX_AMOUNT)
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+    end_date: Optional[str] = None
+
+    @field_validator("end_date")
+    @classmethod
+    def validate_date(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_date(value) if value is not None else None
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, value: Optional[float]) -> Optional[float]:
+        return quantize(value) if value is not None else None
+
+class RecurringRule(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    type: Literal["income", "expense"]
+    description: str
+    category: str
+    amount: float
+    currency: Optional[str] = None
+    every: int
+    unit: Literal["day", "week", "month"]
+    start_date: str
+    end_date: Optional[str] = None
+    # Next occurrence still to be created; None once the rule has ended
+    next_date: Optional[str] = None
+    occurrences: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ConvertedTransaction(Transaction):
+    # ``amount`` in the user's base currency, at the rate on the transaction's date
+    base_amount: float
+
+class TransactionPage(BaseModel):
+    items: List[ConvertedTransaction]
+    next_cursor: Optional[str] = None
+
+class SearchResult(Transaction):
+    score: float
+
+class SearchPage(BaseModel):
+    items: List[SearchResult]
+    next_cursor: Optional[str] = None
+
+class Suggestion(BaseModel):
+    value: str
+    count: int
+    # For descriptions: the category used with it most recently
+    category: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResult(BaseModel):
+    format: Literal["csv", "ndjson"]
+    inserted: int
+    failed: int
+    errors: List[ImportRowError]
 
 class Summary(BaseModel):
+    # The user's base currency, which every total is converted to
+    currency: str
     total_income: float
     total_expenses: float
     net_income: float
@@ -93,56 +360,323 @@ class CategoryStats(BaseModel):
     count: int
 
 class Stats(BaseModel):
+    currency: str
     expense_by_category: List[CategoryStats]
     income_by_category: List[CategoryStats]
 
+class TimeseriesSeries(BaseModel):
+    type: str
+    category: str
+    totals: List[float]
+    counts: List[int]
+
+class Timeseries(BaseModel):
+    bucket: Literal["day", "week", "month"]
+    currency: str
+    # First day of each bucket; every list below has one entry per start
+    starts: List[str]
+    income: List[float]
+    expense: List[float]
+    counts: List[int]
+    # One per (type, category) with any transactions, largest total first within each type
+    series: List[TimeseriesSeries]
+
+class Dashboard(BaseModel):
+    user: User
+    transactions: TransactionPage
+    summary: Summary
+    stats: Stats
+    sync_token: str
+
+class TrendPoint(BaseModel):
+    # First day of the month, or the Monday of the week
+    start: str
+    income: float
+    expense: float
+    net: float
+    count: int
+    # Trailing means over the request's window, including this period
+    income_average: float
+    expense_average: float
+
+class Trends(BaseModel):
+    period: Literal["month", "week"]
+    window: int
+    points: List[TrendPoint]
+
+class CategoryDelta(BaseModel):
+    category: str
+    current: float
+    previous: float
+    change: float
+    # None when the category had no spend the month before
+    percent_change: Optional[float] = None
+
+class CategoryDeltas(BaseModel):
+    month: Optional[str] = None
+    previous_month: Optional[str] = None
+    categories: List[CategoryDelta]
+
+class Anomaly(BaseModel):
+    transaction: Transaction
+    # The category's median expense
+    typical_amount: float
+    # Robust z-score; negative for unusually small amounts
+    score: float
+
+class Anomalies(BaseModel):
+    threshold: float
+    total: int
+    items: List[Anomaly]
+
+class TransactionChanges(BaseModel):
+    sync_token: str
+    # True when the token is missing, unknown or older than the change log:
+    # the client must drop its local copy and reload everything
+    reset: bool = False
+    upserts: List[Transaction] = []
+    deletes: List[str] = []
+    has_more: bool = False
+
+# Authenticated principals, keyed by user id, so most requests skip the users lookup
+principal_cache: TTLCache[User] = TTLCache(
+    max_size=int(os.environ.get('AUTH_CACHE_SIZE', 10000)),
+    ttl_seconds=float(os.environ.get('AUTH_CACHE_TTL_SECONDS', 60))
+)
+
+# Per-user analytics ledgers with the data version they were read at
+analytics_cache: TTLCache[Tuple[int, analytics.Ledger]] = TTLCache(
+    max_size=int(os.environ.get('ANALYTICS_CACHE_SIZE', 64)),
+    ttl_seconds=float(os.environ.get('ANALYTICS_CACHE_TTL_SECONDS', 600))
+)
+
+# Materialises due recurring rules in the background (see recurring.py)
+recurring_scheduler = recurring.Scheduler.from_env(storage)
+
+# Cross rates by (currency, target, date); the table only changes at startup, so entries never expire
+exchange_rates = fx.Converter(
+    fx.RateTable(FX_QUOTE_CURRENCY, {}),
+    TTLCache(max_size=int(os.environ.get('FX_CACHE_SIZE', 100000)), ttl_seconds=math.inf),
+    DEFAULT_CURRENCY
+)
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+async def hash_password(password: str) -> str:
+    started = time.perf_counter()
+    try:
+        hashed = await password_hasher.hash(password)
+    except PoolSaturated:
+        raise _hashing_busy()
+    auth_latency.observe(time.perf_counter() - started, "bcrypt_hash")
+    return hashed
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    started = time.perf_counter()
+    try:
+        verified = await password_hasher.verify(plain_password, hashed_password)
+    except PoolSaturated:
+        raise _hashing_busy()
+    auth_latency.observe(time.perf_counter() - started, "bcrypt_verify")
+    return verified
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    with auth_latency.time("jwt_encode"):
+        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def require_rates(currency: Optional[str]) -> None:
+    """Reject a currency that amounts could not be converted from or to."""
+    if currency and not exchange_rates.table.supports(currency):
+        raise HTTPException(status_code=422, detail=f"No exchange rates for {currency}")
+
+def parse_query_date(value: str, name: str) -> str:
+    try:
+        return normalize_date(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid '{name}' date: {value}")
+
+def encode_cursor(transaction: dict) -> str:
+    raw = json.dumps([transaction['date'], transaction['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def encode_sync_token(seq: int, transaction_id: str = "") -> str:
+    raw = json.dumps([seq, transaction_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_sync_token(token: str) -> tuple:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        seq, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(seq, int) or not isinstance(transaction_id, str):
+            raise ValueError
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return seq, transaction_id
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded))["offset"]
+        if not isinstance(offset, int) or not 0 <= offset < MAX_SEARCH_RESULTS:
+            raise ValueError
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+def decode_cursor(cursor: str) -> PageKey:
+    """Turn an opaque cursor into the ``(date, id)`` key the next page starts after."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(date, str) or not isinstance(transaction_id, str):
+            raise ValueError
+        date = normalize_date(date)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return date, transaction_id
+
+def filter_conditions(
+    type: List[str] = Query([]),
+    category: List[str] = Query([]),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    min_amount: Optional[float] = Query(None, ge=0),
+    max_amount: Optional[float] = Query(None, ge=0),
+) -> dict:
+    """Transaction filter query parameters, as ``TransactionFilter`` keyword arguments.
+    
+    ``type`` and ``category`` may repeat to match any of several values,
+    e.g. ``?category=Food&category=Travel``; dates and amounts are inclusive.
+    """
+    conditions = {
+        "types": tuple(t for t in type if t),
+        "categories": tuple(c for c in category if c),
+        "date_from": parse_query_date(date_from, "from") if date_from else None,
+        "date_to": parse_query_date(date_to, "to") if date_to else None,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+    }
+    if conditions["date_from"] and conditions["date_to"] and conditions["date_from"] > conditions["date_to"]:
+        raise HTTPException(status_code=422, detail="'from' must not be after 'to'")
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        raise HTTPException(status_code=422, detail="'min_amount' must not exceed 'max_amount'")
+    return conditions
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with auth_latency.time("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    cached = principal_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    user = await storage.get_user(user_id)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     
-    return User(**user)
+    principal = User(**user)
+    principal_cache.put(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id: str) -> None:
+    """Drop a cached principal. Call when a user is deleted or their tokens are revoked."""
+    principal_cache.invalidate(user_id)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+def revision_etag(revision: int) -> str:
+    return f'"{revision}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """The revision an If-Match header requires, or None when any revision will do."""
+    if not if_match:
+        return None
+    candidates = [tag.strip() for tag in if_match.split(",")]
+    if "*" in candidates:
+        return None
+    # If-Match uses strong comparison, so weak tags never match
+    if all(tag.startswith("W/") for tag in candidates):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="If-Match needs a strong ETag")
+    revisions = {tag[1:-1] for tag in candidates if len(tag) > 1 and tag[0] == tag[-1] == '"'}
+    if len(revisions) != 1 or not next(iter(revisions)).isdigit():
+        raise HTTPException(status_code=400, detail="If-Match must name a single transaction revision")
+    return int(revisions.pop())
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+) -> User:
+    """Authenticate a read route and answer 304 if the client's copy is still current.
+    
+    The ETag combines the user's data version with the user id, path and query, so it
+    changes whenever a write route bumps the version and never matches another user's
+    copy of the same URL. The version is read before the route's data, so a concurrent
+    write can only make the ETag older than the body, never newer.
+    """
+    version = await storage.get_data_version(current_user.id)
+    request.state.data_version = version
+    resource = f"{current_user.id}:{request.url.path}?{request.url.query}"
+    resource_hash = hashlib.sha1(resource.encode()).hexdigest()[:12]
+    etag = f'"{version}-{resource_hash}"'
+    # The body depends on who is asking, so caches must key it by the token too
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response.headers.update(headers)
+    return current_user
 
 # Auth Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await storage.get_user_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    require_rates(user_data.base_currency)
+    
     # Create user
-    user = User(email=user_data.email)
+    user = User(email=user_data.email, base_currency=user_data.base_currency)
     user_dict = user.model_dump()
-    user_dict['password_hash'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password_hash'] = await hash_password(user_data.password)
+    user_dict['data_version'] = 0
     
-    await db.users.insert_one(user_dict)
+    try:
+        await storage.insert_user(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await rollups.create(storage, user.id)
     
     # Create token
     access_token = create_access_token(data={"sub": user.id})
@@ -151,18 +685,14 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
+    user = await storage.get_user_by_email(credentials.email)
     if not user:
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, user['password_hash']):
+    if not await verify_password(credentials.password, user['password_hash']):
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
-    # Convert ISO string back to datetime if needed
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
-    user_obj = User(**{k: v for k, v in user.items() if k != 'password_hash'})
+    user_obj = User(**user)
     access_token = create_access_token(data={"sub": user_obj.id})
     
     return Token(access_token=access_token, token_type="bearer", user=user_obj)
@@ -171,67 +701,369 @@ async def login(credentials: UserLogin):
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.put("/auth/me", response_model=User)
+async def update_me(settings: UserSettings, current_user: User = Depends(get_current_user)):
+    """Change the user's settings; summaries, stats and lists report in the new base currency at once."""
+    require_rates(settings.base_currency)
+    if not await storage.update_user(current_user.id, settings.model_dump()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    invalidate_principal(current_user.id)
+    # Converted totals change, so cached reads and ETags must too
+    await storage.record_changes(current_user.id)
+    return current_user.model_copy(update=settings.model_dump())
+
+@api_router.get("/currencies", response_model=List[str])
+async def get_currencies():
+    """Currencies with exchange rates loaded, which transactions and base currencies may use."""
+    return exchange_rates.table.currencies
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE)
+
+metrics_registry.collector(stats_collector(
+    "password_hashing", "bcrypt worker pool", password_hasher.stats,
+    counters=("completed", "rejected", "wait_seconds", "work_seconds"),
+    gauges=("pending", "workers", "max_pending", "rounds", "wait_seconds_max")
+))
+
+def password_rounds_collector():
+    # Verified hashes by their bcrypt cost, to follow rehashing after a rounds change
+    name = "password_hashing_verified_total"
+    yield name, "counter", "bcrypt worker pool: verified hashes by rounds", [
+        (name, {"rounds": rounds}, count) for rounds, count in password_hasher.stats()["verified_by_rounds"].items()
+    ]
+
+metrics_registry.collector(password_rounds_collector)
+metrics_registry.collector(stats_collector(
+    "auth_cache", "Authenticated principal cache", principal_cache.stats,
+    counters=("hits", "misses", "evictions", "expirations", "invalidations"),
+    gauges=("size", "max_size", "ttl_seconds")
+))
+metrics_registry.collector(stats_collector(
+    "analytics_cache", "Per-user analytics ledgers", analytics_cache.stats,
+    counters=("hits", "misses", "evictions", "expirations", "invalidations"),
+    gauges=("size", "max_size")
+))
+metrics_registry.collector(stats_collector(
+    "recurring", "Recurring transaction scheduler", recurring_scheduler.stats,
+    counters=("runs", "failures", "rules", "created", "skipped", "run_seconds"),
+    gauges=("running", "interval_seconds", "batch_size", "lag_seconds", "last_run_seconds", "last_run_at")
+))
+metrics_registry.collector(stats_collector(
+    "fx_rate_cache", "Exchange rate lookups", exchange_rates.cache.stats,
+    counters=("hits", "misses", "evictions", "invalidations"),
+    gauges=("size", "max_size")
+))
+
 # Transaction Routes
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction_data: TransactionCreate, current_user: User = Depends(get_current_user)):
-    transaction = Transaction(
-        user_id=current_user.id,
-        **transaction_data.model_dump()
-    )
+async def create_transaction(
+    transaction_data: TransactionCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    fields = transaction_data.model_dump()
+    fields['currency'] = fields['currency'] or current_user.base_currency
+    require_rates(fields['currency'])
+    transaction = Transaction(user_id=current_user.id, **fields)
     
     trans_dict = transaction.model_dump()
-    trans_dict['created_at'] = trans_dict['created_at'].isoformat()
     
-    await db.transactions.insert_one(trans_dict)
+    await storage.insert_transaction(trans_dict)
+    await rollups.apply(storage, current_user.id, rollups.deltas([trans_dict]))
+    await storage.record_changes(current_user.id, upserted=[transaction.id])
+    response.headers["ETag"] = revision_etag(transaction.revision)
     return transaction
 
-@api_router.get("/transactions", response_model=List[Transaction])
+async def find_transactions(
+    filter: TransactionFilter,
+    limit: Optional[int],
+    after: Optional[PageKey] = None
+) -> List[dict]:
+    """Newest-first transactions matching ``filter``; one extra row past ``limit`` signals another page."""
+    return await storage.find_transactions(filter, limit + 1 if limit else UNPAGINATED_LIMIT, after)
+
+def paginate(transactions: List[dict], limit: int) -> dict:
+    """A ``TransactionPage``-shaped dict; rows stay as stored for the fast JSON path."""
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1])
+    
+    return {"items": transactions, "next_cursor": next_cursor}
+
+@api_router.get("/transactions", response_model=Union[List[ConvertedTransaction], TransactionPage])
 async def get_transactions(
-    type: Optional[str] = None,
-    category: Optional[str] = None,
+    response: Response,
+    conditions: dict = Depends(filter_conditions),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(conditional_get)
+):
+    filter = TransactionFilter(user_id=current_user.id, **conditions)
+    after = decode_cursor(cursor) if cursor else None
+    
+    transactions = exchange_rates.convert_rows(await find_transactions(filter, limit, after), current_user.base_currency)
+    
+    # Without a limit, keep the original unpaginated list response
+    if limit is None:
+        return fast_json(transactions, response)
+    
+    return fast_json(paginate(transactions, limit), response)
+
+@api_router.get("/transactions/search", response_model=SearchPage)
+async def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over descriptions, best match first.
+    
+    Any of the query's words may match, in any inflection ("ride" finds
+    "Uber rides"). Results are ranked, so pages go by position rather than
+    by key, up to ``MAX_SEARCH_RESULTS``.
+    """
+    terms = search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=422, detail="Search needs at least one word")
+    offset = decode_search_cursor(cursor) if cursor else 0
+    limit = min(limit, MAX_SEARCH_RESULTS - offset)
+    
+    rows = await storage.search_transactions(current_user.id, terms, limit + 1, offset)
+    next_cursor = None
+    if len(rows) > limit and offset + limit < MAX_SEARCH_RESULTS:
+        next_cursor = encode_search_cursor(offset + limit)
+    return fast_json({"items": rows[:limit], "next_cursor": next_cursor})
+
+def category_suggestions(rollup: dict, prefix: str, type: Optional[str], limit: int) -> List[Suggestion]:
+    """Categories the user has used that start with ``prefix``, most used first, read off the rollup."""
+    key = search_key(prefix)
+    counts = {}
+    for t in ([type] if type else TYPES):
+        for row in rollups.category_rows(rollup, t):
+            if search_key(row['category']).startswith(key):
+                counts[row['category']] = counts.get(row['category'], 0) + row['count']
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [Suggestion(value=category, count=count) for category, count in ranked[:limit]]
+
+@api_router.get("/transactions/suggest", response_model=List[Suggestion])
+async def suggest(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    field: Literal["description", "category"] = "description",
+    type: Optional[Literal["income", "expense"]] = None,
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=MAX_SUGGEST_LIMIT),
+    current_user: User = Depends(get_current_user)
+):
+    """Prefix autocomplete for descriptions or categories, most used first.
+    
+    ``type`` narrows category suggestions; description suggestions span both types.
+    """
+    if field == "category":
+        return category_suggestions(await rollups.get(storage, current_user.id), prefix, type, limit)
+    return await storage.suggest_descriptions(current_user.id, prefix, limit)
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def stream_export(transactions: AsyncIterator[dict], format: str) -> AsyncIterator[str]:
+    """Yield the export in chunks of ``EXPORT_BATCH_SIZE`` rows as ``transactions`` is drained."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    if format == "csv":
+        writer.writeheader()
+        # Send the header straight away so the download starts immediately
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    
+    rows = 0
+    async for doc in transactions:
+        row = {field: _export_value(doc.get(field)) for field in EXPORT_FIELDS}
+        if format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@api_router.get("/transactions/export")
+async def export_transactions(
+    format: Literal["csv", "ndjson"] = "csv",
+    conditions: dict = Depends(filter_conditions),
+    current_user: User = Depends(get_current_user)
+):
+    filter = TransactionFilter(user_id=current_user.id, **conditions)
+    transactions = storage.iter_transactions(filter, EXPORT_BATCH_SIZE)
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(transactions, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'}
+    )
+
+NOT_UTF8 = "Not valid UTF-8 text; export the file as UTF-8 and import it again"
+
+def is_utf8(text: str) -> bool:
+    """False if ``text`` holds bytes that decoding the upload as UTF-8 had to escape."""
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def iter_import_rows(file: UploadFile, format: str):
+    """Yield ``(row_number, record)`` pairs without reading the whole upload into memory.
+    
+    A row that cannot be parsed, or is not UTF-8, is yielded as a ``ValueError``
+    saying why, so one bad row cannot end the import partway through.
+    """
+    # Undecodable bytes are escaped rather than raised, and caught per row below
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="surrogateescape", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        row_number = 0
+        while True:
+            row_number += 1
+            try:
+                record = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield row_number, ValueError(f"Invalid CSV: {e}")
+                continue
+            cells = "".join(str(cell) for item in record.items() for cell in item)
+            yield row_number, record if is_utf8(cells) else ValueError(NOT_UTF8)
+    
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        if not is_utf8(line):
+            yield row_number, ValueError(NOT_UTF8)
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = ValueError(f"Invalid JSON: {e}")
+        yield row_number, record
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}"
+        for err in error.errors()
+    )
+
+@api_router.post("/transactions/import", response_model=ImportResult)
+async def import_transactions(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = None,
     current_user: User = Depends(get_current_user)
 ):
-    query = {"user_id": current_user.id}
-    if type:
-        query["type"] = type
-    if category:
-        query["category"] = category
+    if format is None:
+        filename = (file.filename or "").lower()
+        format = "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+    
+    inserted = 0
+    failed = 0
+    errors: List[ImportRowError] = []
     
-    transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
+    def record_error(row: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append(ImportRowError(row=row, error=message))
     
-    for trans in transactions:
-        if isinstance(trans.get('created_at'), str):
-            trans['created_at'] = datetime.fromisoformat(trans['created_at'])
+    async def flush(batch: List[dict], batch_rows: List[int]):
+        nonlocal inserted
+        failed_indexes = set()
+        for index, message in await storage.insert_transactions(batch):
+            failed_indexes.add(index)
+            record_error(batch_rows[index], message)
+        
+        written = [doc for i, doc in enumerate(batch) if i not in failed_indexes]
+        inserted += len(written)
+        if written:
+            await rollups.apply(storage, current_user.id, rollups.deltas(written))
+            await storage.record_changes(current_user.id, upserted=[doc['id'] for doc in written])
     
-    # Sort by date descending
-    transactions.sort(key=lambda x: x['date'], reverse=True)
+    batch: List[dict] = []
+    batch_rows: List[int] = []
+    created_at = datetime.now(timezone.utc)
+    for row_number, record in iter_import_rows(file, format):
+        if isinstance(record, ValueError):
+            record_error(row_number, str(record))
+            continue
+        try:
+            data = TransactionCreate.model_validate(record)
+        except ValidationError as e:
+            record_error(row_number, format_validation_error(e))
+            continue
+        currency = data.currency or current_user.base_currency
+        if not exchange_rates.table.supports(currency):
+            record_error(row_number, f"No exchange rates for {currency}")
+            continue
+        
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "user_id": current_user.id,
+            **data.model_dump(),
+            "currency": currency,
+            "created_at": created_at,
+        })
+        batch_rows.append(row_number)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch, batch_rows)
+            batch, batch_rows = [], []
+            created_at = datetime.now(timezone.utc)
     
-    return transactions
+    if batch:
+        await flush(batch, batch_rows)
+    
+    return ImportResult(format=format, inserted=inserted, failed=failed, errors=errors)
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
 async def update_transaction(
     transaction_id: str,
     update_data: TransactionUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    # Check if transaction exists and belongs to user
-    transaction = await db.transactions.find_one({"id": transaction_id, "user_id": current_user.id})
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+    """Update only the provided fields, scoped to the user's own transactions.
     
-    # Update only provided fields
-    update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
-    if update_dict:
-        await db.transactions.update_one(
-            {"id": transaction_id},
-            {"$set": update_dict}
+    With ``If-Match: "<revision>"`` the update is applied only if nobody has
+    changed the transaction since that revision, else 412 Precondition Failed.
+    """
+    update_dict = changed_fields(update_data)
+    require_rates(update_dict.get('currency'))
+    try:
+        result = await storage.update_transaction(
+            current_user.id, transaction_id, update_dict, expected_revision=parse_if_match(if_match)
+        )
+    except RevisionConflictError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Transaction was modified; current revision is {e.current}",
+            headers={"ETag": revision_etag(e.current)}
         )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Fetch updated transaction
-    updated_transaction = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
-    if isinstance(updated_transaction.get('created_at'), str):
-        updated_transaction['created_at'] = datetime.fromisoformat(updated_transaction['created_at'])
+    transaction, updated_transaction = result
+    if update_dict:
+        await rollups.apply(storage, current_user.id, rollups.update_deltas(transaction, updated_transaction))
+        await storage.record_changes(current_user.id, upserted=[transaction_id])
     
+    response.headers["ETag"] = revision_etag(updated_transaction['revision'])
     return Transaction(**updated_transaction)
 
 @api_router.delete("/transactions/{transaction_id}")
@@ -239,78 +1071,480 @@ async def delete_transaction(
     transaction_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    result = await db.transactions.delete_one({"id": transaction_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+    deleted = await storage.delete_transaction(current_user.id, transaction_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    await rollups.apply(storage, current_user.id, rollups.deltas([deleted], sign=-1))
+    await storage.record_changes(current_user.id, deleted=[transaction_id])
     
     return {"message": "Transaction deleted successfully"}
 
-@api_router.get("/transactions/summary", response_model=Summary)
-async def get_summary(current_user: User = Depends(get_current_user)):
-    transactions = await db.transactions.find({"user_id": current_user.id}, {"_id": 0}).to_list(10000)
+def changed_fields(update: TransactionUpdate) -> dict:
+    return {k: v for k, v in update.model_dump(exclude={"id"}).items() if v is not None}
+
+async def resolve_bulk_filter(user_id: str, request_data: BulkRequest) -> List[str]:
+    """Ids of the transactions matched by the request's filter mode, if it uses one."""
+    if request_data.filter is None:
+        if request_data.set is not None or request_data.delete_matching:
+            raise HTTPException(status_code=422, detail="'set' and 'delete_matching' need a 'filter'")
+        return []
+    if (request_data.set is None) == (not request_data.delete_matching):
+        raise HTTPException(status_code=422, detail="A filter needs exactly one of 'set' or 'delete_matching'")
+    conditions = request_data.filter
+    filter = TransactionFilter(
+        user_id=user_id,
+        types=(conditions.type,) if conditions.type else (),
+        categories=(conditions.category,) if conditions.category else (),
+        date_from=conditions.date_from,
+        date_to=conditions.date_to,
+        description=conditions.description,
+    )
+    if not filter.narrowed:
+        raise HTTPException(status_code=422, detail="A filter needs at least one condition")
     
-    total_income = sum(t['amount'] for t in transactions if t['type'] == 'income')
-    total_expenses = sum(t['amount'] for t in transactions if t['type'] == 'expense')
-    net_income = total_income - total_expenses
+    matched = await storage.find_transactions(filter, MAX_BULK_ITEMS + 1)
+    if len(matched) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Filter matches more than {MAX_BULK_ITEMS} transactions; narrow it"
+        )
+    return [trans['id'] for trans in matched]
+
+@api_router.post("/transactions/bulk", response_model=BulkResult)
+async def bulk_transactions(request_data: BulkRequest, current_user: User = Depends(get_current_user)):
+    """Apply many updates and deletes in one storage batch, scoped to the caller.
+    
+    Explicit ``updates``/``deletes`` and the filter mode may be combined.
+    Explicit ids must be unique and take precedence over filter matches.
+    """
+    explicit_ids = [patch.id for patch in request_data.updates] + request_data.deletes
+    explicit = set(explicit_ids)
+    if len(explicit) < len(explicit_ids):
+        raise HTTPException(status_code=422, detail="Each transaction id may appear only once per request")
+    matched_ids = await resolve_bulk_filter(current_user.id, request_data)
+    
+    updates = {patch.id: changed_fields(patch) for patch in request_data.updates}
+    deletes = list(request_data.deletes)
+    filter_ids = [transaction_id for transaction_id in matched_ids if transaction_id not in explicit]
+    if request_data.set is not None:
+        filter_fields = changed_fields(request_data.set)
+        updates.update((transaction_id, filter_fields) for transaction_id in filter_ids)
+    else:
+        deletes.extend(filter_ids)
+    if len(updates) + len(deletes) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BULK_ITEMS} transactions per request")
+    for currency in {fields.get('currency') for fields in updates.values()}:
+        require_rates(currency)
+    
+    outcome = await storage.bulk_write(current_user.id, updates, deletes)
+    before = outcome.before
+    
+    results = []
+    changes = []
+    upserted = []
+    for transaction_id, fields in updates.items():
+        if transaction_id not in before:
+            status = "not_found"
+        elif transaction_id in outcome.conflicts:
+            status = "conflict"
+        elif fields:
+            status = "updated"
+            changes.append(rollups.update_deltas(before[transaction_id], {**before[transaction_id], **fields}))
+            upserted.append(transaction_id)
+        else:
+            status = "unchanged"
+        results.append(BulkItemResult(id=transaction_id, op="update", status=status))
+    removed = [
+        before[transaction_id] for transaction_id in deletes
+        if transaction_id in before and transaction_id not in outcome.conflicts
+    ]
+    for transaction_id in deletes:
+        if transaction_id not in before:
+            status = "not_found"
+        else:
+            status = "conflict" if transaction_id in outcome.conflicts else "deleted"
+        results.append(BulkItemResult(id=transaction_id, op="delete", status=status))
+    
+    if upserted or removed:
+        if outcome.exact:
+            changes.append(rollups.deltas(removed, sign=-1))
+            await rollups.apply(storage, current_user.id, rollups.merge(*changes))
+        else:
+            # A concurrent write overlapped the batch, so its deltas are not known exactly
+            await rollups.invalidate(storage, current_user.id)
+        await storage.record_changes(
+            current_user.id, upserted=upserted, deleted=[trans['id'] for trans in removed]
+        )
+    
+    return BulkResult(
+        matched=len(matched_ids),
+        updated=len(upserted),
+        deleted=len(removed),
+        not_found=sum(1 for result in results if result.status == "not_found"),
+        conflicts=len(outcome.conflicts),
+        results=results
+    )
+
+def summary_from_rollup(rollup: dict, currency: str) -> Summary:
+    totals = rollups.totals(rollup)
     
     return Summary(
-        total_income=total_income,
-        total_expenses=total_expenses,
-        net_income=net_income,
-        transaction_count=len(transactions)
+        currency=currency,
+        total_income=totals['income'],
+        total_expenses=totals['expense'],
+        net_income=totals['net'],
+        transaction_count=totals['count']
     )
 
-@api_router.get("/transactions/stats", response_model=Stats)
-async def get_stats(current_user: User = Depends(get_current_user)):
-    transactions = await db.transactions.find({"user_id": current_user.id}, {"_id": 0}).to_list(10000)
-    
-    # Calculate expense stats
-    expense_transactions = [t for t in transactions if t['type'] == 'expense']
-    expense_by_category = {}
-    for trans in expense_transactions:
-        cat = trans['category']
-        if cat not in expense_by_category:
-            expense_by_category[cat] = {'total': 0, 'count': 0}
-        expense_by_category[cat]['total'] += trans['amount']
-        expense_by_category[cat]['count'] += 1
-    
-    total_expenses = sum(data['total'] for data in expense_by_category.values())
-    expense_stats = [
+def build_category_stats(rows: List[dict]) -> List[CategoryStats]:
+    """Turn grouped ``{category, total, total_micros, count}`` rows into CategoryStats with percentages."""
+    grand_total = sum(row['total_micros'] for row in rows)
+    return [
         CategoryStats(
-            category=cat,
-            total=data['total'],
-            percentage=round((data['total'] / total_expenses * 100) if total_expenses > 0 else 0, 2),
-            count=data['count']
+            category=row['category'],
+            total=row['total'],
+            percentage=round((row['total_micros'] / grand_total * 100) if grand_total > 0 else 0, 2),
+            count=row['count']
         )
-        for cat, data in expense_by_category.items()
+        for row in rows
     ]
+
+def stats_from_rollup(rollup: dict, currency: str) -> Stats:
+    return Stats(
+        currency=currency,
+        expense_by_category=build_category_stats(rollups.category_rows(rollup, 'expense')),
+        income_by_category=build_category_stats(rollups.category_rows(rollup, 'income'))
+    )
+
+async def filtered_rollup(user: User, conditions: dict) -> dict:
+    """The user's rollup, or for a filtered request one aggregated over just the matches, in their base currency.
     
-    # Calculate income stats
-    income_transactions = [t for t in transactions if t['type'] == 'income']
-    income_by_category = {}
-    for trans in income_transactions:
-        cat = trans['category']
-        if cat not in income_by_category:
-            income_by_category[cat] = {'total': 0, 'count': 0}
-        income_by_category[cat]['total'] += trans['amount']
-        income_by_category[cat]['count'] += 1
-    
-    total_income = sum(data['total'] for data in income_by_category.values())
-    income_stats = [
-        CategoryStats(
-            category=cat,
-            total=data['total'],
-            percentage=round((data['total'] / total_income * 100) if total_income > 0 else 0, 2),
-            count=data['count']
-        )
-        for cat, data in income_by_category.items()
+    The aggregate runs on the same indexes as the listing, so a date window
+    such as "this month" reads that month's rows rather than all history.
+    """
+    filter = TransactionFilter(user_id=user.id, **conditions)
+    if filter.narrowed:
+        rollup = await storage.aggregate_rollup(filter)
+    else:
+        rollup = await rollups.get(storage, user.id)
+    return await rollups.convert(storage, exchange_rates, rollup, filter, user.base_currency)
+
+@api_router.get("/transactions/summary", response_model=Summary)
+async def get_summary(
+    conditions: dict = Depends(filter_conditions),
+    current_user: User = Depends(conditional_get)
+):
+    return summary_from_rollup(await filtered_rollup(current_user, conditions), current_user.base_currency)
+
+@api_router.get("/transactions/stats", response_model=Stats)
+async def get_stats(
+    conditions: dict = Depends(filter_conditions),
+    current_user: User = Depends(conditional_get)
+):
+    return stats_from_rollup(await filtered_rollup(current_user, conditions), current_user.base_currency)
+
+def too_many_buckets(bucket: str) -> HTTPException:
+    return HTTPException(
+        status_code=422,
+        detail=f"More than {MAX_TIMESERIES_BUCKETS} {bucket} buckets; narrow 'from'/'to' or use a larger bucket"
+    )
+
+async def timeseries_groups(user: User, filter: TransactionFilter, bucket: str) -> List[dict]:
+    """``{start, type, category, total_micros, count}`` groups in the user's base currency.
+    
+    Currencies already in the base currency are bucketed by the database;
+    others are summed per day, converted at each day's rate, then bucketed.
+    """
+    held = rollups.currencies(await rollups.get(storage, user.id))
+    foreign = tuple(sorted(c for c in held if exchange_rates.resolve(c) != user.base_currency))
+    if not foreign:
+        return await storage.aggregate_timeseries(filter, bucket)
+    
+    native = tuple(sorted(held - set(foreign)))
+    groups = await storage.aggregate_timeseries(replace(filter, currencies=native), bucket) if native else []
+    daily = await storage.aggregate_daily(replace(filter, currencies=foreign))
+    merged = {}
+    for group in groups + exchange_rates.convert_daily(daily, user.base_currency):
+        start = group.get('start') or bucket_start(parse_date(group['date']), bucket).isoformat()
+        key = (start, group['type'], group['category'])
+        total_micros, count = merged.get(key, (0, 0))
+        merged[key] = (total_micros + group['total_micros'], count + group['count'])
+    return [
+        {"start": start, "type": type, "category": category, "total_micros": total_micros, "count": count}
+        for (start, type, category), (total_micros, count) in merged.items()
     ]
+
+@api_router.get("/transactions/timeseries", response_model=Timeseries)
+async def get_timeseries(
+    bucket: Literal["day", "week", "month"] = "month",
+    conditions: dict = Depends(filter_conditions),
+    current_user: User = Depends(conditional_get)
+):
+    """Income, spend and per-category totals over time, zero-filled for charting.
+    
+    The database groups the matches by bucket, type and category over the
+    user's date index; buckets span ``from`` to ``to``, or the matching
+    transactions when either is left out.
+    """
+    filter = TransactionFilter(user_id=current_user.id, **conditions)
+    if filter.date_from and filter.date_to:
+        if len(bucket_starts(filter.date_from, filter.date_to, bucket, MAX_TIMESERIES_BUCKETS)) > MAX_TIMESERIES_BUCKETS:
+            raise too_many_buckets(bucket)
+    
+    currency = current_user.base_currency
+    groups = await timeseries_groups(current_user, filter, bucket)
+    if not groups and not (filter.date_from and filter.date_to):
+        return Timeseries(bucket=bucket, currency=currency, starts=[], income=[], expense=[], counts=[], series=[])
+    
+    first = filter.date_from or min(group['start'] for group in groups)
+    last = filter.date_to or max(group['start'] for group in groups)
+    starts = bucket_starts(first, last, bucket, MAX_TIMESERIES_BUCKETS)
+    if len(starts) > MAX_TIMESERIES_BUCKETS:
+        raise too_many_buckets(bucket)
+    
+    # Summed exactly in micros, converted once per bucket
+    position = {start: index for index, start in enumerate(starts)}
+    totals = {t: [0] * len(starts) for t in TYPES}
+    counts = [0] * len(starts)
+    series = {}
+    for group in groups:
+        index = position[group['start']]
+        totals[group['type']][index] += group['total_micros']
+        counts[index] += group['count']
+        key = (group['type'], group['category'])
+        if key not in series:
+            series[key] = ([0] * len(starts), [0] * len(starts))
+        series[key][0][index] += group['total_micros']
+        series[key][1][index] += group['count']
+    
+    ranked = sorted(series.items(), key=lambda item: (TYPES.index(item[0][0]), -sum(item[1][0])))
+    return Timeseries(
+        bucket=bucket,
+        currency=currency,
+        starts=starts,
+        income=[from_micros(total) for total in totals['income']],
+        expense=[from_micros(total) for total in totals['expense']],
+        counts=counts,
+        series=[
+            TimeseriesSeries(
+                type=type, category=category, totals=[from_micros(total) for total in micros], counts=series_counts
+            )
+            for (type, category), (micros, series_counts) in ranked
+        ]
+    )
+
+# Recurring rules
+@api_router.post("/recurring", response_model=RecurringRule)
+async def create_recurring_rule(rule_data: RecurringRuleCreate, current_user: User = Depends(get_current_user)):
+    """Store a rule; the scheduler creates its transactions, from ``start_date`` on, as they fall due."""
+    if rule_data.end_date and rule_data.end_date < rule_data.start_date:
+        raise HTTPException(status_code=422, detail="'end_date' must not be before 'start_date'")
+    fields = rule_data.model_dump()
+    fields['currency'] = fields['currency'] or current_user.base_currency
+    require_rates(fields['currency'])
+    rule = RecurringRule(user_id=current_user.id, next_date=rule_data.start_date, **fields)
+    
+    await storage.insert_rule(rule.model_dump())
+    return rule
+
+@api_router.get("/recurring", response_model=List[RecurringRule])
+async def get_recurring_rules(current_user: User = Depends(get_current_user)):
+    return await storage.list_rules(current_user.id)
+
+@api_router.put("/recurring/{rule_id}", response_model=RecurringRule)
+async def update_recurring_rule(
+    rule_id: str,
+    update_data: RecurringRuleUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    """Change future occurrences; transactions already created are left as they are."""
+    rule = await storage.get_rule(current_user.id, rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    
+    update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
+    require_rates(update_dict.get('currency'))
+    if 'end_date' in update_dict:
+        if update_dict['end_date'] < rule['start_date']:
+            raise HTTPException(status_code=422, detail="'end_date' must not be before 'start_date'")
+        # Moving the end can finish a rule early or revive a finished one
+        update_dict['next_date'] = recurring.next_date({**rule, **update_dict})
+    
+    updated = await storage.update_rule(current_user.id, rule_id, update_dict)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    return updated
+
+@api_router.delete("/recurring/{rule_id}")
+async def delete_recurring_rule(rule_id: str, current_user: User = Depends(get_current_user)):
+    if not await storage.delete_rule(current_user.id, rule_id):
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
     
-    return Stats(expense_by_category=expense_stats, income_by_category=income_stats)
+    return {"message": "Recurring rule deleted successfully"}
+
+@api_router.get("/dashboard", response_model=Dashboard)
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    conditions: dict = Depends(filter_conditions),
+    limit: int = Query(DASHBOARD_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(conditional_get)
+):
+    """Everything the dashboard renders, behind a single auth check.
+    
+    Filters narrow the transaction list only; summary and stats cover all history.
+    """
+    filter = TransactionFilter(user_id=current_user.id, **conditions)
+    transactions, rollup = await asyncio.gather(
+        find_transactions(filter, limit),
+        filtered_rollup(current_user, {})
+    )
+    currency = current_user.base_currency
+    
+    return fast_json({
+        "user": current_user,
+        "transactions": paginate(exchange_rates.convert_rows(transactions, currency), limit),
+        "summary": summary_from_rollup(rollup, currency),
+        "stats": stats_from_rollup(rollup, currency),
+        "sync_token": encode_sync_token(request.state.data_version)
+    }, response)
+
+@api_router.get("/transactions/changes", response_model=TransactionChanges)
+async def get_transaction_changes(
+    since: Optional[str] = None,
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=MAX_CHANGES_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    """Inserts, updates and deletes since ``since``, read from the change log.
+    
+    Without a token (or with one the log can no longer serve) the response has
+    ``reset`` set and a fresh token: reload the full list, then poll from there.
+    """
+    version = await storage.get_data_version(current_user.id)
+    if since is None:
+        return TransactionChanges(sync_token=encode_sync_token(version), reset=True)
+    
+    seq, after_id = decode_sync_token(since)
+    if seq > version:
+        return TransactionChanges(sync_token=encode_sync_token(version), reset=True)
+    
+    # A bare version token already covers every change made under that version
+    start_seq, start_id = (seq, after_id) if after_id else (seq + 1, "")
+    entries = await storage.list_changes(current_user.id, start_seq, start_id, limit + 1)
+    
+    # Entries expire after the retention period; a gap after the token means history was lost
+    expected_first = {seq, seq + 1} if after_id else {seq + 1}
+    if seq < version and (not entries or entries[0]['seq'] not in expected_first):
+        return TransactionChanges(sync_token=encode_sync_token(version), reset=True)
+    
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    if not entries:
+        return TransactionChanges(sync_token=since)
+    
+    latest_ops = {}
+    for entry in entries:
+        if entry['op'] != VERSION_OP:
+            latest_ops[entry['transaction_id']] = entry['op']
+    upsert_ids = [tid for tid, op in latest_ops.items() if op == "upsert"]
+    upserts = await storage.get_transactions(current_user.id, upsert_ids)
+    
+    # Anything upserted and then deleted further along the log is already gone
+    found = {trans['id'] for trans in upserts}
+    deletes = [tid for tid, op in latest_ops.items() if op == "delete" or tid not in found]
+    
+    last = entries[-1]
+    return fast_json({
+        "sync_token": encode_sync_token(last['seq'], last['transaction_id']),
+        "reset": False,
+        "upserts": upserts,
+        "deletes": deletes,
+        "has_more": has_more
+    })
+
+# Analytics Routes
+async def current_ledger(request: Request, current_user: User = Depends(conditional_get)) -> analytics.Ledger:
+    """The user's history as arrays, reread only when their data version has moved."""
+    version = request.state.data_version
+    cached = analytics_cache.get(current_user.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    ledger = await analytics.load(storage, current_user.id, exchange_rates, current_user.base_currency)
+    analytics_cache.put(current_user.id, (version, ledger))
+    return ledger
+
+@api_router.get("/analytics/trends", response_model=Trends)
+async def get_trends(
+    period: Literal["month", "week"] = "month",
+    window: int = Query(TREND_WINDOW, ge=1, le=MAX_TREND_WINDOW),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    ledger: analytics.Ledger = Depends(current_ledger)
+):
+    """Income and spend per month or week, with rolling averages over ``window`` periods."""
+    points = await asyncio.to_thread(
+        analytics.trends,
+        ledger,
+        period,
+        window,
+        parse_query_date(date_from, "from") if date_from else None,
+        parse_query_date(date_to, "to") if date_to else None
+    )
+    return Trends(period=period, window=window, points=points)
+
+@api_router.get("/analytics/categories", response_model=CategoryDeltas)
+async def get_category_deltas(
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    ledger: analytics.Ledger = Depends(current_ledger)
+):
+    """Month-over-month spend per category; ``month`` defaults to the latest with spend."""
+    if month is not None:
+        try:
+            normalize_date(f"{month}-01")
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f"Invalid month: {month}")
+    return await asyncio.to_thread(analytics.category_deltas, ledger, month)
+
+@api_router.get("/analytics/anomalies", response_model=Anomalies)
+async def get_anomalies(
+    threshold: float = Query(analytics.DEFAULT_OUTLIER_THRESHOLD, gt=0),
+    limit: int = Query(ANOMALY_LIMIT, ge=1, le=MAX_ANOMALY_LIMIT),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    ledger: analytics.Ledger = Depends(current_ledger),
+    current_user: User = Depends(conditional_get)
+):
+    """Expenses far outside their category's usual range, most unusual first."""
+    total, flagged = await asyncio.to_thread(
+        analytics.anomalies,
+        ledger,
+        threshold,
+        limit,
+        parse_query_date(date_from, "from") if date_from else None,
+        parse_query_date(date_to, "to") if date_to else None
+    )
+    found = {
+        trans['id']: trans
+        for trans in await storage.get_transactions(current_user.id, [item['id'] for item in flagged])
+    }
+    
+    # Rows deleted since the ledger was read drop out
+    return Anomalies(
+        threshold=threshold,
+        total=total,
+        items=[{**item, "transaction": found[item['id']]} for item in flagged if item['id'] in found]
+    )
+
+@app.exception_handler(fx.MissingRatesError)
+async def missing_rates(request: Request, exc: fx.MissingRatesError):
+    # Stored amounts in a currency the loaded rate table dropped; fixed by loading its rates
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)})
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware, metrics=http_metrics)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -325,6 +1559,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def load_exchange_rates():
+    try:
+        table = await asyncio.to_thread(fx.RateTable.load, FX_RATES_PATH, FX_QUOTE_CURRENCY)
+    except FileNotFoundError:
+        logger.warning("No exchange rates at %s; only %s amounts can be stored", FX_RATES_PATH, FX_QUOTE_CURRENCY)
+        return
+    exchange_rates.replace_table(table)
+    logger.info("Loaded exchange rates for %s", ", ".join(table.currencies))
@@ -0,0 +1,86 @@
+"""Pluggable persistence for users, transactions, rollups, recurring rules and the change log.
+
+``STORAGE_ENGINE`` picks the engine:
+
+- ``mongo`` (default): MongoDB via Motor, configured by ``MONGO_URL`` and ``DB_NAME``
+- ``sqlite``: a local SQLite file in WAL mode, at ``SQLITE_PATH``
+- ``memory``: in-process and unpersisted, for tests and benchmarks
+
+Only the selected engine's driver is imported.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+from metrics import Registry
+from storage.base import (
+    CHANGE_LOG_RETENTION_SECONDS,
+    COLUMN_FIELDS,
+    INITIAL_REVISION,
+    ROLLUP_VERSION,
+    SUGGEST_SCAN_LIMIT,
+    TYPES,
+    VERSION_OP,
+    BulkOutcome,
+    DuplicateKeyError,
+    PageKey,
+    RevisionConflictError,
+    RollupDeltas,
+    RuleAdvance,
+    Storage,
+    TransactionFilter,
+    empty_rollup,
+    search_key,
+    search_terms,
+)
+
+ENGINES = ("mongo", "sqlite", "memory")
+
+DEFAULT_SQLITE_PATH = Path(__file__).resolve().parent.parent / "spendwise.db"
+
+
+def create_storage(engine: str, metrics: Optional[Registry] = None, **options) -> Storage:
+    """Build an engine; ``metrics`` turns on the engine's query instrumentation where it has one."""
+    if engine == "mongo":
+        from storage.mongo import MongoStorage
+        return MongoStorage(options["url"], options["db_name"], metrics=metrics)
+    if engine == "sqlite":
+        from storage.sqlite import SQLiteStorage
+        return SQLiteStorage(str(options.get("path") or DEFAULT_SQLITE_PATH))
+    if engine == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage engine {engine!r}, expected one of {', '.join(ENGINES)}")
+
+
+def storage_from_env(metrics: Optional[Registry] = None) -> Storage:
+    engine = os.environ.get("STORAGE_ENGINE", "mongo")
+    if engine == "mongo":
+        return create_storage(engine, metrics, url=os.environ["MONGO_URL"], db_name=os.environ["DB_NAME"])
+    return create_storage(engine, metrics, path=os.environ.get("SQLITE_PATH"))
+
+
+__all__ = [
+    "CHANGE_LOG_RETENTION_SECONDS",
+    "COLUMN_FIELDS",
+    "DEFAULT_SQLITE_PATH",
+    "ENGINES",
+    "INITIAL_REVISION",
+    "ROLLUP_VERSION",
+    "SUGGEST_SCAN_LIMIT",
+    "TYPES",
+    "VERSION_OP",
+    "BulkOutcome",
+    "DuplicateKeyError",
+    "PageKey",
+    "RevisionConflictError",
+    "RollupDeltas",
+    "RuleAdvance",
+    "Storage",
+    "TransactionFilter",
+    "create_storage",
+    "empty_rollup",
+    "search_key",
+    "search_terms",
+    "storage_from_env",
+]
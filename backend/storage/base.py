@@ -0,0 +1,343 @@
+"""Storage interface shared by the MongoDB, in-memory and SQLite engines.
+
+Engines take and return transactions in API form: ``date`` as a
+``YYYY-MM-DD`` string and ``created_at`` as an aware datetime. How rows
+are stored, indexed, filtered, sorted and aggregated is up to each
+engine, so every one can answer the hot-path queries natively.
+
+Transaction listings are always newest first, ordered by ``(date, id)``
+descending; ``after`` keys continue a listing past a given ``(date, id)``.
+
+Every transaction carries a ``revision`` that engines bump on each write
+that changes it; rows stored before revisions existed read as revision 0.
+
+Amounts come and go as floats, but engines also store them as integer
+``amount_micros`` (see money.py) and sum those, so totals are exact. A
+transaction's optional ``currency`` reads as None when it was never set;
+aggregates group such rows under the currency key ``""``.
+
+Recurring rules (see recurring.py) are stored per user with their
+``start_date``, ``end_date`` and ``next_date`` as ``YYYY-MM-DD`` strings;
+``next_date`` is None once a rule has no occurrences left.
+"""
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+TYPES = ("income", "expense")
+
+# Change log entries older than this are dropped; clients behind it do a full resync
+CHANGE_LOG_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+# Op, and transaction id, of the change log entry for a data version bump that changed
+# no transaction, so every version has an entry and a gap means lost history
+VERSION_OP = "version"
+
+# Revision of a newly inserted transaction, used when the row does not carry one
+INITIAL_REVISION = 1
+
+# Bumped when the rollup document shape changes; rollups of another version are rebuilt
+ROLLUP_VERSION = 3
+
+# Fields ``transaction_columns`` reads, in order
+COLUMN_FIELDS = ("id", "date", "type", "category", "amount", "currency")
+
+# Description autocomplete groups at most this many prefix matches, keeping it bounded
+SUGGEST_SCAN_LIMIT = 1000
+
+_WORD = re.compile(r"\w+")
+
+PageKey = Tuple[str, str]
+# (rule id, next_date it was read with, new next_date, new occurrence count)
+RuleAdvance = Tuple[str, str, Optional[str], int]
+# (type, category, currency key) -> (total in micros, count)
+RollupDeltas = Dict[Tuple[str, str, str], Tuple[int, int]]
+
+
+def empty_rollup(user_id: str) -> Dict[str, Any]:
+    return {"user_id": user_id, "ready": True, "version": ROLLUP_VERSION, "categories": {t: {} for t in TYPES}}
+
+
+def search_terms(query: str) -> List[str]:
+    """Lowercased distinct words of a search query, in order; engines stem them their own way."""
+    return list(dict.fromkeys(_WORD.findall(query.lower())))
+
+
+def search_key(text: str) -> str:
+    """Case-folded form of a description or category, used for prefix matching."""
+    return text.lower()
+
+
+class DuplicateKeyError(Exception):
+    """Raised when an insert collides with an existing unique key."""
+
+
+class RevisionConflictError(Exception):
+    """Raised when a conditional write names a revision other than the stored one."""
+
+    def __init__(self, current: int):
+        super().__init__(f"stored revision is {current}")
+        self.current = current
+
+
+@dataclass
+class TransactionFilter:
+    user_id: str
+    # Any of these; empty means no restriction
+    types: Tuple[str, ...] = ()
+    categories: Tuple[str, ...] = ()
+    # Currency keys; "" matches transactions stored without a currency
+    currencies: Tuple[str, ...] = ()
+    # Inclusive YYYY-MM-DD bounds
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    # Inclusive amount bounds
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    # Case-insensitive substring of the description
+    description: Optional[str] = None
+
+    def __post_init__(self):
+        self.types = tuple(dict.fromkeys(self.types))
+        self.categories = tuple(dict.fromkeys(self.categories))
+        self.currencies = tuple(dict.fromkeys(self.currencies))
+        # Asking for every type is the same as not asking, and lets engines skip the condition
+        if set(self.types) >= set(TYPES):
+            self.types = ()
+
+    @property
+    def narrowed(self) -> bool:
+        """Whether anything besides the user restricts the match."""
+        return bool(
+            self.types or self.categories or self.currencies or self.date_from or self.date_to
+            or self.min_amount is not None or self.max_amount is not None or self.description
+        )
+
+    def matches(self, trans: Dict[str, Any]) -> bool:
+        return (
+            trans['user_id'] == self.user_id
+            and (not self.types or trans['type'] in self.types)
+            and (not self.categories or trans['category'] in self.categories)
+            and (not self.currencies or (trans.get('currency') or "") in self.currencies)
+            and (not self.date_from or trans['date'] >= self.date_from)
+            and (not self.date_to or trans['date'] <= self.date_to)
+            and (self.min_amount is None or trans['amount'] >= self.min_amount)
+            and (self.max_amount is None or trans['amount'] <= self.max_amount)
+            and (not self.description or self.description.lower() in trans['description'].lower())
+        )
+
+
+@dataclass
+class BulkOutcome:
+    """What ``Storage.bulk_write`` did."""
+    # Rows as they were before the batch, by id; ids the user does not own are absent
+    before: Dict[str, Dict[str, Any]]
+    # Rows another write changed between the engine reading and writing them; the
+    # batch may not have applied to them, and they are left as that write made them
+    conflicts: Set[str] = field(default_factory=set)
+    # False when a concurrent write leaves ``before`` unfit for computing rollup deltas
+    exact: bool = True
+
+
+class Storage(ABC):
+    name: str
+
+    async def connect(self) -> None:
+        """Prepare schema and indexes. Safe to call repeatedly."""
+
+    async def close(self) -> None:
+        """Release connections and worker threads."""
+
+    # Users
+
+    @abstractmethod
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        """Store a new user, raising ``DuplicateKeyError`` if the id or email is taken."""
+
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """A user without its password hash."""
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """A user including its password hash, for login."""
+
+    @abstractmethod
+    async def list_user_ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        """Set profile ``fields`` on a user; False if there is no such user."""
+
+    # Data versions and the change log
+
+    @abstractmethod
+    async def get_data_version(self, user_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def record_changes(self, user_id: str, upserted: Sequence[str] = (), deleted: Sequence[str] = ()) -> int:
+        """Bump the user's data version and log which transactions changed under it.
+
+        With no transactions, one ``VERSION_OP`` entry is logged instead.
+        """
+
+    @abstractmethod
+    async def list_changes(self, user_id: str, seq: int, after_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Change log entries after ``(seq, after_id)``, ordered by ``(seq, transaction_id)``."""
+
+    # Transactions
+
+    @abstractmethod
+    async def insert_transaction(self, trans: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def insert_transactions(self, batch: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """Insert what can be inserted; return ``(index, message)`` for each row that failed."""
+
+    @abstractmethod
+    async def find_transactions(
+        self, filter: TransactionFilter, limit: int, after: Optional[PageKey] = None
+    ) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def iter_transactions(self, filter: TransactionFilter, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        """Stream every matching transaction, fetching ``batch_size`` rows at a time."""
+
+    @abstractmethod
+    async def transaction_columns(self, filter: TransactionFilter, batch_size: int) -> Dict[str, List[Any]]:
+        """The matching transactions as parallel lists, one per ``COLUMN_FIELDS`` entry.
+
+        Only those fields are read, ``batch_size`` rows at a time; row order is unspecified.
+        """
+
+    @abstractmethod
+    async def get_transactions(self, user_id: str, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_transaction(
+        self,
+        user_id: str,
+        transaction_id: str,
+        fields: Dict[str, Any],
+        expected_revision: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Atomically apply ``fields`` and bump the revision.
+
+        Returns ``(before, after)``, or None if the user has no such
+        transaction. With ``expected_revision``, the write only happens if
+        the stored revision matches; otherwise ``RevisionConflictError``.
+        An empty ``fields`` writes nothing and leaves the revision alone.
+        """
+
+    @abstractmethod
+    async def delete_transaction(self, user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Delete and return the transaction, or None if the user has no such transaction."""
+
+    @abstractmethod
+    async def bulk_write(
+        self, user_id: str, updates: Dict[str, Dict[str, Any]], deletes: Sequence[str]
+    ) -> BulkOutcome:
+        """Apply per-id field updates and deletes as one batch, scoped to ``user_id``.
+
+        Ids the user does not own are left untouched. Updated rows get their
+        revision bumped. Engines that cannot hold the batch atomically report
+        rows a concurrent write got to first as ``conflicts``.
+        """
+
+    # Search
+
+    @abstractmethod
+    async def search_transactions(
+        self, user_id: str, terms: Sequence[str], limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Transactions whose description contains any of ``terms``, best match first.
+
+        Words are stemmed, so "rides" finds "ride". Each row carries a
+        ``score`` (higher is better); equal scores are newest first.
+        """
+
+    @abstractmethod
+    async def suggest_descriptions(self, user_id: str, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """Distinct descriptions starting with ``prefix``, ignoring case, most used first.
+
+        Rows are ``{value, category, count}``, with the spelling and category
+        of the most recent use. At most ``SUGGEST_SCAN_LIMIT`` matches are
+        grouped.
+        """
+
+    # Rollups (see rollups.py for the document shape)
+
+    @abstractmethod
+    async def get_rollup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The stored rollup, ready or not."""
+
+    @abstractmethod
+    async def replace_rollup(self, user_id: str, rollup: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def apply_rollup_deltas(self, user_id: str, deltas: RollupDeltas) -> None:
+        """Add ``(total_micros, count)`` deltas per ``(type, category, currency)``, atomically per bucket."""
+
+    @abstractmethod
+    async def aggregate_rollup(self, filter: TransactionFilter) -> Dict[str, Any]:
+        """Per-type, per-category, per-currency exact totals and counts over the matching transactions."""
+
+    @abstractmethod
+    async def aggregate_timeseries(self, filter: TransactionFilter, bucket: str) -> List[Dict[str, Any]]:
+        """``{start, type, category, total_micros, count}`` per time bucket, type and category.
+
+        ``bucket`` is one of ``dates.BUCKETS``; ``start`` is the bucket's first
+        day as ``YYYY-MM-DD`` (see ``dates.bucket_start``). Only buckets with
+        matching transactions appear, in no particular order.
+        """
+
+    @abstractmethod
+    async def aggregate_daily(self, filter: TransactionFilter) -> List[Dict[str, Any]]:
+        """``{date, currency, type, category, total_micros, count}`` per day, currency, type and category.
+
+        ``currency`` is ``""`` for transactions without one. Used to convert
+        other currencies at each day's rate, so callers narrow ``filter``
+        to the currencies that need converting.
+        """
+
+    # Recurring rules
+
+    @abstractmethod
+    async def insert_rule(self, rule: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def list_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        """The user's rules, oldest first."""
+
+    @abstractmethod
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_rule(self, user_id: str, rule_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply ``fields`` and return the updated rule, or None if the user has no such rule."""
+
+    @abstractmethod
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def due_rules(self, date: str, limit: int) -> List[Dict[str, Any]]:
+        """Rules of every user with ``next_date`` on or before ``date``, earliest first."""
+
+    @abstractmethod
+    async def advance_rules(self, advances: Sequence[RuleAdvance]) -> int:
+        """Move rules to their new ``next_date`` and ``occurrences`` as one batch.
+
+        Each advance only applies while the rule's ``next_date`` is still the
+        one it was read with, so concurrent schedulers never move a rule twice.
+        Returns how many rules moved.
+        """
@@ -0,0 +1,510 @@
+"""In-process storage engine for tests, benchmarks and single-node deployments.
+
+Nothing is persisted. Transactions are kept in a dict by id plus sorted
+``(date, id)`` key lists per user, per ``(user, type)`` and per
+``(user, category)``, so listings, date ranges and keyset pages are
+bisections rather than scans. Rollups are plain dicts updated in place.
+
+Search keeps a per-user inverted index of stemmed description words and a
+sorted list of lowercased descriptions for prefix lookups. The stemmer is
+deliberately light; it only needs to agree with itself.
+
+Recurring rules are kept by id, with their ``(next_date, id)`` keys in one
+sorted list across users so the scheduler's due scan is a bisection.
+"""
+import bisect
+import copy
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dates import bucket_start, parse_date
+from money import to_micros
+from storage.base import (
+    CHANGE_LOG_RETENTION_SECONDS,
+    COLUMN_FIELDS,
+    INITIAL_REVISION,
+    SUGGEST_SCAN_LIMIT,
+    VERSION_OP,
+    BulkOutcome,
+    DuplicateKeyError,
+    PageKey,
+    RevisionConflictError,
+    RollupDeltas,
+    RuleAdvance,
+    Storage,
+    TransactionFilter,
+    empty_rollup,
+    search_key,
+    search_terms,
+)
+
+# Sorts after any transaction id, for inclusive upper date bounds
+_MAX_ID = "\uffff"
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to with".split()
+)
+
+
+def stem(word: str) -> str:
+    """Strip plural and -ing/-ed endings so inflections of a word share a stem."""
+    if len(word) <= 3:
+        return word
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies"):
+        word = word[:-3] + "i"
+    elif word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if word.endswith("y"):
+        word = word[:-1] + "i"
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeiou":
+        word = word[:-1]
+    return word
+
+
+def stems(text: str) -> List[str]:
+    return [stem(word) for word in search_terms(text) if word not in _STOP_WORDS]
+
+
+class SortedKeys:
+    """``(date, id)`` keys kept in ascending order, scanned newest first."""
+
+    def __init__(self):
+        self._keys: List[PageKey] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: PageKey) -> None:
+        bisect.insort(self._keys, key)
+
+    def remove(self, key: PageKey) -> None:
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def descending(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        after: Optional[PageKey] = None,
+    ) -> Iterator[PageKey]:
+        low = bisect.bisect_left(self._keys, (date_from, "")) if date_from else 0
+        high = len(self._keys)
+        if date_to:
+            high = bisect.bisect_right(self._keys, (date_to, _MAX_ID))
+        if after is not None:
+            high = min(high, bisect.bisect_left(self._keys, after))
+        for index in range(high - 1, low - 1, -1):
+            yield self._keys[index]
+
+    def ascending(self, date_to: str) -> Iterator[PageKey]:
+        """Keys dated on or before ``date_to``, oldest first."""
+        high = bisect.bisect_right(self._keys, (date_to, _MAX_ID))
+        for index in range(high):
+            yield self._keys[index]
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self):
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._user_ids_by_email: Dict[str, str] = {}
+        self._transactions: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, SortedKeys] = defaultdict(SortedKeys)
+        self._by_user_type: Dict[Tuple[str, str], SortedKeys] = defaultdict(SortedKeys)
+        self._by_user_category: Dict[Tuple[str, str], SortedKeys] = defaultdict(SortedKeys)
+        self._rollups: Dict[str, Dict[str, Any]] = {}
+        # Per user, ordered by (seq, transaction_id); seq only grows so this is append-only
+        self._changes: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Per user: stem -> transaction ids, and sorted (description key, date, id)
+        self._postings: Dict[str, Dict[str, set]] = defaultdict(lambda: defaultdict(set))
+        self._descriptions: Dict[str, List[Tuple[str, str, str]]] = defaultdict(list)
+        self._rules: Dict[str, Dict[str, Any]] = {}
+        # (next_date, id) of every rule with occurrences left
+        self._rules_due = SortedKeys()
+
+    # Users
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        if user['id'] in self._users or user['email'] in self._user_ids_by_email:
+            raise DuplicateKeyError(f"user {user['email']} already exists")
+        self._users[user['id']] = dict(user)
+        self._user_ids_by_email[user['email']] = user['id']
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        return {k: v for k, v in user.items() if k != 'password_hash'}
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        user_id = self._user_ids_by_email.get(email)
+        return dict(self._users[user_id]) if user_id else None
+
+    async def list_user_ids(self) -> List[str]:
+        return list(self._users)
+
+    async def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        user = self._users.get(user_id)
+        if user is None:
+            return False
+        user.update(fields)
+        return True
+
+    # Data versions and the change log
+
+    async def get_data_version(self, user_id: str) -> int:
+        return self._users.get(user_id, {}).get('data_version', 0)
+
+    async def record_changes(self, user_id: str, upserted: Sequence[str] = (), deleted: Sequence[str] = ()) -> int:
+        user = self._users.get(user_id)
+        if user is None:
+            return 0
+        user['data_version'] = version = user.get('data_version', 0) + 1
+        now = datetime.now(timezone.utc)
+        log = self._changes[user_id]
+        changes = (("upsert", upserted), ("delete", deleted)) if upserted or deleted else ((VERSION_OP, [VERSION_OP]),)
+        entries = {}
+        for op, ids in changes:
+            for transaction_id in ids:
+                entries[transaction_id] = {"seq": version, "transaction_id": transaction_id, "op": op, "at": now}
+        log.extend(entries[tid] for tid in sorted(entries))
+        self._expire_changes(log, now)
+        return version
+
+    @staticmethod
+    def _expire_changes(log: List[Dict[str, Any]], now: datetime) -> None:
+        cutoff = now.timestamp() - CHANGE_LOG_RETENTION_SECONDS
+        expired = 0
+        while expired < len(log) and log[expired]['at'].timestamp() < cutoff:
+            expired += 1
+        if expired:
+            del log[:expired]
+
+    async def list_changes(self, user_id: str, seq: int, after_id: str, limit: int) -> List[Dict[str, Any]]:
+        log = self._changes.get(user_id, [])
+        start = bisect.bisect_right(log, (seq, after_id), key=lambda entry: (entry['seq'], entry['transaction_id']))
+        return [
+            {"seq": entry['seq'], "transaction_id": entry['transaction_id'], "op": entry['op']}
+            for entry in log[start:start + limit]
+        ]
+
+    # Transactions
+
+    def _index(self, trans: Dict[str, Any]) -> List[SortedKeys]:
+        user_id = trans['user_id']
+        return [
+            self._by_user[user_id],
+            self._by_user_type[(user_id, trans['type'])],
+            self._by_user_category[(user_id, trans['category'])],
+        ]
+
+    def _add(self, trans: Dict[str, Any]) -> None:
+        if trans['id'] in self._transactions:
+            raise DuplicateKeyError(f"transaction {trans['id']} already exists")
+        trans = dict(trans)
+        trans.setdefault('revision', INITIAL_REVISION)
+        trans.setdefault('currency', None)
+        self._transactions[trans['id']] = trans
+        for keys in self._index(trans):
+            keys.add((trans['date'], trans['id']))
+        postings = self._postings[trans['user_id']]
+        for word in set(stems(trans['description'])):
+            postings[word].add(trans['id'])
+        bisect.insort(self._descriptions[trans['user_id']], self._description_entry(trans))
+
+    def _remove(self, trans: Dict[str, Any]) -> None:
+        del self._transactions[trans['id']]
+        for keys in self._index(trans):
+            keys.remove((trans['date'], trans['id']))
+        postings = self._postings[trans['user_id']]
+        for word in set(stems(trans['description'])):
+            postings[word].discard(trans['id'])
+            if not postings[word]:
+                del postings[word]
+        descriptions = self._descriptions[trans['user_id']]
+        index = bisect.bisect_left(descriptions, self._description_entry(trans))
+        if index < len(descriptions) and descriptions[index][2] == trans['id']:
+            del descriptions[index]
+
+    @staticmethod
+    def _description_entry(trans: Dict[str, Any]) -> Tuple[str, str, str]:
+        return search_key(trans['description']), trans['date'], trans['id']
+
+    def _owned(self, user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+        trans = self._transactions.get(transaction_id)
+        return trans if trans is not None and trans['user_id'] == user_id else None
+
+    def _scan(self, filter: TransactionFilter, after: Optional[PageKey] = None) -> Iterator[Dict[str, Any]]:
+        """Matching transactions newest first, walking the narrowest index available.
+
+        Several categories (or types) walk one index each and merge the walks.
+        """
+        if filter.categories:
+            indexes = [self._by_user_category.get((filter.user_id, c)) for c in filter.categories]
+        elif filter.types:
+            indexes = [self._by_user_type.get((filter.user_id, t)) for t in filter.types]
+        else:
+            indexes = [self._by_user.get(filter.user_id)]
+        walks = [keys.descending(filter.date_from, filter.date_to, after) for keys in indexes if keys is not None]
+        for _, transaction_id in walks[0] if len(walks) == 1 else heapq.merge(*walks, reverse=True):
+            trans = self._transactions[transaction_id]
+            if filter.matches(trans):
+                yield trans
+
+    async def insert_transaction(self, trans: Dict[str, Any]) -> None:
+        self._add(trans)
+
+    async def insert_transactions(self, batch: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        failures = []
+        for index, trans in enumerate(batch):
+            try:
+                self._add(trans)
+            except DuplicateKeyError as e:
+                failures.append((index, str(e)))
+        return failures
+
+    async def find_transactions(
+        self, filter: TransactionFilter, limit: int, after: Optional[PageKey] = None
+    ) -> List[Dict[str, Any]]:
+        result = []
+        for trans in self._scan(filter, after):
+            result.append(dict(trans))
+            if len(result) >= limit:
+                break
+        return result
+
+    async def iter_transactions(self, filter: TransactionFilter, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        # Page by key so concurrent writes between batches cannot break the scan
+        after = None
+        while True:
+            batch = await self.find_transactions(filter, batch_size, after)
+            for trans in batch:
+                yield trans
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1]['date'], batch[-1]['id'])
+
+    async def transaction_columns(self, filter: TransactionFilter, batch_size: int) -> Dict[str, List[Any]]:
+        # Nothing to batch in-process; one pass over the index reads a consistent snapshot
+        rows = list(self._scan(filter))
+        return {field: [trans[field] for trans in rows] for field in COLUMN_FIELDS}
+
+    async def get_transactions(self, user_id: str, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        return [dict(trans) for trans in (self._owned(user_id, tid) for tid in ids) if trans is not None]
+
+    def _replace(self, before: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+        after = {**before, **fields, 'revision': before['revision'] + 1}
+        self._remove(before)
+        self._add(after)
+        return after
+
+    async def update_transaction(
+        self,
+        user_id: str,
+        transaction_id: str,
+        fields: Dict[str, Any],
+        expected_revision: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        before = self._owned(user_id, transaction_id)
+        if before is None:
+            return None
+        if expected_revision is not None and before['revision'] != expected_revision:
+            raise RevisionConflictError(before['revision'])
+        after = self._replace(before, fields) if fields else before
+        return dict(before), dict(after)
+
+    async def delete_transaction(self, user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+        trans = self._owned(user_id, transaction_id)
+        if trans is not None:
+            self._remove(trans)
+        return trans
+
+    async def bulk_write(
+        self, user_id: str, updates: Dict[str, Dict[str, Any]], deletes: Sequence[str]
+    ) -> BulkOutcome:
+        before = {}
+        for transaction_id in [*updates, *deletes]:
+            trans = self._owned(user_id, transaction_id)
+            if trans is not None:
+                before[transaction_id] = dict(trans)
+        for transaction_id, fields in updates.items():
+            if transaction_id in before and fields:
+                self._replace(self._transactions[transaction_id], fields)
+        for transaction_id in deletes:
+            if transaction_id in self._transactions and transaction_id in before:
+                self._remove(self._transactions[transaction_id])
+        return BulkOutcome(before)
+
+    # Search
+
+    async def search_transactions(
+        self, user_id: str, terms: Sequence[str], limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        postings = self._postings.get(user_id, {})
+        total = len(self._by_user.get(user_id, ()))
+        scores: Dict[str, float] = defaultdict(float)
+        for word in dict.fromkeys(stem(term) for term in terms if term not in _STOP_WORDS):
+            ids = postings.get(word)
+            if not ids:
+                continue
+            # Rarer words weigh more
+            weight = math.log(1 + total / len(ids))
+            for transaction_id in ids:
+                scores[transaction_id] += weight
+        ranked = heapq.nlargest(
+            offset + limit,
+            scores,
+            key=lambda tid: (scores[tid], self._transactions[tid]['date'], tid),
+        )
+        return [
+            {**self._transactions[transaction_id], "score": scores[transaction_id]}
+            for transaction_id in ranked[offset:]
+        ]
+
+    async def suggest_descriptions(self, user_id: str, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        descriptions = self._descriptions.get(user_id, [])
+        key = search_key(prefix)
+        start = bisect.bisect_left(descriptions, (key,))
+        end = min(bisect.bisect_left(descriptions, (key + _MAX_ID,)), start + SUGGEST_SCAN_LIMIT)
+        # Entries are in (key, date) order, so the last one seen per key is the most recent
+        groups: Dict[str, Dict[str, Any]] = {}
+        for description, _, transaction_id in descriptions[start:end]:
+            trans = self._transactions[transaction_id]
+            group = groups.setdefault(description, {"count": 0})
+            group.update(value=trans['description'], category=trans['category'], count=group['count'] + 1)
+        ranked = sorted(groups.items(), key=lambda item: (-item[1]['count'], item[0]))
+        return [group for _, group in ranked[:limit]]
+
+    # Rollups
+
+    async def get_rollup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        rollup = self._rollups.get(user_id)
+        return copy.deepcopy(rollup) if rollup is not None else None
+
+    async def replace_rollup(self, user_id: str, rollup: Dict[str, Any]) -> None:
+        self._rollups[user_id] = copy.deepcopy(rollup)
+
+    async def apply_rollup_deltas(self, user_id: str, deltas: RollupDeltas) -> None:
+        rollup = self._rollups.setdefault(user_id, {"user_id": user_id, "categories": {}})
+        for (type, category, currency), (total_micros, count) in deltas.items():
+            currencies = rollup['categories'].setdefault(type, {}).setdefault(category, {})
+            bucket = currencies.setdefault(currency, {"total_micros": 0, "count": 0})
+            bucket['total_micros'] += total_micros
+            bucket['count'] += count
+
+    async def aggregate_rollup(self, filter: TransactionFilter) -> Dict[str, Any]:
+        rollup = empty_rollup(filter.user_id)
+        for trans in self._scan(filter):
+            currencies = rollup['categories'].setdefault(trans['type'], {}).setdefault(trans['category'], {})
+            bucket = currencies.setdefault(trans['currency'] or "", {"total_micros": 0, "count": 0})
+            bucket['total_micros'] += to_micros(trans['amount'])
+            bucket['count'] += 1
+        return rollup
+
+    async def aggregate_timeseries(self, filter: TransactionFilter, bucket: str) -> List[Dict[str, Any]]:
+        groups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        starts: Dict[str, str] = {}
+        for trans in self._scan(filter):
+            start = starts.get(trans['date'])
+            if start is None:
+                start = starts[trans['date']] = bucket_start(parse_date(trans['date']), bucket).isoformat()
+            key = (start, trans['type'], trans['category'])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "start": start, "type": key[1], "category": key[2], "total_micros": 0, "count": 0
+                }
+            group['total_micros'] += to_micros(trans['amount'])
+            group['count'] += 1
+        return list(groups.values())
+
+    async def aggregate_daily(self, filter: TransactionFilter) -> List[Dict[str, Any]]:
+        groups: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+        for trans in self._scan(filter):
+            key = (trans['date'], trans['currency'] or "", trans['type'], trans['category'])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "date": key[0], "currency": key[1], "type": key[2], "category": key[3], "total_micros": 0, "count": 0
+                }
+            group['total_micros'] += to_micros(trans['amount'])
+            group['count'] += 1
+        return list(groups.values())
+
+    # Recurring rules
+
+    def _set_next_date(self, rule: Dict[str, Any], next_date: Optional[str]) -> None:
+        if rule['next_date'] is not None:
+            self._rules_due.remove((rule['next_date'], rule['id']))
+        rule['next_date'] = next_date
+        if next_date is not None:
+            self._rules_due.add((next_date, rule['id']))
+
+    async def insert_rule(self, rule: Dict[str, Any]) -> None:
+        if rule['id'] in self._rules:
+            raise DuplicateKeyError(f"rule {rule['id']} already exists")
+        stored = {**rule, "next_date": None}
+        self._rules[rule['id']] = stored
+        self._set_next_date(stored, rule['next_date'])
+
+    def _owned_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        rule = self._rules.get(rule_id)
+        return rule if rule is not None and rule['user_id'] == user_id else None
+
+    async def list_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        rules = [dict(rule) for rule in self._rules.values() if rule['user_id'] == user_id]
+        rules.sort(key=lambda rule: (rule['created_at'], rule['id']))
+        return rules
+
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        rule = self._owned_rule(user_id, rule_id)
+        return dict(rule) if rule is not None else None
+
+    async def update_rule(self, user_id: str, rule_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        rule = self._owned_rule(user_id, rule_id)
+        if rule is None:
+            return None
+        if 'next_date' in fields:
+            self._set_next_date(rule, fields['next_date'])
+        rule.update({k: v for k, v in fields.items() if k != 'next_date'})
+        return dict(rule)
+
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        rule = self._owned_rule(user_id, rule_id)
+        if rule is None:
+            return False
+        self._set_next_date(rule, None)
+        del self._rules[rule_id]
+        return True
+
+    async def due_rules(self, date: str, limit: int) -> List[Dict[str, Any]]:
+        result = []
+        for _, rule_id in self._rules_due.ascending(date):
+            result.append(dict(self._rules[rule_id]))
+            if len(result) >= limit:
+                break
+        return result
+
+    async def advance_rules(self, advances: Sequence[RuleAdvance]) -> int:
+        advanced = 0
+        for rule_id, expected, next_date, occurrences in advances:
+            rule = self._rules.get(rule_id)
+            if rule is None or rule['next_date'] != expected:
+                continue
+            self._set_next_date(rule, next_date)
+            rule['occurrences'] = occurrences
+            advanced += 1
+        return advanced
@@ -0,0 +1,560 @@
+"""MongoDB storage engine (Motor).
+
+Transaction dates are stored as BSON dates (see dates.py) and rendered
+back to strings in the find projection; aggregations sum the integer
+``amount_micros`` stored beside each amount; rollups live one document per
+user with categories escaped into field names; recurring rules keep
+their dates as strings, which compare in date order; indexes come from
+indexes.py and are ensured on connect. Given a metrics registry, every
+command's duration and document count is recorded through the driver's
+command monitoring.
+"""
+from datetime import datetime, timezone
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING, DeleteOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError as MongoDuplicateKeyError
+
+from dates import DATE_FORMAT, DATE_STRING_EXPR, to_bson_date
+from indexes import ensure_indexes
+from metrics import Registry
+from money import MICROS, with_micros
+from storage.base import (
+    COLUMN_FIELDS,
+    INITIAL_REVISION,
+    SUGGEST_SCAN_LIMIT,
+    VERSION_OP,
+    BulkOutcome,
+    DuplicateKeyError,
+    PageKey,
+    RevisionConflictError,
+    RollupDeltas,
+    RuleAdvance,
+    Storage,
+    TransactionFilter,
+    empty_rollup,
+    search_key,
+)
+
+# Transactions are read with date rendered back to YYYY-MM-DD (see dates.py)
+TRANSACTION_PROJECTION = {
+    "_id": 0, "id": 1, "user_id": 1, "type": 1, "description": 1,
+    "category": 1, "amount": 1, "created_at": 1, "date": DATE_STRING_EXPR,
+    "currency": {"$ifNull": ["$currency", None]},
+    "revision": {"$ifNull": ["$revision", 0]},
+}
+COLUMN_PROJECTION = {
+    "_id": 0, "id": 1, "date": DATE_STRING_EXPR, "type": 1, "category": 1, "amount": 1,
+    "currency": {"$ifNull": ["$currency", None]},
+}
+# Groups transactions without a currency under ""
+CURRENCY_KEY_EXPR = {"$ifNull": ["$currency", ""]}
+# Exact integer amount; documents written before amount_micros existed derive it
+AMOUNT_MICROS_EXPR = {
+    "$ifNull": ["$amount_micros", {"$toLong": {"$round": [{"$multiply": ["$amount", MICROS]}, 0]}}]
+}
+TRANSACTION_SORT = [("date", DESCENDING), ("id", DESCENDING)]
+RULE_PROJECTION = {"_id": 0}
+
+_EMPTY_KEY = "%"
+
+
+def encode_key(category: str) -> str:
+    """Make a category name safe to use as a MongoDB field name."""
+    if category == "":
+        return _EMPTY_KEY
+    return category.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_key(key: str) -> str:
+    return "" if key == _EMPTY_KEY else unquote(key)
+
+
+def to_document(trans: Dict[str, Any]) -> Dict[str, Any]:
+    """Storage form of a transaction, with ``date`` as a BSON date and a prefix-search key."""
+    doc = with_micros(trans)
+    doc['date'] = to_bson_date(doc['date'])
+    doc['description_key'] = search_key(doc['description'])
+    doc.setdefault('revision', INITIAL_REVISION)
+    return doc
+
+
+def build_query(filter: TransactionFilter, after: Optional[PageKey] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_id": filter.user_id}
+    # Single values stay plain equalities; several become $in, which the
+    # (user_id, type, category) index still serves as a set of point ranges
+    if filter.types:
+        query["type"] = filter.types[0] if len(filter.types) == 1 else {"$in": list(filter.types)}
+    if filter.categories:
+        query["category"] = filter.categories[0] if len(filter.categories) == 1 else {"$in": list(filter.categories)}
+    if filter.currencies:
+        # null also matches documents written before currencies existed
+        currencies = [currency or None for currency in filter.currencies]
+        query["currency"] = currencies[0] if len(currencies) == 1 else {"$in": currencies}
+    if filter.date_from or filter.date_to:
+        query["date"] = {}
+        if filter.date_from:
+            query["date"]["$gte"] = to_bson_date(filter.date_from)
+        if filter.date_to:
+            query["date"]["$lte"] = to_bson_date(filter.date_to)
+    if filter.min_amount is not None or filter.max_amount is not None:
+        query["amount"] = {}
+        if filter.min_amount is not None:
+            query["amount"]["$gte"] = filter.min_amount
+        if filter.max_amount is not None:
+            query["amount"]["$lte"] = filter.max_amount
+    if filter.description:
+        query["description"] = {"$regex": re.escape(filter.description), "$options": "i"}
+    if after is not None:
+        date = to_bson_date(after[0])
+        query["$or"] = [
+            {"date": {"$lt": date}},
+            {"date": date, "id": {"$lt": after[1]}},
+        ]
+    return query
+
+
+def bucket_expr(bucket: str) -> Dict[str, Any]:
+    """The start of a transaction's time bucket as YYYY-MM-DD, for unmigrated string dates too."""
+    date: Dict[str, Any] = {
+        "$cond": [{"$eq": [{"$type": "$date"}, "date"]}, "$date", {"$dateFromString": {"dateString": "$date"}}]
+    }
+    if bucket == "week":
+        # $dayOfWeek is 1 for Sunday; step back to Monday
+        days_since_monday = {"$mod": [{"$add": [{"$dayOfWeek": date}, 5]}, 7]}
+        date = {"$subtract": [date, {"$multiply": [days_since_monday, 24 * 60 * 60 * 1000]}]}
+    elif bucket == "month":
+        date = {"$dateFromParts": {"year": {"$year": date}, "month": {"$month": date}}}
+    return {"$dateToString": {"format": DATE_FORMAT, "date": date}}
+
+
+def to_update(fields: Dict[str, Any]) -> Dict[str, Any]:
+    update = with_micros(fields)
+    if 'date' in update:
+        update['date'] = to_bson_date(update['date'])
+    if 'description' in update:
+        update['description_key'] = search_key(update['description'])
+    return update
+
+
+def _decode_rollup(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc['categories'] = {
+        type: {
+            decode_key(key): {decode_key(currency): bucket for currency, bucket in currencies.items()}
+            for key, currencies in buckets.items()
+        }
+        for type, buckets in doc.get('categories', {}).items()
+    }
+    return doc
+
+
+def _encode_rollup(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **rollup,
+        "categories": {
+            type: {
+                encode_key(category): {encode_key(currency): bucket for currency, bucket in currencies.items()}
+                for category, currencies in buckets.items()
+            }
+            for type, buckets in rollup['categories'].items()
+        },
+    }
+
+
+def _documents(reply: Dict[str, Any]) -> int:
+    """Documents a command returned (reads) or touched (writes)."""
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "value" in reply:
+        return 1 if reply["value"] is not None else 0
+    return reply.get("n", 0)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-command latency and document counts, labelled by command and collection.
+
+    Events are delivered on the driver's threads; the collection is only
+    present on the started event, so it is held by request id until the
+    command finishes.
+    """
+
+    def __init__(self, registry: Registry):
+        labels = ("command", "collection")
+        self.duration = registry.histogram(
+            "mongo_command_duration_seconds", "MongoDB command round-trip time", labels
+        )
+        self.documents = registry.counter(
+            "mongo_command_documents_total", "Documents returned or written by MongoDB commands", labels
+        )
+        self.failures = registry.counter("mongo_command_failures_total", "Failed MongoDB commands", labels)
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore names its cursor id here and the collection separately
+            target = event.command.get("collection", "")
+        self._collections[event.request_id] = target
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        self.duration.observe(event.duration_micros / 1e6, event.command_name, collection)
+        documents = _documents(event.reply)
+        if documents:
+            self.documents.inc(event.command_name, collection, amount=documents)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        self.duration.observe(event.duration_micros / 1e6, event.command_name, collection)
+        self.failures.inc(event.command_name, collection)
+
+
+class MongoStorage(Storage):
+    name = "mongo"
+
+    def __init__(self, url: str, db_name: str, metrics: Optional[Registry] = None, **client_options: Any):
+        if metrics is not None:
+            client_options["event_listeners"] = [*client_options.get("event_listeners", []), CommandMetrics(metrics)]
+        self.client = AsyncIOMotorClient(url, tz_aware=True, **client_options)
+        self.db = self.client[db_name]
+
+    async def connect(self) -> None:
+        await ensure_indexes(self.db)
+
+    async def close(self) -> None:
+        self.client.close()
+
+    # Users
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        try:
+            await self.db.users.insert_one(dict(user))
+        except MongoDuplicateKeyError as e:
+            raise DuplicateKeyError(str(e))
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self.db.users.find_one({"email": email}, {"_id": 0})
+
+    async def list_user_ids(self) -> List[str]:
+        return [user['id'] async for user in self.db.users.find({}, {"_id": 0, "id": 1})]
+
+    async def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        result = await self.db.users.update_one({"id": user_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    # Data versions and the change log
+
+    async def get_data_version(self, user_id: str) -> int:
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "data_version": 1})
+        return (user or {}).get('data_version', 0)
+
+    async def record_changes(self, user_id: str, upserted: Sequence[str] = (), deleted: Sequence[str] = ()) -> int:
+        user = await self.db.users.find_one_and_update(
+            {"id": user_id},
+            {"$inc": {"data_version": 1}},
+            projection={"_id": 0, "data_version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        version = user['data_version'] if user else 0
+        now = datetime.now(timezone.utc)
+        changes = (("upsert", upserted), ("delete", deleted)) if upserted or deleted else ((VERSION_OP, [VERSION_OP]),)
+        entries = [
+            {"user_id": user_id, "seq": version, "transaction_id": transaction_id, "op": op, "at": now}
+            for op, ids in changes
+            for transaction_id in ids
+        ]
+        if entries:
+            await self.db.transaction_changes.insert_many(entries, ordered=False)
+        return version
+
+    async def list_changes(self, user_id: str, seq: int, after_id: str, limit: int) -> List[Dict[str, Any]]:
+        query = {"user_id": user_id, "$or": [
+            {"seq": {"$gt": seq}},
+            {"seq": seq, "transaction_id": {"$gt": after_id}},
+        ]}
+        return await self.db.transaction_changes.find(
+            query, {"_id": 0, "seq": 1, "transaction_id": 1, "op": 1}
+        ).sort([("seq", 1), ("transaction_id", 1)]).limit(limit).to_list(None)
+
+    # Transactions
+
+    async def insert_transaction(self, trans: Dict[str, Any]) -> None:
+        await self.db.transactions.insert_one(to_document(trans))
+
+    async def insert_transactions(self, batch: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        try:
+            await self.db.transactions.insert_many([to_document(trans) for trans in batch], ordered=False)
+        except BulkWriteError as e:
+            return [
+                (write_error["index"], write_error.get("errmsg", "Write failed"))
+                for write_error in e.details.get("writeErrors", [])
+            ]
+        return []
+
+    async def find_transactions(
+        self, filter: TransactionFilter, limit: int, after: Optional[PageKey] = None
+    ) -> List[Dict[str, Any]]:
+        find = self.db.transactions.find(build_query(filter, after), TRANSACTION_PROJECTION).sort(TRANSACTION_SORT)
+        return await find.limit(limit).to_list(None)
+
+    async def iter_transactions(self, filter: TransactionFilter, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        cursor = self.db.transactions.find(build_query(filter), TRANSACTION_PROJECTION)
+        async for trans in cursor.sort(TRANSACTION_SORT).batch_size(batch_size):
+            yield trans
+
+    async def transaction_columns(self, filter: TransactionFilter, batch_size: int) -> Dict[str, List[Any]]:
+        columns: Dict[str, List[Any]] = {field: [] for field in COLUMN_FIELDS}
+        cursor = self.db.transactions.find(build_query(filter), COLUMN_PROJECTION).batch_size(batch_size)
+        while True:
+            batch = await cursor.to_list(batch_size)
+            if not batch:
+                return columns
+            for field in COLUMN_FIELDS:
+                columns[field].extend([doc[field] for doc in batch])
+
+    async def get_transactions(self, user_id: str, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        return await self.db.transactions.find(
+            {"id": {"$in": list(ids)}, "user_id": user_id}, TRANSACTION_PROJECTION
+        ).to_list(None)
+
+    async def update_transaction(
+        self,
+        user_id: str,
+        transaction_id: str,
+        fields: Dict[str, Any],
+        expected_revision: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        owned = {"id": transaction_id, "user_id": user_id}
+        query = dict(owned)
+        if expected_revision is not None:
+            # Rows from before revisions existed have no field and count as 0
+            query["revision"] = expected_revision or {"$in": [0, None]}
+
+        # One round trip: the pre-image feeds the rollup deltas, the new row is derived from it
+        if fields:
+            before = await self.db.transactions.find_one_and_update(
+                query,
+                {"$set": to_update(fields), "$inc": {"revision": 1}},
+                projection=TRANSACTION_PROJECTION,
+                return_document=ReturnDocument.BEFORE,
+            )
+        else:
+            before = await self.db.transactions.find_one(query, TRANSACTION_PROJECTION)
+
+        if before is None:
+            if expected_revision is None:
+                return None
+            # Only a failed conditional write pays for telling a conflict from a miss
+            current = await self.db.transactions.find_one(owned, {"_id": 0, "revision": 1})
+            if current is None:
+                return None
+            raise RevisionConflictError(current.get("revision", 0))
+        if not fields:
+            return before, dict(before)
+        return before, {**before, **fields, "revision": before['revision'] + 1}
+
+    async def delete_transaction(self, user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.transactions.find_one_and_delete(
+            {"id": transaction_id, "user_id": user_id}, TRANSACTION_PROJECTION
+        )
+
+    async def bulk_write(
+        self, user_id: str, updates: Dict[str, Dict[str, Any]], deletes: Sequence[str]
+    ) -> BulkOutcome:
+        ids = [*updates, *deletes]
+        if not ids:
+            return BulkOutcome({})
+        found = await self.db.transactions.find(
+            {"id": {"$in": ids}, "user_id": user_id}, TRANSACTION_PROJECTION
+        ).to_list(None)
+        before = {trans['id']: trans for trans in found}
+
+        def unchanged(trans: Dict[str, Any]) -> Dict[str, Any]:
+            # Only while the row is still the one read above; rows from before revisions read as 0
+            return {"id": trans['id'], "user_id": user_id, "revision": trans['revision'] or {"$in": [0, None]}}
+
+        updated = [transaction_id for transaction_id, fields in updates.items() if transaction_id in before and fields]
+        deleted = [transaction_id for transaction_id in deletes if transaction_id in before]
+        requests: List[Any] = [
+            UpdateOne(
+                unchanged(before[transaction_id]),
+                {"$set": to_update(updates[transaction_id]), "$inc": {"revision": 1}},
+            )
+            for transaction_id in updated
+        ]
+        requests.extend(DeleteOne(unchanged(before[transaction_id])) for transaction_id in deleted)
+        if not requests:
+            return BulkOutcome(before)
+        result = await self.db.transactions.bulk_write(requests, ordered=False)
+        if result.matched_count == len(updated) and result.deleted_count == len(deleted):
+            return BulkOutcome(before)
+
+        # A write landed between the read and the batch, and the batch result cannot say
+        # which rows it missed: rows now exactly as the batch would leave them count as
+        # written, the rest as conflicts, and ``before`` no longer makes exact deltas
+        current = {
+            trans['id']: trans for trans in await self.db.transactions.find(
+                {"id": {"$in": [*updated, *deleted]}, "user_id": user_id}, TRANSACTION_PROJECTION
+            ).to_list(None)
+        }
+        conflicts = {transaction_id for transaction_id in deleted if transaction_id in current}
+        conflicts.update(
+            transaction_id for transaction_id in updated
+            if current.get(transaction_id) != {
+                **before[transaction_id], **updates[transaction_id], "revision": before[transaction_id]['revision'] + 1
+            }
+        )
+        return BulkOutcome(before, conflicts, exact=False)
+
+    # Search
+
+    async def search_transactions(
+        self, user_id: str, terms: Sequence[str], limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        if not terms:
+            return []
+        # The text index leads with user_id, so the equality keeps the scan to one user;
+        # terms are plain words, so $search ORs them with no phrase or negation syntax
+        score = {"$meta": "textScore"}
+        cursor = self.db.transactions.find(
+            {"user_id": user_id, "$text": {"$search": " ".join(terms)}},
+            {**TRANSACTION_PROJECTION, "score": score},
+        ).sort([("score", score), *TRANSACTION_SORT]).skip(offset).limit(limit)
+        return await cursor.to_list(None)
+
+    async def suggest_descriptions(self, user_id: str, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        # An anchored, case-sensitive regex on the lowercased key is an index range scan
+        pipeline = [
+            {"$match": {"user_id": user_id, "description_key": {"$regex": "^" + re.escape(search_key(prefix))}}},
+            {"$sort": {"description_key": 1, "date": 1}},
+            {"$limit": SUGGEST_SCAN_LIMIT},
+            {"$group": {
+                "_id": "$description_key",
+                "value": {"$last": "$description"},
+                "category": {"$last": "$category"},
+                "count": {"$sum": 1},
+            }},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "value": 1, "category": 1, "count": 1}},
+        ]
+        return await self.db.transactions.aggregate(pipeline).to_list(None)
+
+    # Rollups
+
+    async def get_rollup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.rollups.find_one({"user_id": user_id}, {"_id": 0})
+        return _decode_rollup(doc) if doc is not None else None
+
+    async def replace_rollup(self, user_id: str, rollup: Dict[str, Any]) -> None:
+        await self.db.rollups.replace_one({"user_id": user_id}, _encode_rollup(rollup), upsert=True)
+
+    async def apply_rollup_deltas(self, user_id: str, deltas: RollupDeltas) -> None:
+        inc: Dict[str, int] = {}
+        for (type, category, currency), (total_micros, count) in deltas.items():
+            prefix = f"categories.{type}.{encode_key(category)}.{encode_key(currency)}"
+            inc[f"{prefix}.total_micros"] = total_micros
+            inc[f"{prefix}.count"] = count
+        if inc:
+            await self.db.rollups.update_one({"user_id": user_id}, {"$inc": inc}, upsert=True)
+
+    async def aggregate_rollup(self, filter: TransactionFilter) -> Dict[str, Any]:
+        pipeline = [
+            {"$match": build_query(filter)},
+            {"$group": {
+                "_id": {"type": "$type", "category": "$category", "currency": CURRENCY_KEY_EXPR},
+                "total_micros": {"$sum": AMOUNT_MICROS_EXPR},
+                "count": {"$sum": 1},
+            }},
+        ]
+        rollup = empty_rollup(filter.user_id)
+        async for group in self.db.transactions.aggregate(pipeline):
+            key = group['_id']
+            currencies = rollup['categories'].setdefault(key['type'], {}).setdefault(key['category'], {})
+            currencies[key['currency']] = {
+                "total_micros": group['total_micros'],
+                "count": group['count'],
+            }
+        return rollup
+
+    async def aggregate_timeseries(self, filter: TransactionFilter, bucket: str) -> List[Dict[str, Any]]:
+        pipeline = [
+            {"$match": build_query(filter)},
+            {"$group": {
+                "_id": {"start": bucket_expr(bucket), "type": "$type", "category": "$category"},
+                "total_micros": {"$sum": AMOUNT_MICROS_EXPR},
+                "count": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0, "start": "$_id.start", "type": "$_id.type", "category": "$_id.category",
+                "total_micros": 1, "count": 1,
+            }},
+        ]
+        return await self.db.transactions.aggregate(pipeline).to_list(None)
+
+    async def aggregate_daily(self, filter: TransactionFilter) -> List[Dict[str, Any]]:
+        pipeline = [
+            {"$match": build_query(filter)},
+            {"$group": {
+                "_id": {
+                    "date": DATE_STRING_EXPR, "currency": CURRENCY_KEY_EXPR,
+                    "type": "$type", "category": "$category",
+                },
+                "total_micros": {"$sum": AMOUNT_MICROS_EXPR},
+                "count": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0, "date": "$_id.date", "currency": "$_id.currency",
+                "type": "$_id.type", "category": "$_id.category", "total_micros": 1, "count": 1,
+            }},
+        ]
+        return await self.db.transactions.aggregate(pipeline).to_list(None)
+
+    # Recurring rules
+
+    async def insert_rule(self, rule: Dict[str, Any]) -> None:
+        try:
+            await self.db.recurring_rules.insert_one(dict(rule))
+        except MongoDuplicateKeyError as e:
+            raise DuplicateKeyError(str(e))
+
+    async def list_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        find = self.db.recurring_rules.find({"user_id": user_id}, RULE_PROJECTION)
+        return await find.sort([("created_at", 1), ("id", 1)]).to_list(None)
+
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.recurring_rules.find_one({"id": rule_id, "user_id": user_id}, RULE_PROJECTION)
+
+    async def update_rule(self, user_id: str, rule_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not fields:
+            return await self.get_rule(user_id, rule_id)
+        return await self.db.recurring_rules.find_one_and_update(
+            {"id": rule_id, "user_id": user_id}, {"$set": fields},
+            projection=RULE_PROJECTION, return_document=ReturnDocument.AFTER
+        )
+
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        result = await self.db.recurring_rules.delete_one({"id": rule_id, "user_id": user_id})
+        return result.deleted_count > 0
+
+    async def due_rules(self, date: str, limit: int) -> List[Dict[str, Any]]:
+        find = self.db.recurring_rules.find({"next_date": {"$lte": date}}, RULE_PROJECTION)
+        return await find.sort([("next_date", 1), ("id", 1)]).limit(limit).to_list(None)
+
+    async def advance_rules(self, advances: Sequence[RuleAdvance]) -> int:
+        if not advances:
+            return 0
+        result = await self.db.recurring_rules.bulk_write([
+            UpdateOne({"id": rule_id, "next_date": expected}, {"$set": {"next_date": next_date, "occurrences": occurrences}})
+            for rule_id, expected, next_date, occurrences in advances
+        ], ordered=False)
+        return result.modified_count
@@ -0,0 +1,781 @@
+"""SQLite storage engine (stdlib ``sqlite3``).
+
+One connection in WAL mode, driven from a single worker thread so the
+event loop never blocks on disk and writes are serialized without extra
+locking. Dates are stored as ``YYYY-MM-DD`` text, which sorts and
+range-compares correctly, and ``created_at`` as ISO-8601 text.
+
+Description search uses an FTS5 table with the porter stemmer, kept in
+step with ``transactions`` by triggers. Each transaction records the row
+of its FTS entry in ``fts_rowid``; the implicit rowid of ``transactions``
+itself is not stable across VACUUM, so it cannot be the link.
+
+Amounts are kept twice: ``amount`` as REAL for reads and range filters,
+and ``amount_micros`` as INTEGER, which every total is summed from.
+
+Recurring rules live in ``recurring_rules``; a partial index over rules
+with a ``next_date`` keeps the scheduler's due scan to the rules it needs.
+"""
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from dates import to_bson_datetime
+from money import MICROS, with_micros
+from storage.base import (
+    CHANGE_LOG_RETENTION_SECONDS,
+    COLUMN_FIELDS,
+    INITIAL_REVISION,
+    SUGGEST_SCAN_LIMIT,
+    VERSION_OP,
+    BulkOutcome,
+    DuplicateKeyError,
+    PageKey,
+    RevisionConflictError,
+    RollupDeltas,
+    RuleAdvance,
+    Storage,
+    TransactionFilter,
+    empty_rollup,
+)
+
+T = TypeVar("T")
+
+# Expired change log entries are purged every this many change batches
+CHANGE_LOG_PURGE_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT,
+    created_at TEXT NOT NULL,
+    data_version INTEGER NOT NULL DEFAULT 0,
+    base_currency TEXT
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    fts_rowid INTEGER,
+    amount_micros INTEGER,
+    currency TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_user_date_id ON transactions (user_id, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_user_type_category ON transactions (user_id, type, category);
+CREATE INDEX IF NOT EXISTS transactions_user_category_date_id ON transactions (user_id, category, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_user_description ON transactions (user_id, lower(description), date);
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id TEXT PRIMARY KEY,
+    ready INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rollup_buckets (
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total_micros INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, type, category, currency)
+);
+CREATE TABLE IF NOT EXISTS transaction_changes (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    transaction_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    at TEXT NOT NULL,
+    PRIMARY KEY (user_id, seq, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS transaction_changes_at ON transaction_changes (at);
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    currency TEXT,
+    every INTEGER NOT NULL,
+    unit TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT,
+    next_date TEXT,
+    occurrences INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recurring_rules_user ON recurring_rules (user_id, created_at);
+CREATE INDEX IF NOT EXISTS recurring_rules_due ON recurring_rules (next_date, id) WHERE next_date IS NOT NULL;
+"""
+
+# Created after columns added since the first release exist (see _migrate)
+CURRENCY_INDEX = "CREATE INDEX IF NOT EXISTS transactions_user_currency_date ON transactions (user_id, currency, date)"
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+    description, user_id UNINDEXED, transaction_id UNINDEXED, date UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+    INSERT INTO transactions_fts (description, user_id, transaction_id, date)
+    VALUES (new.description, new.user_id, new.id, new.date);
+    UPDATE transactions SET fts_rowid = last_insert_rowid() WHERE id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description, date ON transactions BEGIN
+    UPDATE transactions_fts SET description = new.description, date = new.date WHERE rowid = old.fts_rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+    DELETE FROM transactions_fts WHERE rowid = old.fts_rowid;
+END;
+"""
+
+USER_PROFILE_COLUMNS = ("base_currency",)
+
+TRANSACTION_COLUMNS = (
+    "id", "user_id", "type", "date", "description", "category", "amount", "currency", "created_at", "revision"
+)
+# Written but never read back as part of a transaction
+STORED_COLUMNS = (*TRANSACTION_COLUMNS, "amount_micros")
+_SELECT_TRANSACTIONS = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions"
+_INSERT_TRANSACTION = (
+    f"INSERT INTO transactions ({', '.join(STORED_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in STORED_COLUMNS)})"
+)
+
+
+RULE_COLUMNS = (
+    "id", "user_id", "type", "description", "category", "amount", "currency",
+    "every", "unit", "start_date", "end_date", "next_date", "occurrences", "created_at",
+)
+# Set once on insert
+_FIXED_RULE_COLUMNS = ("id", "user_id", "created_at")
+
+
+def _timestamp(value: Any) -> str:
+    return to_bson_datetime(value).isoformat()
+
+
+def _transaction_row(trans: Dict[str, Any]) -> Tuple[Any, ...]:
+    row = {**with_micros(trans), "created_at": _timestamp(trans['created_at'])}
+    row.setdefault("revision", INITIAL_REVISION)
+    row.setdefault("currency", None)
+    return tuple(row[column] for column in STORED_COLUMNS)
+
+
+def _transaction(row: sqlite3.Row) -> Dict[str, Any]:
+    trans = dict(row)
+    trans['created_at'] = datetime.fromisoformat(trans['created_at'])
+    return trans
+
+
+def _rule(row: sqlite3.Row) -> Dict[str, Any]:
+    rule = dict(row)
+    rule['created_at'] = datetime.fromisoformat(rule['created_at'])
+    return rule
+
+
+# Start of a row's time bucket; "-6 days" then "weekday 1" lands on the Monday on or before
+BUCKET_EXPRESSIONS = {
+    "day": "date",
+    "week": "date(date, '-6 days', 'weekday 1')",
+    "month": "date(date, 'start of month')",
+}
+
+
+def build_where(filter: TransactionFilter, after: Optional[PageKey] = None) -> Tuple[str, List[Any]]:
+    clauses = ["user_id = ?"]
+    params: List[Any] = [filter.user_id]
+    if filter.types:
+        clauses.append(f"type IN ({', '.join('?' * len(filter.types))})")
+        params.extend(filter.types)
+    if filter.categories:
+        clauses.append(f"category IN ({', '.join('?' * len(filter.categories))})")
+        params.extend(filter.categories)
+    if filter.currencies:
+        # Kept as separate terms so the (user_id, currency, date) index serves both
+        named = [currency for currency in filter.currencies if currency]
+        terms = [f"currency IN ({', '.join('?' * len(named))})"] if named else []
+        if "" in filter.currencies:
+            terms.append("currency IS NULL")
+        clauses.append(f"({' OR '.join(terms)})")
+        params.extend(named)
+    if filter.date_from:
+        clauses.append("date >= ?")
+        params.append(filter.date_from)
+    if filter.date_to:
+        clauses.append("date <= ?")
+        params.append(filter.date_to)
+    if filter.min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(filter.min_amount)
+    if filter.max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(filter.max_amount)
+    if filter.description:
+        clauses.append("instr(lower(description), lower(?)) > 0")
+        params.append(filter.description)
+    if after is not None:
+        # Row values compare lexicographically, matching the (date, id) sort
+        clauses.append("(date, id) < (?, ?)")
+        params.extend(after)
+    return " WHERE " + " AND ".join(clauses), params
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._change_batches = 0
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.execute(CURRENCY_INDEX)
+        conn.executescript(SEARCH_SCHEMA)
+        self._index_descriptions(conn)
+        self._conn = conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Add columns that databases created by earlier releases lack."""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(transactions)")}
+        if "revision" not in columns:
+            # Rows from before revisions existed read as revision 0
+            conn.execute("ALTER TABLE transactions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        if "fts_rowid" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN fts_rowid INTEGER")
+        if "currency" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN currency TEXT")
+        if "amount_micros" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN amount_micros INTEGER")
+            conn.execute(
+                f"UPDATE transactions SET amount_micros = CAST(round(amount * {MICROS}) AS INTEGER)"
+                " WHERE amount_micros IS NULL"
+            )
+        if "base_currency" not in {row['name'] for row in conn.execute("PRAGMA table_info(users)")}:
+            conn.execute("ALTER TABLE users ADD COLUMN base_currency TEXT")
+        if "version" not in {row['name'] for row in conn.execute("PRAGMA table_info(rollups)")}:
+            # Rollups without a version are rebuilt on their next read
+            conn.execute("ALTER TABLE rollups ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        if "currency" not in {row['name'] for row in conn.execute("PRAGMA table_info(rollup_buckets)")}:
+            # Buckets of an older shape; the rollups' old version gets them rebuilt
+            conn.execute("DROP TABLE rollup_buckets")
+            conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _index_descriptions(conn: sqlite3.Connection) -> None:
+        """Add search entries for rows written before the search table existed."""
+        rows = conn.execute(
+            "SELECT id, user_id, description, date FROM transactions WHERE fts_rowid IS NULL"
+        ).fetchall()
+        if not rows:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        for row in rows:
+            cursor = conn.execute(
+                "INSERT INTO transactions_fts (description, user_id, transaction_id, date) VALUES (?, ?, ?, ?)",
+                (row['description'], row['user_id'], row['id'], row['date']),
+            )
+            conn.execute("UPDATE transactions SET fts_rowid = ? WHERE id = ?", (cursor.lastrowid, row['id']))
+        conn.execute("COMMIT")
+
+    def _write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run ``fn`` inside one IMMEDIATE transaction on the worker thread."""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    async def connect(self) -> None:
+        await self._run(self._open)
+
+    async def close(self) -> None:
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(_close)
+        self._executor.shutdown(wait=True)
+
+    # Users
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        def _insert(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT INTO users (id, email, password_hash, created_at, data_version, base_currency)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (user['id'], user['email'], user.get('password_hash'),
+                 _timestamp(user['created_at']), user.get('data_version', 0), user.get('base_currency')),
+            )
+        try:
+            await self._run(self._write, _insert)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e))
+
+    def _fetch_user(self, column: str, value: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(f"SELECT * FROM users WHERE {column} = ?", (value,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        user['created_at'] = datetime.fromisoformat(user['created_at'])
+        return user
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user = await self._run(self._fetch_user, "id", user_id)
+        if user is not None:
+            del user['password_hash']
+        return user
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._fetch_user, "email", email)
+
+    async def list_user_ids(self) -> List[str]:
+        rows = await self._run(lambda: self._conn.execute("SELECT id FROM users ORDER BY id").fetchall())
+        return [row['id'] for row in rows]
+
+    async def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        # Only profile columns reach the SQL text; values are always bound
+        columns = [column for column in fields if column in USER_PROFILE_COLUMNS]
+        if not columns:
+            return await self.get_user(user_id) is not None
+
+        def _update(conn: sqlite3.Connection) -> bool:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            cursor = conn.execute(
+                f"UPDATE users SET {assignments} WHERE id = ?", (*(fields[column] for column in columns), user_id)
+            )
+            return cursor.rowcount > 0
+        return await self._run(self._write, _update)
+
+    # Data versions and the change log
+
+    async def get_data_version(self, user_id: str) -> int:
+        def _get():
+            row = self._conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,)).fetchone()
+            return row['data_version'] if row else 0
+        return await self._run(_get)
+
+    async def record_changes(self, user_id: str, upserted: Sequence[str] = (), deleted: Sequence[str] = ()) -> int:
+        now = datetime.now(timezone.utc)
+        self._change_batches += 1
+        purge = self._change_batches % CHANGE_LOG_PURGE_INTERVAL == 0
+        changes = (("upsert", upserted), ("delete", deleted)) if upserted or deleted else ((VERSION_OP, [VERSION_OP]),)
+
+        def _record(conn: sqlite3.Connection) -> int:
+            row = conn.execute(
+                "UPDATE users SET data_version = data_version + 1 WHERE id = ? RETURNING data_version", (user_id,)
+            ).fetchone()
+            if row is None:
+                return 0
+            version = row['data_version']
+            conn.executemany(
+                "INSERT OR REPLACE INTO transaction_changes (user_id, seq, transaction_id, op, at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (user_id, version, transaction_id, op, now.isoformat())
+                    for op, ids in changes
+                    for transaction_id in ids
+                ],
+            )
+            if purge:
+                cutoff = now - timedelta(seconds=CHANGE_LOG_RETENTION_SECONDS)
+                conn.execute("DELETE FROM transaction_changes WHERE at < ?", (cutoff.isoformat(),))
+            return version
+        return await self._run(self._write, _record)
+
+    async def list_changes(self, user_id: str, seq: int, after_id: str, limit: int) -> List[Dict[str, Any]]:
+        def _list():
+            return self._conn.execute(
+                "SELECT seq, transaction_id, op FROM transaction_changes"
+                " WHERE user_id = ? AND (seq, transaction_id) > (?, ?)"
+                " ORDER BY seq, transaction_id LIMIT ?",
+                (user_id, seq, after_id, limit),
+            ).fetchall()
+        return [dict(row) for row in await self._run(_list)]
+
+    # Transactions
+
+    async def insert_transaction(self, trans: Dict[str, Any]) -> None:
+        def _insert(conn: sqlite3.Connection):
+            conn.execute(_INSERT_TRANSACTION, _transaction_row(trans))
+        try:
+            await self._run(self._write, _insert)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e))
+
+    async def insert_transactions(self, batch: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        def _insert(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+            failures = []
+            for index, trans in enumerate(batch):
+                try:
+                    conn.execute(_INSERT_TRANSACTION, _transaction_row(trans))
+                except sqlite3.IntegrityError as e:
+                    failures.append((index, str(e)))
+            return failures
+        return await self._run(self._write, _insert)
+
+    def _find(self, filter: TransactionFilter, limit: int, after: Optional[PageKey]) -> List[Dict[str, Any]]:
+        where, params = build_where(filter, after)
+        rows = self._conn.execute(
+            f"{_SELECT_TRANSACTIONS}{where} ORDER BY date DESC, id DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [_transaction(row) for row in rows]
+
+    async def find_transactions(
+        self, filter: TransactionFilter, limit: int, after: Optional[PageKey] = None
+    ) -> List[Dict[str, Any]]:
+        return await self._run(self._find, filter, limit, after)
+
+    async def iter_transactions(self, filter: TransactionFilter, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        # Page by key instead of holding a cursor open across awaits on the worker thread
+        after = None
+        while True:
+            batch = await self.find_transactions(filter, batch_size, after)
+            for trans in batch:
+                yield trans
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1]['date'], batch[-1]['id'])
+
+    def _columns(self, filter: TransactionFilter, limit: int, after: Optional[PageKey]) -> List[Tuple[Any, ...]]:
+        where, params = build_where(filter, after)
+        cursor = self._conn.cursor()
+        # Plain tuples; sqlite3.Row costs more than the columns are worth here
+        cursor.row_factory = None
+        return cursor.execute(
+            f"SELECT {', '.join(COLUMN_FIELDS)} FROM transactions{where} ORDER BY date DESC, id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+
+    async def transaction_columns(self, filter: TransactionFilter, batch_size: int) -> Dict[str, List[Any]]:
+        columns: Dict[str, List[Any]] = {field: [] for field in COLUMN_FIELDS}
+        after = None
+        while True:
+            rows = await self._run(self._columns, filter, batch_size, after)
+            for field, values in zip(COLUMN_FIELDS, zip(*rows)):
+                columns[field].extend(values)
+            if len(rows) < batch_size:
+                return columns
+            after = (rows[-1][1], rows[-1][0])
+
+    def _get(self, user_id: str, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        # Unary + keeps the planner off the (user_id, ...) indexes, which would scan
+        # every row the user has; the primary key finds each id directly
+        rows = self._conn.execute(
+            f"{_SELECT_TRANSACTIONS} WHERE +user_id = ? AND id IN ({', '.join('?' for _ in ids)})",
+            (user_id, *ids),
+        ).fetchall()
+        return [_transaction(row) for row in rows]
+
+    async def get_transactions(self, user_id: str, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        return await self._run(self._get, user_id, list(ids))
+
+    @staticmethod
+    def _set(conn: sqlite3.Connection, transaction_id: str, fields: Dict[str, Any]) -> None:
+        # Only known columns reach the SQL text; values are always bound
+        fields = with_micros(fields)
+        columns = [column for column in fields if column in STORED_COLUMNS and column != "revision"]
+        if columns:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            conn.execute(
+                f"UPDATE transactions SET {assignments}, revision = revision + 1 WHERE id = ?",
+                (*(fields[column] for column in columns), transaction_id),
+            )
+
+    async def update_transaction(
+        self,
+        user_id: str,
+        transaction_id: str,
+        fields: Dict[str, Any],
+        expected_revision: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        def _update(conn: sqlite3.Connection):
+            found = self._get(user_id, [transaction_id])
+            if not found:
+                return None
+            before = found[0]
+            if expected_revision is not None and before['revision'] != expected_revision:
+                raise RevisionConflictError(before['revision'])
+            if not fields:
+                return before, dict(before)
+            self._set(conn, transaction_id, fields)
+            return before, {**before, **fields, 'revision': before['revision'] + 1}
+        return await self._run(self._write, _update)
+
+    async def delete_transaction(self, user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+        def _delete(conn: sqlite3.Connection):
+            row = conn.execute(
+                f"DELETE FROM transactions WHERE id = ? AND user_id = ? RETURNING {', '.join(TRANSACTION_COLUMNS)}",
+                (transaction_id, user_id),
+            ).fetchone()
+            return _transaction(row) if row is not None else None
+        return await self._run(self._write, _delete)
+
+    async def bulk_write(
+        self, user_id: str, updates: Dict[str, Dict[str, Any]], deletes: Sequence[str]
+    ) -> BulkOutcome:
+        ids = [*updates, *deletes]
+
+        def _bulk(conn: sqlite3.Connection) -> BulkOutcome:
+            before = {trans['id']: trans for trans in self._get(user_id, ids)}
+            for transaction_id, fields in updates.items():
+                if transaction_id in before:
+                    self._set(conn, transaction_id, fields)
+            conn.executemany(
+                "DELETE FROM transactions WHERE id = ? AND user_id = ?",
+                [(transaction_id, user_id) for transaction_id in deletes if transaction_id in before],
+            )
+            return BulkOutcome(before)
+        if not ids:
+            return BulkOutcome({})
+        return await self._run(self._write, _bulk)
+
+    # Search
+
+    async def search_transactions(
+        self, user_id: str, terms: Sequence[str], limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        if not terms:
+            return []
+        # Terms are plain words; quoting keeps FTS5 from reading any as syntax
+        query = "description : (" + " OR ".join(f'"{term}"' for term in terms) + ")"
+
+        def _search():
+            # Rank inside the FTS table, which carries user_id and date for filtering and
+            # tie-breaks, and only then load the page's rows; bm25 is lower-is-better
+            hits = self._conn.execute(
+                """
+                SELECT transaction_id, bm25(transactions_fts) AS rank FROM transactions_fts
+                WHERE transactions_fts MATCH ? AND user_id = ?
+                ORDER BY rank, date DESC, transaction_id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (query, user_id, limit, offset),
+            ).fetchall()
+            found = {trans['id']: trans for trans in self._get(user_id, [hit['transaction_id'] for hit in hits])}
+            return [
+                {**found[hit['transaction_id']], "score": -hit['rank']}
+                for hit in hits if hit['transaction_id'] in found
+            ]
+        return await self._run(_search)
+
+    async def suggest_descriptions(self, user_id: str, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        def _suggest():
+            # The range on lower(description) is served by transactions_user_description;
+            # with max(date), the bare columns come from each group's most recent row
+            rows = self._conn.execute(
+                """
+                SELECT description AS value, category, count(*) AS count, max(date) AS last
+                FROM (
+                    SELECT description, category, date FROM transactions
+                    WHERE user_id = ? AND lower(description) >= lower(?) AND lower(description) < lower(?) || char(1114111)
+                    ORDER BY lower(description), date
+                    LIMIT ?
+                )
+                GROUP BY lower(description)
+                ORDER BY count DESC, lower(description)
+                LIMIT ?
+                """,
+                (user_id, prefix, prefix, SUGGEST_SCAN_LIMIT, limit),
+            ).fetchall()
+            return [{"value": row['value'], "category": row['category'], "count": row['count']} for row in rows]
+        return await self._run(_suggest)
+
+    # Rollups
+
+    async def get_rollup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        def _get():
+            state = self._conn.execute(
+                "SELECT ready, version FROM rollups WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            buckets = self._conn.execute(
+                "SELECT type, category, currency, total_micros, count FROM rollup_buckets WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            return state, buckets
+        state, buckets = await self._run(_get)
+        if state is None and not buckets:
+            return None
+        rollup = empty_rollup(user_id)
+        rollup['ready'] = bool(state and state['ready'])
+        rollup['version'] = state['version'] if state else None
+        self._fill_rollup(rollup, buckets)
+        return rollup
+
+    @staticmethod
+    def _fill_rollup(rollup: Dict[str, Any], rows: List[sqlite3.Row]) -> None:
+        for row in rows:
+            currencies = rollup['categories'].setdefault(row['type'], {}).setdefault(row['category'], {})
+            currencies[row['currency']] = {"total_micros": row['total_micros'], "count": row['count']}
+
+    async def replace_rollup(self, user_id: str, rollup: Dict[str, Any]) -> None:
+        def _replace(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM rollup_buckets WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT INTO rollup_buckets (user_id, type, category, currency, total_micros, count)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (user_id, type, category, currency, bucket['total_micros'], bucket['count'])
+                    for type, buckets in rollup['categories'].items()
+                    for category, currencies in buckets.items()
+                    for currency, bucket in currencies.items()
+                ],
+            )
+            conn.execute(
+                "INSERT INTO rollups (user_id, ready, version) VALUES (?, ?, ?)"
+                " ON CONFLICT (user_id) DO UPDATE SET ready = excluded.ready, version = excluded.version",
+                (user_id, int(bool(rollup.get('ready'))), rollup['version']),
+            )
+        await self._run(self._write, _replace)
+
+    async def apply_rollup_deltas(self, user_id: str, deltas: RollupDeltas) -> None:
+        def _apply(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT INTO rollup_buckets (user_id, type, category, currency, total_micros, count)"
+                " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, type, category, currency)"
+                " DO UPDATE SET total_micros = total_micros + excluded.total_micros, count = count + excluded.count",
+                [
+                    (user_id, type, category, currency, total_micros, count)
+                    for (type, category, currency), (total_micros, count) in deltas.items()
+                ],
+            )
+        await self._run(self._write, _apply)
+
+    async def aggregate_rollup(self, filter: TransactionFilter) -> Dict[str, Any]:
+        where, params = build_where(filter)
+
+        def _aggregate():
+            return self._conn.execute(
+                "SELECT type, category, COALESCE(currency, '') AS currency,"
+                f" SUM(amount_micros) AS total_micros, COUNT(*) AS count FROM transactions{where}"
+                " GROUP BY type, category, currency",
+                params,
+            ).fetchall()
+        rollup = empty_rollup(filter.user_id)
+        self._fill_rollup(rollup, await self._run(_aggregate))
+        return rollup
+
+    async def aggregate_timeseries(self, filter: TransactionFilter, bucket: str) -> List[Dict[str, Any]]:
+        where, params = build_where(filter)
+
+        def _aggregate():
+            return self._conn.execute(
+                f"SELECT {BUCKET_EXPRESSIONS[bucket]} AS start, type, category,"
+                f" SUM(amount_micros) AS total_micros, COUNT(*) AS count FROM transactions{where}"
+                " GROUP BY start, type, category",
+                params,
+            ).fetchall()
+        return [dict(row) for row in await self._run(_aggregate)]
+
+    async def aggregate_daily(self, filter: TransactionFilter) -> List[Dict[str, Any]]:
+        where, params = build_where(filter)
+
+        def _aggregate():
+            return self._conn.execute(
+                "SELECT date, COALESCE(currency, '') AS currency, type, category,"
+                f" SUM(amount_micros) AS total_micros, COUNT(*) AS count FROM transactions{where}"
+                " GROUP BY date, currency, type, category",
+                params,
+            ).fetchall()
+        return [dict(row) for row in await self._run(_aggregate)]
+
+    # Recurring rules
+
+    async def insert_rule(self, rule: Dict[str, Any]) -> None:
+        row = {**rule, "created_at": _timestamp(rule['created_at'])}
+
+        def _insert(conn: sqlite3.Connection):
+            conn.execute(
+                f"INSERT INTO recurring_rules ({', '.join(RULE_COLUMNS)}) VALUES ({', '.join('?' for _ in RULE_COLUMNS)})",
+                tuple(row[column] for column in RULE_COLUMNS),
+            )
+        try:
+            await self._run(self._write, _insert)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e))
+
+    async def list_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        def _list():
+            return self._conn.execute(
+                f"SELECT {', '.join(RULE_COLUMNS)} FROM recurring_rules WHERE user_id = ? ORDER BY created_at, id",
+                (user_id,),
+            ).fetchall()
+        return [_rule(row) for row in await self._run(_list)]
+
+    def _get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            f"SELECT {', '.join(RULE_COLUMNS)} FROM recurring_rules WHERE id = ? AND user_id = ?", (rule_id, user_id)
+        ).fetchone()
+        return _rule(row) if row is not None else None
+
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_rule, user_id, rule_id)
+
+    async def update_rule(self, user_id: str, rule_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Only rule columns reach the SQL text; values are always bound
+        columns = [column for column in fields if column in RULE_COLUMNS and column not in _FIXED_RULE_COLUMNS]
+
+        def _update(conn: sqlite3.Connection):
+            if columns:
+                assignments = ", ".join(f"{column} = ?" for column in columns)
+                row = conn.execute(
+                    f"UPDATE recurring_rules SET {assignments} WHERE id = ? AND user_id = ?"
+                    f" RETURNING {', '.join(RULE_COLUMNS)}",
+                    (*(fields[column] for column in columns), rule_id, user_id),
+                ).fetchone()
+                return _rule(row) if row is not None else None
+            return self._get_rule(user_id, rule_id)
+        return await self._run(self._write, _update)
+
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        def _delete(conn: sqlite3.Connection) -> bool:
+            return conn.execute(
+                "DELETE FROM recurring_rules WHERE id = ? AND user_id = ?", (rule_id, user_id)
+            ).rowcount > 0
+        return await self._run(self._write, _delete)
+
+    async def due_rules(self, date: str, limit: int) -> List[Dict[str, Any]]:
+        def _due():
+            return self._conn.execute(
+                f"SELECT {', '.join(RULE_COLUMNS)} FROM recurring_rules"
+                " WHERE next_date IS NOT NULL AND next_date <= ? ORDER BY next_date, id LIMIT ?",
+                (date, limit),
+            ).fetchall()
+        return [_rule(row) for row in await self._run(_due)]
+
+    async def advance_rules(self, advances: Sequence[RuleAdvance]) -> int:
+        def _advance(conn: sqlite3.Connection) -> int:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE recurring_rules SET next_date = ?, occurrences = ? WHERE id = ? AND next_date = ?",
+                [(next_date, occurrences, rule_id, expected) for rule_id, expected, next_date, occurrences in advances],
+            )
+            return conn.total_changes - before
+        if not advances:
+            return 0
+        return await self._run(self._write, _advance)
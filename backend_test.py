@@ -220,6 +220,38 @@ class ExpenseTrackerAPITester:
         )
         return success
 
+    def test_filter_transactions_by_range(self):
+        """Test date/amount range and multi-category filters on the list and summary"""
+        success, response = self.run_test(
+            "Filter Transactions by Range",
+            "GET",
+            "transactions?from=2024-01-01&to=2024-01-31&min_amount=100&category=Food&category=Salary",
+            200
+        )
+        if not success:
+            return False
+        if any(t['amount'] < 100 or not '2024-01-01' <= t['date'] <= '2024-01-31' for t in response):
+            self.log_test("Filter Transactions by Range Content", False, "Rows outside the requested range")
+            return False
+
+        success, response = self.run_test(
+            "Filtered Summary",
+            "GET",
+            "transactions/summary?from=2024-01-15&to=2024-01-15&type=expense",
+            200
+        )
+        if success and response.get('total_income') != 0:
+            self.log_test("Filtered Summary Content", False, f"Income in an expense-only summary: {response}")
+            return False
+
+        success_invalid, _ = self.run_test(
+            "Filter with Inverted Date Range",
+            "GET",
+            "transactions?from=2024-02-01&to=2024-01-01",
+            422
+        )
+        return success and success_invalid
+
     def test_update_transaction(self):
         """Test updating a transaction"""
         if not hasattr(self, 'expense_transaction_id'):
@@ -238,6 +270,34 @@ class ExpenseTrackerAPITester:
             200,
             data=update_data
         )
+        if success:
+            self.expense_revision = response.get('revision')
+        return success
+
+    def test_conditional_update(self):
+        """Test that If-Match with a stale revision is rejected with 412"""
+        if not hasattr(self, 'expense_revision'):
+            self.log_test("Conditional Update", False, "No transaction revision to match")
+            return False
+
+        success, response = self.run_test(
+            "Conditional Update (current revision)",
+            "PUT",
+            f"transactions/{self.expense_transaction_id}",
+            200,
+            data={"amount": 55.00},
+            headers={"If-Match": f'"{self.expense_revision}"'}
+        )
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "Conditional Update (stale revision)",
+            "PUT",
+            f"transactions/{self.expense_transaction_id}",
+            412,
+            data={"amount": 60.00},
+            headers={"If-Match": f'"{self.expense_revision}"'}
+        )
         return success
 
     def test_get_summary(self):
@@ -284,6 +344,307 @@ class ExpenseTrackerAPITester:
         
         return False
 
+    def test_get_dashboard(self):
+        """Test the combined dashboard endpoint"""
+        success, response = self.run_test(
+            "Get Dashboard",
+            "GET",
+            "dashboard?limit=5",
+            200
+        )
+        
+        if success:
+            required_fields = ['user', 'transactions', 'summary', 'stats']
+            if all(field in response for field in required_fields) and len(response['transactions']['items']) <= 5:
+                return True
+            self.log_test("Dashboard Structure", False, f"Missing fields in dashboard: {required_fields}")
+        
+        return False
+
+    def test_timeseries(self):
+        """Test the zero-filled, bucketed spending series"""
+        success, response = self.run_test(
+            "Weekly Timeseries",
+            "GET",
+            "transactions/timeseries?bucket=week&from=2024-01-01&to=2024-01-31",
+            200
+        )
+        if not success:
+            return False
+        starts = response.get('starts', [])
+        if len(starts) != 5 or len(response.get('expense', [])) != len(starts):
+            self.log_test("Weekly Timeseries Shape", False, f"Expected 5 zero-filled weeks: {response}")
+            return False
+
+        success_range, _ = self.run_test(
+            "Timeseries Range Too Long",
+            "GET",
+            "transactions/timeseries?bucket=day&from=2000-01-01&to=2024-01-01",
+            422
+        )
+        return success_range
+
+    def test_analytics(self):
+        """Test the trend, category delta and anomaly analytics"""
+        success, response = self.run_test(
+            "Monthly Trends",
+            "GET",
+            "analytics/trends?period=month&window=3",
+            200
+        )
+        if success and not any(point['start'] == '2024-01-01' for point in response.get('points', [])):
+            self.log_test("Monthly Trends Content", False, f"No January 2024 point: {response}")
+            return False
+
+        success_weekly, _ = self.run_test(
+            "Weekly Trends",
+            "GET",
+            "analytics/trends?period=week",
+            200
+        )
+        success_categories, _ = self.run_test(
+            "Category Deltas",
+            "GET",
+            "analytics/categories?month=2024-01",
+            200
+        )
+        success_anomalies, response = self.run_test(
+            "Spending Anomalies",
+            "GET",
+            "analytics/anomalies",
+            200
+        )
+        if success_anomalies and 'items' not in response:
+            self.log_test("Spending Anomalies Structure", False, "Missing items")
+            return False
+        return success and success_weekly and success_categories and success_anomalies
+
+    def test_exact_amounts(self):
+        """Test that totals are exact decimal sums and currencies round-trip"""
+        for amount in (0.1, 0.2):
+            success, _ = self.run_test(
+                f"Create Small Expense {amount}",
+                "POST",
+                "transactions",
+                200,
+                data={"type": "expense", "date": "2030-02-03", "description": "Exact sum",
+                      "category": "Other", "amount": amount}
+            )
+            if not success:
+                return False
+        success, response = self.run_test(
+            "Summary Exact Total",
+            "GET",
+            "transactions/summary?from=2030-02-03&to=2030-02-03",
+            200
+        )
+        if success and response.get('total_expenses') != 0.3:
+            self.log_test("Summary Exact Total Value", False, f"Expected 0.3, got {response.get('total_expenses')}")
+            return False
+
+        # Any currency with exchange rates loaded will do
+        _, currencies = self.run_test("List Currencies", "GET", "currencies", 200)
+        currency = (currencies or ['USD'])[-1]
+        success_currency, response = self.run_test(
+            "Create Expense With Currency",
+            "POST",
+            "transactions",
+            200,
+            data={"type": "expense", "date": "2030-02-04", "description": "Hotel",
+                  "category": "Other", "amount": 120.5, "currency": currency}
+        )
+        if success_currency and response.get('currency') != currency:
+            self.log_test("Currency Round Trip", False, f"Expected {currency}, got {response.get('currency')}")
+            return False
+        success_invalid, _ = self.run_test(
+            "Invalid Currency Code",
+            "POST",
+            "transactions",
+            422,
+            data={"type": "expense", "date": "2030-02-04", "description": "Hotel",
+                  "category": "Other", "amount": 120.5, "currency": "euro"}
+        )
+        # Beyond what amount_micros can hold as a 64-bit integer
+        success_oversized, _ = self.run_test(
+            "Oversized Amount",
+            "POST",
+            "transactions",
+            422,
+            data={"type": "expense", "date": "2030-02-04", "description": "Too much",
+                  "category": "Other", "amount": 1e13}
+        )
+        return success and success_currency and success_invalid and success_oversized
+
+    def test_base_currency(self):
+        """Test reporting in the user's base currency"""
+        _, currencies = self.run_test("List Currencies", "GET", "currencies", 200)
+        base = (currencies or ['USD'])[0]
+        success, response = self.run_test(
+            "Set Base Currency",
+            "PUT",
+            "auth/me",
+            200,
+            data={"base_currency": base}
+        )
+        if success and response.get('base_currency') != base:
+            self.log_test("Base Currency Saved", False, f"Expected {base}, got {response.get('base_currency')}")
+            return False
+        success_summary, response = self.run_test("Summary In Base Currency", "GET", "transactions/summary", 200)
+        if success_summary and response.get('currency') != base:
+            self.log_test("Summary Currency", False, f"Expected {base}, got {response.get('currency')}")
+            return False
+        success_list, response = self.run_test("Transactions With Base Amounts", "GET", "transactions?limit=5", 200)
+        if success_list and any('base_amount' not in item for item in response.get('items', [])):
+            self.log_test("Base Amounts", False, "Missing base_amount")
+            return False
+        success_unknown, _ = self.run_test(
+            "Base Currency Without Rates",
+            "PUT",
+            "auth/me",
+            422,
+            data={"base_currency": "ZZZ"}
+        )
+        return success and success_summary and success_list and success_unknown
+
+    def test_conditional_get(self):
+        """Test ETag / If-None-Match on the summary endpoint"""
+        headers = {'Authorization': f'Bearer {self.token}'}
+        try:
+            first = requests.get(f"{self.base_url}/transactions/summary", headers=headers)
+            etag = first.headers.get('ETag')
+            repeat = requests.get(
+                f"{self.base_url}/transactions/summary",
+                headers={**headers, 'If-None-Match': etag or ''}
+            )
+            success = bool(etag) and repeat.status_code == 304
+            self.log_test("Conditional GET (ETag)", success, f"ETag: {etag}, repeat status: {repeat.status_code}")
+            return success
+        except Exception as e:
+            self.log_test("Conditional GET (ETag)", False, f"Error: {str(e)}")
+            return False
+
+    def test_transaction_changes(self):
+        """Test delta sync returns only what changed since the token"""
+        success, response = self.run_test("Get Sync Token", "GET", "transactions/changes", 200)
+        if not success or not response.get('reset'):
+            return False
+        token = response['sync_token']
+        
+        created, transaction = self.run_test(
+            "Create Transaction For Sync",
+            "POST",
+            "transactions",
+            200,
+            data={"type": "expense", "date": "2024-03-01", "description": "Sync check", "category": "Other", "amount": 1.0}
+        )
+        if not created:
+            return False
+        
+        success, response = self.run_test("Get Changes Since Token", "GET", f"transactions/changes?since={token}", 200)
+        if success:
+            upserted_ids = [t['id'] for t in response.get('upserts', [])]
+            if upserted_ids == [transaction['id']] and not response.get('reset'):
+                return True
+            self.log_test("Changes Content", False, f"Unexpected upserts: {upserted_ids}")
+        return False
+
+    def test_import_transactions(self):
+        """Test bulk CSV import with an invalid row and a row that is not UTF-8"""
+        csv_body = (
+            "type,date,description,category,amount\n"
+            "expense,2024-02-01,Imported groceries,Food,12.50\n"
+            "income,2024-02-01,Imported salary,Salary,1000\n"
+            "expense,2024-02-02,Bad amount,Food,not-a-number\n"
+            "expense,2024-02-03,Café,Food,3.20\n"
+        ).encode('cp1252')
+        headers = {'Authorization': f'Bearer {self.token}'}
+        try:
+            response = requests.post(
+                f"{self.base_url}/transactions/import",
+                files={'file': ('statement.csv', csv_body, 'text/csv')},
+                headers=headers
+            )
+            result = response.json() if response.status_code == 200 else {}
+            success = (
+                result.get('inserted') == 2 and result.get('failed') == 2
+                and [error['row'] for error in result['errors']] == [3, 4]
+            )
+            self.log_test("Import Transactions (CSV)", success, f"Status: {response.status_code}, result: {result}")
+            return success
+        except Exception as e:
+            self.log_test("Import Transactions (CSV)", False, f"Error: {str(e)}")
+            return False
+
+    def test_export_transactions(self):
+        """Test streaming CSV and NDJSON exports"""
+        headers = {'Authorization': f'Bearer {self.token}'}
+        try:
+            csv_response = requests.get(f"{self.base_url}/transactions/export?format=csv", headers=headers)
+            header_line = csv_response.text.splitlines()[0] if csv_response.text else ""
+            csv_ok = csv_response.status_code == 200 and header_line.startswith("id,date,type")
+            self.log_test("Export Transactions (CSV)", csv_ok, f"Status: {csv_response.status_code}")
+
+            ndjson_response = requests.get(
+                f"{self.base_url}/transactions/export?format=ndjson&type=expense", headers=headers
+            )
+            rows = [json.loads(line) for line in ndjson_response.text.splitlines() if line]
+            ndjson_ok = ndjson_response.status_code == 200 and all(row['type'] == 'expense' for row in rows)
+            self.log_test("Export Transactions (NDJSON)", ndjson_ok, f"Status: {ndjson_response.status_code}, rows: {len(rows)}")
+            return csv_ok and ndjson_ok
+        except Exception as e:
+            self.log_test("Export Transactions", False, f"Error: {str(e)}")
+            return False
+
+    def test_search_transactions(self):
+        """Test full-text search (stemmed) and description autocomplete"""
+        success, response = self.run_test(
+            "Search Transactions",
+            "GET",
+            "transactions/search?q=grocery",
+            200
+        )
+        if not success:
+            return False
+        descriptions = [item['description'] for item in response.get('items', [])]
+        if "Imported groceries" not in descriptions:
+            self.log_test("Search Transactions Content", False, f"Unexpected results: {descriptions}")
+            return False
+
+        success, response = self.run_test(
+            "Suggest Descriptions",
+            "GET",
+            "transactions/suggest?prefix=imp",
+            200
+        )
+        if success and not any(item['value'] == "Imported groceries" for item in response):
+            self.log_test("Suggest Descriptions Content", False, f"Unexpected suggestions: {response}")
+            return False
+        return success
+
+    def test_bulk_transactions(self):
+        """Test bulk recategorising by description filter plus a per-id patch"""
+        if not hasattr(self, 'expense_transaction_id'):
+            self.log_test("Bulk Transactions", False, "No transaction ID to patch")
+            return False
+
+        success, response = self.run_test(
+            "Bulk Transactions",
+            "POST",
+            "transactions/bulk",
+            200,
+            data={
+                "updates": [{"id": self.expense_transaction_id, "description": "Bulk edited"}],
+                "filter": {"description": "imported"},
+                "set": {"category": "Other"}
+            }
+        )
+        if success:
+            statuses = {item['id']: item['status'] for item in response.get('results', [])}
+            if statuses.get(self.expense_transaction_id) == "updated" and response.get('matched') == 2:
+                return True
+            self.log_test("Bulk Transactions Content", False, f"Unexpected result: {response}")
+        return False
+
     def test_delete_transaction(self):
         """Test deleting a transaction"""
         if not hasattr(self, 'income_transaction_id'):
@@ -298,6 +659,77 @@ class ExpenseTrackerAPITester:
         )
         return success
 
+    def test_metrics_endpoint(self):
+        """Test the Prometheus metrics endpoint served next to /api"""
+        metrics_url = self.base_url.rsplit("/api", 1)[0] + "/metrics"
+        try:
+            response = requests.get(metrics_url)
+            success = (
+                response.status_code == 200
+                and 'spendwise_http_requests_total{method="GET",route="/api/transactions"' in response.text
+                and 'spendwise_recurring_runs_total' in response.text
+            )
+            self.log_test("Metrics Endpoint", success, f"Status: {response.status_code}")
+            return success
+        except Exception as e:
+            self.log_test("Metrics Endpoint", False, f"Error: {str(e)}")
+            return False
+
+    def test_recurring_rules(self):
+        """Test creating, listing, updating and deleting a recurring rule"""
+        success, rule = self.run_test(
+            "Create Recurring Rule",
+            "POST",
+            "recurring",
+            200,
+            data={
+                "type": "expense",
+                "description": "Test rent",
+                "category": "Bills",
+                "amount": 500.0,
+                "every": 1,
+                "unit": "month",
+                "start_date": "2024-01-31"
+            }
+        )
+        if not success:
+            return False
+        if rule.get('next_date') != "2024-01-31":
+            self.log_test("Recurring Next Date", False, f"Expected 2024-01-31, got {rule.get('next_date')}")
+            return False
+        success_list, rules = self.run_test("List Recurring Rules", "GET", "recurring", 200)
+        if success_list and not any(item.get('id') == rule['id'] for item in rules):
+            self.log_test("Recurring Rule Listed", False, "Created rule missing from list")
+            return False
+        success_bad, _ = self.run_test(
+            "Recurring End Before Start",
+            "POST",
+            "recurring",
+            422,
+            data={
+                "type": "expense",
+                "description": "Bad rule",
+                "category": "Bills",
+                "amount": 1.0,
+                "every": 1,
+                "unit": "week",
+                "start_date": "2024-02-01",
+                "end_date": "2024-01-01"
+            }
+        )
+        success_update, updated = self.run_test(
+            "Update Recurring Rule",
+            "PUT",
+            f"recurring/{rule['id']}",
+            200,
+            data={"amount": 550.0}
+        )
+        if success_update and updated.get('amount') != 550.0:
+            self.log_test("Recurring Amount Updated", False, f"Expected 550.0, got {updated.get('amount')}")
+            return False
+        success_delete, _ = self.run_test("Delete Recurring Rule", "DELETE", f"recurring/{rule['id']}", 200)
+        return success_list and success_bad and success_update and success_delete
+
     def test_category_validation(self):
         """Test that all required categories are supported"""
         expense_categories = ["Food", "Transportation", "Entertainment", "Shopping", "Bills", "Healthcare", "Education", "Other"]
@@ -371,11 +803,27 @@ class ExpenseTrackerAPITester:
         self.test_get_all_transactions()
         self.test_filter_transactions_by_type()
         self.test_filter_transactions_by_category()
+        self.test_filter_transactions_by_range()
         self.test_update_transaction()
+        self.test_conditional_update()
         
         # Summary and stats tests
         self.test_get_summary()
         self.test_get_stats()
+        self.test_exact_amounts()
+        self.test_base_currency()
+        self.test_get_dashboard()
+        self.test_timeseries()
+        self.test_analytics()
+        self.test_conditional_get()
+        self.test_transaction_changes()
+        
+        # Import and export tests
+        self.test_import_transactions()
+        self.test_export_transactions()
+        self.test_search_transactions()
+        self.test_bulk_transactions()
+        self.test_recurring_rules()
         
         # Category validation
         self.test_category_validation()
@@ -383,6 +831,9 @@ class ExpenseTrackerAPITester:
         # Cleanup test
         self.test_delete_transaction()
         
+        # Observability
+        self.test_metrics_endpoint()
+        
         # Print results
         print("=" * 60)
         print(f"📊 Test Results: {self.tests_passed}/{self.tests_run} passed")
@@ -24,7 +24,9 @@ const INCOME_CATEGORIES = [
   "Other",
 ];
 
-export default function AddTransactionModal({ isOpen, onClose, onSubmit, editData }) {
+const SUGGEST_DELAY_MS = 150;
+
+export default function AddTransactionModal({ isOpen, onClose, onSubmit, editData, fetchSuggestions }) {
   const [formData, setFormData] = useState({
     type: "expense",
     date: new Date().toISOString().split('T')[0],
@@ -32,6 +34,8 @@ export default function AddTransactionModal({ isOpen, onClose, onSubmit, editDat
     category: "",
     amount: "",
   });
+  const [suggestions, setSuggestions] = useState([]);
+  const [showSuggestions, setShowSuggestions] = useState(false);
 
   useEffect(() => {
     if (editData) {
@@ -51,8 +55,34 @@ export default function AddTransactionModal({ isOpen, onClose, onSubmit, editDat
         amount: "",
       });
     }
+    setSuggestions([]);
+    setShowSuggestions(false);
   }, [editData, isOpen]);
 
+  // Debounced description typeahead; stale responses are dropped
+  useEffect(() => {
+    const prefix = formData.description.trim();
+    if (!isOpen || !fetchSuggestions || prefix.length < 2) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const results = await fetchSuggestions(prefix);
+        if (!cancelled) {
+          setSuggestions(results.filter((suggestion) => suggestion.value !== formData.description));
+        }
+      } catch (error) {
+        if (!cancelled) setSuggestions([]);
+      }
+    }, SUGGEST_DELAY_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [formData.description, isOpen]);
+
   const handleSubmit = (e) => {
     e.preventDefault();
     onSubmit({
@@ -63,6 +93,15 @@ export default function AddTransactionModal({ isOpen, onClose, onSubmit, editDat
 
   const categories = formData.type === "expense" ? EXPENSE_CATEGORIES : INCOME_CATEGORIES;
 
+  const applySuggestion = (suggestion) => {
+    // Reuse the category last used with this description if none is picked yet
+    const category = !formData.category && categories.includes(suggestion.category)
+      ? suggestion.category
+      : formData.category;
+    setFormData({ ...formData, description: suggestion.value, category });
+    setShowSuggestions(false);
+  };
+
   return (
     <Dialog open={isOpen} onOpenChange={onClose}>
       <DialogContent className="sm:max-w-md rounded-3xl" data-testid="add-transaction-modal" aria-describedby="transaction-form-description">
@@ -123,17 +162,46 @@ export default function AddTransactionModal({ isOpen, onClose, onSubmit, editDat
             </Select>
           </div>
 
-          <div className="space-y-2">
+          <div className="space-y-2 relative">
             <Label>Description</Label>
             <Input
               type="text"
               placeholder="E.g., Grocery shopping"
               value={formData.description}
-              onChange={(e) => setFormData({ ...formData, description: e.target.value })}
+              onChange={(e) => {
+                setFormData({ ...formData, description: e.target.value });
+                setShowSuggestions(true);
+              }}
+              onFocus={() => setShowSuggestions(true)}
+              onBlur={() => setShowSuggestions(false)}
+              autoComplete="off"
               required
               className="rounded-xl"
               data-testid="transaction-description-input"
             />
+            {showSuggestions && suggestions.length > 0 && (
+              <ul
+                className="absolute z-50 mt-1 w-full rounded-xl border bg-white shadow-lg overflow-hidden"
+                data-testid="transaction-description-suggestions"
+              >
+                {suggestions.map((suggestion) => (
+                  <li
+                    key={suggestion.value}
+                    // Keep focus in the input so onBlur does not hide the list before the click lands
+                    onMouseDown={(e) => {
+                      e.preventDefault();
+                      applySuggestion(suggestion);
+                    }}
+                    className="flex justify-between px-3 py-2 text-sm cursor-pointer hover:bg-indigo-50"
+                  >
+                    <span>{suggestion.value}</span>
+                    {suggestion.category && (
+                      <span className="text-gray-400">{suggestion.category}</span>
+                    )}
+                  </li>
+                ))}
+              </ul>
+            )}
           </div>
 
           <div className="space-y-2">
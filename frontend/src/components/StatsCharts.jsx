@@ -11,16 +11,52 @@ const COLORS = [
   "#48dbfb",
 ];
 
-export default function StatsCharts({ stats }) {
+export default function StatsCharts({ stats, timeseries }) {
   const hasExpenseData = stats.expense_by_category && stats.expense_by_category.length > 0;
   const hasIncomeData = stats.income_by_category && stats.income_by_category.length > 0;
+  // The server zero-fills every month, so the series lines up with its labels as-is
+  const monthlyData = timeseries
+    ? timeseries.starts.map((start, index) => ({
+        month: start.slice(0, 7),
+        income: timeseries.income[index],
+        expense: timeseries.expense[index],
+      }))
+    : [];
+  const hasMonthlyData = monthlyData.some((point) => point.income > 0 || point.expense > 0);
 
   if (!hasExpenseData && !hasIncomeData) {
     return null;
   }
 
+  const tooltipStyle = {
+    backgroundColor: 'rgba(255, 255, 255, 0.95)',
+    border: 'none',
+    borderRadius: '12px',
+    boxShadow: '0 4px 12px rgba(0, 0, 0, 0.1)',
+  };
+
   return (
     <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
+      {/* Monthly Income vs Expenses */}
+      {hasMonthlyData && (
+        <div className="glass-effect rounded-3xl p-6 shadow-xl lg:col-span-2" data-testid="monthly-trend-chart">
+          <h2 className="text-2xl font-bold text-gray-800 mb-6" style={{ fontFamily: 'Spectral, serif' }}>
+            Monthly Trend
+          </h2>
+          <ResponsiveContainer width="100%" height={300}>
+            <BarChart data={monthlyData}>
+              <CartesianGrid strokeDasharray="3 3" stroke="#e0e0e0" />
+              <XAxis dataKey="month" stroke="#666" style={{ fontSize: '12px' }} />
+              <YAxis stroke="#666" style={{ fontSize: '12px' }} />
+              <Tooltip formatter={(value) => `$${value.toFixed(2)}`} contentStyle={tooltipStyle} />
+              <Legend />
+              <Bar dataKey="income" name="Income" fill="#43e97b" radius={[8, 8, 0, 0]} />
+              <Bar dataKey="expense" name="Expenses" fill="#fa709a" radius={[8, 8, 0, 0]} />
+            </BarChart>
+          </ResponsiveContainer>
+        </div>
+      )}
+
       {/* Expense Distribution Pie Chart */}
       {hasExpenseData && (
         <div className="glass-effect rounded-3xl p-6 shadow-xl" data-testid="expense-chart">
@@ -10,12 +10,25 @@ import SummaryCards from "../components/SummaryCards";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const PAGE_SIZE = 50;
+const TREND_MONTHS = 12;
+
+// First day of the month TREND_MONTHS - 1 months ago, so the trend ends with this month
+const trendStart = () => {
+  const now = new Date();
+  const start = new Date(now.getFullYear(), now.getMonth() - (TREND_MONTHS - 1), 1);
+  return `${start.getFullYear()}-${String(start.getMonth() + 1).padStart(2, "0")}-01`;
+};
 
 export default function Dashboard({ onLogout }) {
   const [user, setUser] = useState(null);
   const [transactions, setTransactions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [syncToken, setSyncToken] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [summary, setSummary] = useState({ total_income: 0, total_expenses: 0, net_income: 0 });
   const [stats, setStats] = useState({ expense_by_category: [], income_by_category: [] });
+  const [timeseries, setTimeseries] = useState(null);
   const [loading, setLoading] = useState(true);
   const [isAddModalOpen, setIsAddModalOpen] = useState(false);
   const [editingTransaction, setEditingTransaction] = useState(null);
@@ -26,28 +39,129 @@ export default function Dashboard({ onLogout }) {
     headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
   });
 
+  const filterParams = () => ({
+    type: filterType || undefined,
+    category: filterCategory || undefined,
+  });
+
+  const fetchTransactionsPage = (cursor) =>
+    axios.get(`${API}/transactions`, {
+      ...getAuthHeader(),
+      params: { limit: PAGE_SIZE, cursor: cursor || undefined, ...filterParams() },
+    });
+
+  const handleRequestError = (error, message) => {
+    if (error.response?.status === 401) {
+      toast.error("Session expired. Please login again.");
+      onLogout();
+    } else {
+      toast.error(message);
+    }
+  };
+
+  const fetchTimeseries = () =>
+    axios.get(`${API}/transactions/timeseries`, {
+      ...getAuthHeader(),
+      params: { bucket: "month", from: trendStart() },
+    });
+
+  // One request returns the profile, first page, summary and stats
   const fetchData = async () => {
+    // The monthly trend is optional; the dashboard renders without it
+    fetchTimeseries()
+      .then((res) => setTimeseries(res.data))
+      .catch(() => setTimeseries(null));
     try {
-      const [userRes, transRes, summaryRes, statsRes] = await Promise.all([
-        axios.get(`${API}/auth/me`, getAuthHeader()),
-        axios.get(`${API}/transactions`, getAuthHeader()),
+      const res = await axios.get(`${API}/dashboard`, {
+        ...getAuthHeader(),
+        params: { limit: PAGE_SIZE, ...filterParams() },
+      });
+
+      setUser(res.data.user);
+      setTransactions(res.data.transactions.items);
+      setNextCursor(res.data.transactions.next_cursor);
+      setSummary(res.data.summary);
+      setStats(res.data.stats);
+      setSyncToken(res.data.sync_token);
+    } catch (error) {
+      handleRequestError(error, "Failed to load data");
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const fetchTransactions = async () => {
+    try {
+      const res = await fetchTransactionsPage();
+      setTransactions(res.data.items);
+      setNextCursor(res.data.next_cursor);
+    } catch (error) {
+      handleRequestError(error, "Failed to load transactions");
+    }
+  };
+
+  // Newest first, matching the server's (date, id) ordering
+  const compareTransactions = (a, b) =>
+    b.date.localeCompare(a.date) || b.id.localeCompare(a.id);
+
+  const matchesFilters = (t) =>
+    (!filterType || t.type === filterType) && (!filterCategory || t.category === filterCategory);
+
+  const applyChanges = (current, changes) => {
+    const changedIds = new Set([...changes.deletes, ...changes.upserts.map((t) => t.id)]);
+    const oldest = current[current.length - 1];
+    // Rows older than the loaded window arrive with the next page instead
+    const upserts = changes.upserts.filter(
+      (t) => matchesFilters(t) && (!nextCursor || !oldest || compareTransactions(t, oldest) <= 0)
+    );
+    return [...current.filter((t) => !changedIds.has(t.id)), ...upserts].sort(compareTransactions);
+  };
+
+  // After a local edit, pull only what changed instead of reloading the list
+  const syncChanges = async () => {
+    try {
+      const totalsRequest = Promise.all([
         axios.get(`${API}/transactions/summary`, getAuthHeader()),
         axios.get(`${API}/transactions/stats`, getAuthHeader()),
+        fetchTimeseries(),
       ]);
 
-      setUser(userRes.data);
-      setTransactions(transRes.data);
+      let token = syncToken;
+      let changes;
+      do {
+        const res = await axios.get(`${API}/transactions/changes`, {
+          ...getAuthHeader(),
+          params: { since: token || undefined },
+        });
+        changes = res.data;
+        if (changes.reset) {
+          await fetchData();
+          return;
+        }
+        setTransactions((current) => applyChanges(current, changes));
+        token = changes.sync_token;
+      } while (changes.has_more);
+      setSyncToken(token);
+
+      const [summaryRes, statsRes, timeseriesRes] = await totalsRequest;
       setSummary(summaryRes.data);
       setStats(statsRes.data);
+      setTimeseries(timeseriesRes.data);
     } catch (error) {
-      if (error.response?.status === 401) {
-        toast.error("Session expired. Please login again.");
-        onLogout();
-      } else {
-        toast.error("Failed to load data");
-      }
+      handleRequestError(error, "Failed to refresh data");
+    }
+  };
+
+  const loadMoreTransactions = async () => {
+    setLoadingMore(true);
+    try {
+      const res = await fetchTransactionsPage(nextCursor);
+      setTransactions((current) => [...current, ...res.data.items]);
+      setNextCursor(res.data.next_cursor);
+    } catch (error) {
+      handleRequestError(error, "Failed to load transactions");
     } finally {
-      setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -55,14 +169,20 @@ export default function Dashboard({ onLogout }) {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    if (!loading) {
+      fetchTransactions();
+    }
+  }, [filterType, filterCategory]);
+
   const handleAddTransaction = async (data) => {
     try {
       if (editingTransaction) {
-        await axios.put(
-          `${API}/transactions/${editingTransaction.id}`,
-          data,
-          getAuthHeader()
-        );
+        // Only apply the edit if nobody changed the transaction since it was loaded
+        const auth = getAuthHeader();
+        await axios.put(`${API}/transactions/${editingTransaction.id}`, data, {
+          headers: { ...auth.headers, "If-Match": `"${editingTransaction.revision}"` },
+        });
         toast.success("Transaction updated!");
       } else {
         await axios.post(`${API}/transactions`, data, getAuthHeader());
@@ -70,17 +190,32 @@ export default function Dashboard({ onLogout }) {
       }
       setIsAddModalOpen(false);
       setEditingTransaction(null);
-      fetchData();
+      syncChanges();
     } catch (error) {
+      if (error.response?.status === 412) {
+        toast.error("This transaction was changed elsewhere. Reloaded the latest version.");
+        setIsAddModalOpen(false);
+        setEditingTransaction(null);
+        syncChanges();
+        return;
+      }
       toast.error("Failed to save transaction");
     }
   };
 
+  const fetchDescriptionSuggestions = async (prefix) => {
+    const response = await axios.get(`${API}/transactions/suggest`, {
+      ...getAuthHeader(),
+      params: { prefix },
+    });
+    return response.data;
+  };
+
   const handleDeleteTransaction = async (id) => {
     try {
       await axios.delete(`${API}/transactions/${id}`, getAuthHeader());
       toast.success("Transaction deleted!");
-      fetchData();
+      syncChanges();
     } catch (error) {
       toast.error("Failed to delete transaction");
     }
@@ -91,13 +226,12 @@ export default function Dashboard({ onLogout }) {
     setIsAddModalOpen(true);
   };
 
-  const filteredTransactions = transactions.filter((t) => {
-    if (filterType && t.type !== filterType) return false;
-    if (filterCategory && t.category !== filterCategory) return false;
-    return true;
-  });
-
-  const allCategories = [...new Set(transactions.map((t) => t.category))];
+  // Filtering happens on the server; categories come from the full-history stats
+  const allCategories = [
+    ...new Set(
+      [...stats.expense_by_category, ...stats.income_by_category].map((s) => s.category)
+    ),
+  ];
 
   if (loading) {
     return (
@@ -161,7 +295,7 @@ export default function Dashboard({ onLogout }) {
           <SummaryCards summary={summary} />
 
           {/* Charts Section */}
-          <StatsCharts stats={stats} />
+          <StatsCharts stats={stats} timeseries={timeseries} />
 
           {/* Transactions List */}
           <div className="glass-effect rounded-3xl p-6 shadow-xl">
@@ -196,10 +330,23 @@ export default function Dashboard({ onLogout }) {
               </div>
             </div>
             <TransactionList
-              transactions={filteredTransactions}
+              transactions={transactions}
               onEdit={handleEditTransaction}
               onDelete={handleDeleteTransaction}
             />
+            {nextCursor && (
+              <div className="flex justify-center mt-6">
+                <Button
+                  onClick={loadMoreTransactions}
+                  disabled={loadingMore}
+                  variant="outline"
+                  className="rounded-xl border-gray-300"
+                  data-testid="load-more-button"
+                >
+                  {loadingMore ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            )}
           </div>
         </main>
       </div>
@@ -213,6 +360,7 @@ export default function Dashboard({ onLogout }) {
         }}
         onSubmit={handleAddTransaction}
         editData={editingTransaction}
+        fetchSuggestions={fetchDescriptionSuggestions}
       />
     </div>
   );
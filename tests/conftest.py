@@ -0,0 +1,30 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# The app builds its storage and hasher at import; keep both in-process and fast
+os.environ["STORAGE_ENGINE"] = "memory"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+
+@pytest.fixture(scope="session")
+def api():
+    from fastapi.testclient import TestClient
+
+    import server
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def auth(api):
+    """Headers for a newly registered user."""
+    response = api.post("/api/auth/register", json={"email": f"{uuid.uuid4().hex}@example.com", "password": "pw"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,82 @@
+import server
+
+
+def create(api, auth, description):
+    response = api.post("/api/transactions", headers=auth, json={
+        "type": "expense", "date": "2024-03-01", "description": description, "category": "Food", "amount": 1.5,
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def changes(api, auth, since=None, limit=None):
+    params = {key: value for key, value in (("since", since), ("limit", limit)) if value is not None}
+    response = api.get("/api/transactions/changes", headers=auth, params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def user_id(api, auth):
+    return api.get("/api/auth/me", headers=auth).json()["id"]
+
+
+def test_paged_round_trip(api, auth):
+    token = changes(api, auth)["sync_token"]
+    ids = [create(api, auth, f"Lunch {i}") for i in range(5)]
+    api.delete(f"/api/transactions/{ids[1]}", headers=auth)
+    api.put(f"/api/transactions/{ids[2]}", headers=auth, json={"amount": 2.5})
+
+    upserts, deletes, pages = {}, set(), 0
+    while True:
+        page = changes(api, auth, since=token, limit=2)
+        assert not page["reset"]
+        upserts.update((trans["id"], trans) for trans in page["upserts"])
+        deletes.update(page["deletes"])
+        token = page["sync_token"]
+        pages += 1
+        if not page["has_more"]:
+            break
+
+    assert pages > 1
+    assert set(upserts) == {ids[0], ids[2], ids[3], ids[4]}
+    assert upserts[ids[2]]["amount"] == 2.5
+    assert deletes == {ids[1]}
+    # Caught up: the same token comes back with nothing new
+    page = changes(api, auth, since=token)
+    assert (page["sync_token"], page["upserts"], page["deletes"], page["reset"]) == (token, [], [], False)
+
+
+def test_trimmed_log_resets(api, auth):
+    token = changes(api, auth)["sync_token"]
+    create(api, auth, "Coffee")
+    create(api, auth, "Tea")
+    # Retention dropped the oldest entry the token still needs
+    del server.storage._changes[user_id(api, auth)][0]
+
+    page = changes(api, auth, since=token)
+    assert page["reset"]
+    assert page["upserts"] == []
+    # The fresh token resumes cleanly
+    assert not changes(api, auth, since=page["sync_token"])["reset"]
+
+
+def test_token_ahead_of_data_version_resets(api, auth):
+    create(api, auth, "Coffee")
+    page = changes(api, auth, since=server.encode_sync_token(99))
+    assert page["reset"]
+    assert page["upserts"] == []
+
+
+def test_version_bump_without_transactions_does_not_reset(api, auth):
+    token = changes(api, auth, since=changes(api, auth)["sync_token"])["sync_token"]
+    base_currency = api.get("/api/auth/me", headers=auth).json()["base_currency"]
+    assert api.put("/api/auth/me", headers=auth, json={"base_currency": base_currency}).status_code == 200
+
+    page = changes(api, auth, since=token)
+    assert not page["reset"]
+    assert (page["upserts"], page["deletes"]) == ([], [])
+
+    created = create(api, auth, "Dinner")
+    page = changes(api, auth, since=page["sync_token"])
+    assert not page["reset"]
+    assert [trans["id"] for trans in page["upserts"]] == [created]
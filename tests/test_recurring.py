@@ -0,0 +1,83 @@
+import asyncio
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import recurring  # noqa: E402
+import rollups  # noqa: E402
+from storage.memory import MemoryStorage  # noqa: E402
+
+USER_ID = "user-1"
+TODAY = date(2024, 5, 15)
+
+
+def monthly_rule():
+    return {
+        "id": "rule-1",
+        "user_id": USER_ID,
+        "type": "expense",
+        "description": "Rent",
+        "category": "Bills",
+        "amount": 1200.0,
+        "currency": "USD",
+        "every": 1,
+        "unit": "month",
+        "start_date": "2024-01-31",
+        "end_date": None,
+        "next_date": "2024-01-31",
+        "occurrences": 0,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+class Interrupted(Exception):
+    pass
+
+
+async def stop(*args, **kwargs):
+    raise Interrupted()
+
+
+async def materialise_twice(storage, scheduler, monkeypatch, target, name):
+    """Run the scheduler once with ``target.name`` stopping it, then again normally."""
+    await storage.insert_user({"id": USER_ID, "email": "user@example.com"})
+    await rollups.create(storage, USER_ID)
+    await storage.insert_rule(monthly_rule())
+    with monkeypatch.context() as patch:
+        patch.setattr(target, name, stop)
+        try:
+            await scheduler.run_once(TODAY)
+        except Interrupted:
+            pass
+    return await scheduler.run_once(TODAY)
+
+
+def check_reconciled(storage, scheduler, created):
+    assert created == 0
+    assert scheduler.occurrences_skipped == 4
+    rules = asyncio.run(storage.list_rules(USER_ID))
+    assert [(rule['next_date'], rule['occurrences']) for rule in rules] == [("2024-05-31", 4)]
+    stored = asyncio.run(storage.get_rollup(USER_ID))
+    computed = asyncio.run(rollups.compute(storage, USER_ID))
+    assert rollups.drift(stored, computed) == []
+    assert rollups.totals(stored)["expense"] == 4800.0
+    changes = asyncio.run(storage.list_changes(USER_ID, 0, "", 100))
+    ids = {recurring.occurrence_id("rule-1", date.fromisoformat(d))
+           for d in ("2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30")}
+    assert ids <= {change['transaction_id'] for change in changes}
+
+
+def test_interrupted_before_recording(monkeypatch):
+    storage = MemoryStorage()
+    scheduler = recurring.Scheduler(storage)
+    created = asyncio.run(materialise_twice(storage, scheduler, monkeypatch, scheduler, "_record"))
+    check_reconciled(storage, scheduler, created)
+
+
+def test_interrupted_before_advancing(monkeypatch):
+    storage = MemoryStorage()
+    scheduler = recurring.Scheduler(storage)
+    created = asyncio.run(materialise_twice(storage, scheduler, monkeypatch, storage, "advance_rules"))
+    check_reconciled(storage, scheduler, created)
@@ -0,0 +1,174 @@
+"""The same calls against each in-process engine must give the same results."""
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from money import to_micros  # noqa: E402
+from storage import RevisionConflictError, TransactionFilter, create_storage  # noqa: E402
+
+USER_ID = "user-1"
+OTHER_ID = "user-2"
+
+ROWS = [
+    # id, type, date, description, category, amount, currency
+    ("t01", "expense", "2024-01-05", "Taxi to airport", "Travel", 42.0, "USD"),
+    ("t02", "expense", "2024-01-05", "Coffee beans", "Food", 9.5, "USD"),
+    ("t03", "income", "2024-01-31", "January salary", "Salary", 3000.0, "USD"),
+    ("t04", "expense", "2024-02-01", "Airport parking", "Travel", 25.0, "EUR"),
+    ("t05", "expense", "2024-02-01", "Groceries", "Food", 61.25, "USD"),
+    ("t06", "expense", "2024-02-01", "Taxi rides home", "Travel", 18.0, "USD"),
+    ("t07", "expense", "2024-02-14", "Dinner", "Food", 25.0, "EUR"),
+    ("t08", "income", "2024-02-29", "February salary", "Salary", 3000.0, "USD"),
+    ("t09", "expense", "2024-03-01", "Coffee", "Food", 3.75, "USD"),
+    ("t10", "expense", "2024-03-10", "Taxi downtown", "Travel", 15.0, "EUR"),
+    ("t11", "income", "2024-03-15", "Refund", "Other", 9.5, "USD"),
+]
+
+
+def transaction(user_id, id, type, date, description, category, amount, currency):
+    return {
+        "id": id,
+        "user_id": user_id,
+        "type": type,
+        "date": date,
+        "description": description,
+        "category": category,
+        "amount": amount,
+        "currency": currency,
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "revision": 1,
+    }
+
+
+SEED = [transaction(USER_ID, *row) for row in ROWS]
+# Another user's rows share dates, words and ids' shape, and must never leak in
+OTHER = [transaction(OTHER_ID, "x" + id, *rest) for id, *rest in ROWS[5:9]]
+
+
+def expected(filter):
+    return sorted((t for t in SEED if filter.matches(t)), key=lambda t: (t['date'], t['id']), reverse=True)
+
+
+async def all_pages(storage, filter, page_size):
+    rows, after = [], None
+    while True:
+        page = await storage.find_transactions(filter, page_size, after)
+        rows += page
+        if len(page) < page_size:
+            return rows
+        after = (page[-1]['date'], page[-1]['id'])
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    storage = create_storage(request.param, path=tmp_path / "expenses.db")
+
+    async def setup():
+        await storage.connect()
+        for user_id in (USER_ID, OTHER_ID):
+            await storage.insert_user({
+                "id": user_id, "email": f"{user_id}@example.com", "password_hash": "x",
+                "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+            })
+        assert await storage.insert_transactions([dict(t) for t in SEED + OTHER]) == []
+
+    asyncio.run(setup())
+    yield storage
+    asyncio.run(storage.close())
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 4, 100])
+def test_keyset_paging(storage, page_size):
+    filter = TransactionFilter(USER_ID)
+    assert asyncio.run(all_pages(storage, filter, page_size)) == expected(filter)
+
+
+@pytest.mark.parametrize("filter", [
+    TransactionFilter(USER_ID, min_amount=9.5, max_amount=25.0),
+    TransactionFilter(USER_ID, min_amount=3000.0),
+    TransactionFilter(USER_ID, max_amount=9.5),
+    TransactionFilter(USER_ID, categories=("Food", "Travel")),
+    TransactionFilter(USER_ID, categories=("Travel",), min_amount=18.0),
+    TransactionFilter(USER_ID, date_from="2024-02-01", date_to="2024-02-29"),
+    TransactionFilter(USER_ID, date_from="2024-03-01"),
+    TransactionFilter(USER_ID, date_to="2024-01-05"),
+    TransactionFilter(USER_ID, types=("income",), date_from="2024-02-01"),
+    TransactionFilter(USER_ID, categories=("Food",), currencies=("EUR",), date_to="2024-02-14", min_amount=25.0),
+], ids=repr)
+def test_filter_bounds(storage, filter):
+    rows = expected(filter)
+    assert rows, "every case should match something"
+    assert asyncio.run(all_pages(storage, filter, 2)) == rows
+
+
+def test_update_revision_conflict(storage):
+    with pytest.raises(RevisionConflictError) as conflict:
+        asyncio.run(storage.update_transaction(USER_ID, "t05", {"amount": 70.0}, expected_revision=2))
+    assert conflict.value.current == 1
+    assert asyncio.run(storage.get_transactions(USER_ID, ["t05"])) == [SEED[4]]
+
+    before, after = asyncio.run(storage.update_transaction(USER_ID, "t05", {"amount": 70.0}, expected_revision=1))
+    assert before == SEED[4]
+    assert after == {**SEED[4], "amount": 70.0, "revision": 2}
+    assert asyncio.run(storage.get_transactions(USER_ID, ["t05"])) == [after]
+    # Someone else's transaction looks the same as a missing one
+    assert asyncio.run(storage.update_transaction(USER_ID, "xt06", {"amount": 1.0}, expected_revision=1)) is None
+
+
+def test_bulk_write(storage):
+    updates = {
+        "t02": {"category": "Groceries", "amount": 10.0},
+        "t03": {"type": "expense", "description": "Salary advance"},
+        "xt07": {"amount": 1.0},
+        "missing": {"amount": 1.0},
+    }
+    outcome = asyncio.run(storage.bulk_write(USER_ID, updates, ["t09", "xt08", "missing"]))
+    assert outcome.before == {t['id']: t for t in SEED if t['id'] in ("t02", "t03", "t09")}
+    assert not outcome.conflicts
+
+    rows = {t['id']: t for t in asyncio.run(storage.find_transactions(TransactionFilter(USER_ID), 100))}
+    assert set(rows) == {t['id'] for t in SEED} - {"t09"}
+    assert rows["t02"] == {**SEED[1], "category": "Groceries", "amount": 10.0, "revision": 2}
+    assert rows["t03"] == {**SEED[2], "type": "expense", "description": "Salary advance", "revision": 2}
+    untouched = sorted(OTHER, key=lambda t: (t['date'], t['id']), reverse=True)
+    assert asyncio.run(storage.find_transactions(TransactionFilter(OTHER_ID), 100)) == untouched
+
+
+@pytest.mark.parametrize("terms, ids", [
+    # Both words beat either one; of the single matches, the rarer word counts more.
+    # SQLite also weighs by description length, and counts words over every user's rows,
+    # so t04 and t10 are the same length and no other user has "airport"
+    (["taxi", "airport"], ["t01", "t04", "t10", "t06"]),
+    # Stemmed, and ties are newest first
+    (["rides"], ["t06"]),
+    (["salary"], ["t08", "t03"]),
+    (["coffee", "beans"], ["t02", "t09"]),
+    (["nothing"], []),
+])
+def test_search_ranking(storage, terms, ids):
+    rows = asyncio.run(storage.search_transactions(USER_ID, terms, 10))
+    assert [t['id'] for t in rows] == ids
+    scores = [t['score'] for t in rows]
+    assert scores == sorted(scores, reverse=True)
+    assert [t['id'] for t in asyncio.run(storage.search_transactions(USER_ID, terms, 2, offset=1))] == ids[1:3]
+
+
+@pytest.mark.parametrize("filter", [
+    TransactionFilter(USER_ID),
+    TransactionFilter(USER_ID, categories=("Food", "Salary"), date_to="2024-02-29"),
+    TransactionFilter(USER_ID, currencies=("EUR",)),
+], ids=repr)
+def test_aggregate_rollup(storage, filter):
+    categories = {"income": defaultdict(dict), "expense": defaultdict(dict)}
+    for t in expected(filter):
+        bucket = categories[t['type']][t['category']].setdefault(t['currency'], {"total_micros": 0, "count": 0})
+        bucket['total_micros'] += to_micros(t['amount'])
+        bucket['count'] += 1
+    rollup = asyncio.run(storage.aggregate_rollup(filter))
+    assert rollup['categories'] == {type: dict(buckets) for type, buckets in categories.items()}